@@ -0,0 +1,59 @@
+from lib import seaf_drawio
+from lib.pattern_bundle import compile_bundle, save_bundle, DEFAULT_PATTERN_BUNDLE
+import os
+import sys
+import argparse
+
+patterns_dir = 'data/patterns/'
+
+# Переменные по умолчанию
+DEFAULT_CONFIG = {
+    "seaf2drawio": {
+        "pattern_bundle": DEFAULT_PATTERN_BUNDLE
+    }
+}
+d = seaf_drawio.SeafDrawio(DEFAULT_CONFIG)
+
+
+def cli_vars(config):
+    parser = argparse.ArgumentParser(
+        description="Проверка и компиляция паттернов data/patterns/*.yaml в пакет для seaf2drawio.py.")
+    parser.add_argument("files", nargs="*", help="файлы паттернов (по умолчанию все .yaml из data/patterns/)")
+    parser.add_argument("-o", "--output", type=str, help="путь к пакету паттернов")
+    parser.add_argument("--check", action="store_true", help="только проверить паттерны, не записывая пакет")
+    args = parser.parse_args()
+    if args.output:
+        config['pattern_bundle'] = args.output
+    return args
+
+
+def main():
+    conf = d.load_config("config.yaml")['seaf2drawio']
+    args = cli_vars(conf)
+    files = args.files or [os.path.join(patterns_dir, name) for name in sorted(os.listdir(patterns_dir))
+                           if name.endswith(('.yaml', '.yml'))]
+
+    bundle, errors = compile_bundle(files, d.read_yaml_file)
+    if errors:
+        print(f"Ошибки в паттернах ({len(errors)}):")
+        for error in errors:
+            print(f"  - {error}")
+        sys.exit(1)
+
+    patterns = sum(len(entry['specs']) for entry in bundle['files'].values())
+    fragments = sum(len(entry['fragments']) for entry in bundle['files'].values())
+    if args.check:
+        print(f"> Паттерны корректны: файлов {len(files)}, паттернов {patterns}, шаблонов XML {fragments}")
+        return
+    save_bundle(conf['pattern_bundle'], bundle)
+    print(f"> Пакет паттернов {conf['pattern_bundle']}: файлов {len(files)}, паттернов {patterns}, "
+          f"шаблонов XML {fragments}")
+
+
+if __name__ == '__main__':
+
+    if sys.version_info < (3, 9):
+        print("Этот скрипт требует Python версии 3.9 или выше.")
+        sys.exit(1)
+
+    main()
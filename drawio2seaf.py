@@ -7,7 +7,10 @@ DEFAULT_CONFIG = {
     "drawio2seaf": {
         "drawio_file": "result/Sample_graph.drawio",
         "schema_file" : 'data/seaf_schema.yaml',
-        "output_file": "result/seaf.yaml"
+        "output_file": "result/seaf.yaml",
+        "parse_cache": True,
+        "parse_cache_dir": ".cache/seaf2drawio",
+        "parse_cache_max_mb": 256
     }
 }
 d = seaf_drawio.SeafDrawio(DEFAULT_CONFIG)
@@ -49,6 +52,7 @@ if __name__ == '__main__':
         sys.exit(1)
 
     conf = __cli_vars(d.load_config("config.yaml")['drawio2seaf'])
+    d.configure_parse_cache(conf)
     network_connections = d.get_network_connections(conf['drawio_file'], '100')
     objects_data = d.get_data_from_diagram(conf['drawio_file'])
     json_schemas = d.get_json_schemas(conf['schema_file'])
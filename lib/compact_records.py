@@ -0,0 +1,131 @@
+import sys
+from collections.abc import Mapping
+
+
+class RecordLayout:
+    """
+    Общая для записей последовательность полей: кортеж имён и их позиции.
+    Записи с одинаковым набором и порядком полей ссылаются на один экземпляр.
+    """
+
+    __slots__ = ('keys', 'positions')
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.positions = {key: position for position, key in enumerate(keys)}
+
+
+class CompactRecord(Mapping):
+    """
+    Неизменяемая запись объекта SEAF: ссылка на общий RecordLayout и кортеж значений.
+
+    Занимает заметно меньше памяти, чем dict, и поддерживает тот же интерфейс чтения (Mapping).
+    Порядок полей совпадает с порядком в исходном YAML. Вложенные значения (списки, словари)
+    хранятся как есть и не должны изменяться.
+    """
+
+    __slots__ = ('_layout', '_values')
+
+    def __init__(self, layout, values):
+        self._layout = layout
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._layout.positions[key]]
+
+    def get(self, key, default=None):
+        position = self._layout.positions.get(key)
+        return default if position is None else self._values[position]
+
+    def __contains__(self, key):
+        return key in self._layout.positions
+
+    def __iter__(self):
+        return iter(self._layout.keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self.items())!r})'
+
+    def __reduce__(self):
+        return _rebuild_record, (self._layout.keys, self._values)
+
+    def to_dict(self):
+        """Возвращает изменяемую копию верхнего уровня записи."""
+        return dict(zip(self._layout.keys, self._values))
+
+
+def _rebuild_record(keys, values):
+    return CompactRecord(RecordLayout(keys), values)
+
+
+class RecordCompactor:
+    """
+    Преобразует словари записей {OID: dict} в CompactRecord.
+
+    Имена полей интернируются, а раскладки (RecordLayout) переиспользуются между записями и схемами;
+    раскладки заранее заполняются порядком полей из схем SEAF (data/seaf_schema.yaml).
+    Короткие строковые значения верхнего уровня (тип, зона, ссылки на OID) также интернируются.
+    """
+
+    INTERN_MAX_LEN = 128
+
+    def __init__(self, schema_fields=None):
+        """
+        :param schema_fields: dict {schema: [field, ...]} - порядок полей из описания схем SEAF.
+        """
+        self._layouts = {}
+        for fields in (schema_fields or {}).values():
+            self.layout_for(tuple(fields))
+
+    def layout_for(self, keys):
+        layout = self._layouts.get(keys)
+        if layout is None:
+            keys = tuple(sys.intern(key) if isinstance(key, str) else key for key in keys)
+            layout = RecordLayout(keys)
+            self._layouts[keys] = layout
+        return layout
+
+    def compact(self, record):
+        """Возвращает CompactRecord для dict; другие значения возвращаются без изменений."""
+        if not isinstance(record, dict):
+            return record
+        layout = self.layout_for(tuple(record))
+        values = tuple(
+            sys.intern(value) if isinstance(value, str) and len(value) <= self.INTERN_MAX_LEN else value
+            for value in record.values()
+        )
+        return CompactRecord(layout, values)
+
+    def compact_objects(self, objects):
+        """
+        Заменяет записи схемы {OID: dict} на CompactRecord на месте.
+
+        :param objects: значение схемы из объединённых данных.
+        :return: тот же объект objects.
+        """
+        if isinstance(objects, dict):
+            for oid, record in objects.items():
+                objects[oid] = self.compact(record)
+        return objects
+
+    def compact_store(self, data):
+        """Преобразует все схемы объединённого хранилища {schema: {OID: dict}} на месте."""
+        if isinstance(data, dict):
+            for objects in data.values():
+                self.compact_objects(objects)
+        return data
+
+    @property
+    def layouts(self):
+        return len(self._layouts)
+
+
+def thaw_objects(objects):
+    """Возвращает {OID: record}, где CompactRecord заменены на dict (вложенные значения не копируются)."""
+    if not isinstance(objects, dict):
+        return objects
+    return {oid: record.to_dict() if isinstance(record, CompactRecord) else record
+            for oid, record in objects.items()}
@@ -0,0 +1,108 @@
+from collections.abc import Mapping
+
+
+def parse_type_filter(value):
+    """
+    Разбирает поле type паттерна так же, как SeafDrawio.get_object(type=...).
+
+    :param value: 'значение' или 'поле:значение'.
+    :return: tuple (поле, значение).
+    """
+    if value.find(':') != -1:
+        field, expected = value.split(':')
+        return field, expected
+    return 'type', value
+
+
+def build_dispatch_table(specs):
+    """
+    Таблица распределения паттернов файла по схемам и значениям поля type (не зависит от данных).
+
+    :param specs: dict {name: PatternSpec} - паттерны файла в порядке файла.
+    :return: dict {schema: (names, untyped, typed)}: names - паттерны схемы в порядке файла, untyped - паттерны
+             без type, typed - {поле: {значение: [names]}}.
+    """
+    table = {}
+    for name, spec in specs.items():
+        if not (isinstance(spec, Mapping) and spec.get('schema')):
+            continue
+        names, untyped, typed = table.setdefault(spec['schema'], ([], [], {}))
+        names.append(name)
+        if spec.get('type'):
+            field, expected = parse_type_filter(spec['type'])
+            typed.setdefault(field, {}).setdefault(expected, []).append(name)
+        else:
+            untyped.append(name)
+    return table
+
+
+class PatternDispatch:
+    """
+    Распределение записей данных по паттернам одного файла data/patterns/*.yaml.
+
+    Паттерны группируются по схеме, записи каждой схемы перебираются один раз: запись направляется
+    во все паттерны схемы, у которых совпадает поле type (паттерн без type получает все записи схемы).
+    Затем выборка паттерна сортируется по parent_id и проходит фильтры паттерна, поэтому objects[name]
+    совпадает с get_object(type=..., sort=...) + apply_pattern_filters() и порядок отрисовки не меняется.
+
+    Группировка паттернов по схемам и type берётся из build_dispatch_table() (или из пакета паттернов).
+    Распределение не зависит от страницы и строится один раз на файл паттернов за сборку.
+    claims хранит для каждого OID паттерны, отобравшие запись, в порядке паттернов: объект рисует первый
+    из них, родитель которого есть на странице, остальные только обновляют данные узла.
+    """
+
+    __slots__ = ('objects', 'claims')
+
+    def __init__(self, specs, d, data_file, select, table=None):
+        """
+        :param specs: dict {name: PatternSpec} - паттерны файла в порядке файла.
+        :param d: SeafDrawio (доступ к данным, поиск значений полей, сортировка).
+        :param data_file: путь или список путей к данным SEAF.
+        :param select: callable(pattern, objects) -> objects - фильтры паттерна (apply_pattern_filters).
+        :param table: таблица build_dispatch_table(specs), если уже построена (пакет паттернов).
+        """
+        self.objects = {}
+        self.claims = {}
+
+        if table is None:
+            table = build_dispatch_table(specs)
+        for schema, (names, untyped, typed) in table.items():
+            routed = self._route(schema, names, untyped, typed, d, data_file)
+            for name in names:
+                spec = specs[name]
+                objects = routed[name]
+                if spec.get('type') and spec.get('parent_id'):
+                    objects = d.sort_objects(objects, schema, spec['parent_id'])
+                self.objects[name] = select(spec, objects)
+
+        for name, spec in specs.items():
+            for oid in self.objects.get(name, ()):
+                self.claims.setdefault(oid, []).append(name)
+
+    @staticmethod
+    def _route(schema, names, untyped, typed, d, data_file):
+        """Один проход по записям схемы: {name: {OID: record}} в порядке записей схемы."""
+        routed = {name: {} for name in names}
+        source = d.get_object(data_file, schema, readonly=True)
+        if not isinstance(source, Mapping):
+            return routed
+        for oid, record in source.items():
+            for name in untyped:
+                routed[name][oid] = record
+            for field, by_value in typed.items():
+                values = d.find_key_value(record, field)
+                if not values:
+                    continue
+                try:
+                    names = by_value.get(values[0], ())
+                except TypeError:
+                    # Нехэшируемое значение (список/словарь) не совпадает со строкой фильтра
+                    continue
+                for name in names:
+                    routed[name][oid] = record
+        return routed
+
+    def claimed_by(self, oid):
+        """Первый паттерн, отобравший запись OID, или None."""
+        names = self.claims.get(oid)
+        return names[0] if names else None
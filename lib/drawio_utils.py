@@ -1,5 +1,10 @@
 import xml.etree.ElementTree as ET
-from typing import Optional, Any, Union
+import xml.sax.saxutils as saxutils
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Optional, Any, Union, Dict
+
+XML_ATTR_ENTITIES = {'"': "&quot;", "'": "&apos;"}
 
 # Utility functions for XML manipulation (DrawIO specific)
 
@@ -60,3 +65,91 @@ def update_geometry(cell: ET.Element, **kwargs: float) -> None:
         return
     for k, v in kwargs.items():
         geom.set(k, format_number(v))
+
+@lru_cache(maxsize=65536)
+def escape_attr(text: str) -> str:
+    """
+    Escape text for an XML attribute value (&, <, >, quotes).
+    Results are cached: types, zones, OIDs and titles repeat across objects, fragments and pages.
+    """
+    return saxutils.escape(text, XML_ATTR_ENTITIES)
+
+def escape_value(value: Any) -> str:
+    """Escape a record value for a pattern placeholder: None becomes an empty string."""
+    return escape_attr(value if isinstance(value, str) else str(value)) if value is not None else ''
+
+class EscapedRecord(Mapping):
+    """
+    Read-only view of a record for filling pattern placeholders.
+
+    Values are escaped on access, so only the fields referenced by a template are escaped.
+    The view reads the record and the overrides dict live (overrides is not copied): one view serves
+    all fragments of an object, and values changed between fragments are seen by the next fragment.
+    Keys from overrides (already escaped) take precedence over record fields. Optional fields
+    read as an empty string when missing or empty.
+    """
+
+    __slots__ = ('_record', '_overrides', '_optional')
+
+    def __init__(self, record: Mapping, overrides: Optional[Dict[str, str]] = None, optional: tuple = ()):
+        self._record = record
+        self._overrides = overrides if overrides is not None else {}
+        self._optional = optional
+
+    def __getitem__(self, key: str) -> str:
+        if key in self._overrides:
+            return self._overrides[key]
+        if key in self._optional:
+            return escape_attr(str(self._record.get(key) or ''))
+        return escape_value(self._record[key])
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._overrides or key in self._optional or key in self._record
+
+    def __iter__(self):
+        yield from self._overrides
+        for key in self._record:
+            if key not in self._overrides:
+                yield key
+        for key in self._optional:
+            if key not in self._overrides and key not in self._record:
+                yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class LayerRegistry:
+    """
+    Реестр слоёв страниц: id -> mxCell для каждого <root> страницы.
+
+    Реестр страницы заполняется один раз из непосредственных потомков <root> (слои шаблона и уже созданные
+    слои), после чего проверка и создание слоя не просматривают страницу. Реестр привязан к объекту <root>:
+    если страница заменена (например, результатом процесса пула), он строится заново.
+    """
+
+    def __init__(self):
+        self._pages: Dict[int, tuple] = {}
+
+    def layers(self, root: ET.Element) -> Dict[str, ET.Element]:
+        entry = self._pages.get(id(root))
+        if entry is None or entry[0] is not root:
+            entry = (root, {cell.get('id'): cell for cell in root.findall('mxCell') if cell.get('id')})
+            self._pages[id(root)] = entry
+        return entry[1]
+
+    def ensure(self, root: ET.Element, layer_id: str, label: str) -> bool:
+        """
+        Добавляет в root скрытый слой layer_id, если его нет.
+        :return: True, если слой создан.
+        """
+        layers = self.layers(root)
+        if layer_id in layers:
+            return False
+        layer = ET.Element('mxCell', {'id': layer_id, 'value': label, 'parent': '0', 'visible': '0'})
+        root.append(layer)
+        layers[layer_id] = layer
+        return True
+
+    def clear(self) -> None:
+        self._pages.clear()
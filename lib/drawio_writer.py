@@ -0,0 +1,514 @@
+import hashlib
+import os
+import re
+import string
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+# Native DrawIO writer: builds object/mxCell/mxGeometry elements directly from compiled templates
+# instead of formatting an XML string and parsing it back for every node and link.
+# Supports the subset of N2G drawio_diagram API used by seaf2drawio.py and produces the same XML.
+
+_FORMATTER = string.Formatter()
+_ATTR_SPECIAL = ('&', '<', '"', '\t', '\n', '\r')
+_TEXT_SPECIAL = ('&', '<', '\r')
+
+
+@lru_cache(maxsize=65536)
+def xml_attr_text(text: str) -> str:
+    """Value of XML text placed into a double-quoted attribute, as an XML parser returns it."""
+    if not any(char in text for char in _ATTR_SPECIAL):
+        return text
+    return ET.fromstring(f'<a v="{text}"/>').get('v')
+
+
+@lru_cache(maxsize=65536)
+def xml_element_text(text: str) -> str:
+    """Value of XML text placed into element content, as an XML parser returns it."""
+    if not any(char in text for char in _TEXT_SPECIAL):
+        return text
+    return ET.fromstring(f'<a>{text}</a>').text or ''
+
+
+def _slot_value(values: Any, slot: tuple, convert) -> str:
+    _, field, spec, conversion = slot
+    value = values[field]
+    if conversion:
+        value = _FORMATTER.convert_field(value, conversion)
+    return convert(format(value, spec) if spec or not isinstance(value, str) else value)
+
+
+class ElementTemplate:
+    """
+    XML template compiled once into an element tree with substitution slots.
+
+    Slots are str.format placeholders in attribute values and text. With ``record_fields=True`` the template
+    is a pattern fragment with two levels of placeholders: ``{field}`` filled from the object record by bind()
+    and ``{{x_pos}}``-style placeholders filled by the writer in build(), as format_map() followed by N2G
+    ``format()`` would do. Substituted values are XML text (escaped), exactly as in the string templates.
+    """
+
+    __slots__ = ('_root', 'record_fields')
+
+    def __init__(self, text: str, record_fields: bool = False):
+        """
+        :param text: XML of a single element with placeholders.
+        :param record_fields: template has record placeholders ({field}) in addition to writer placeholders.
+        :raises ValueError: for placeholders other than plain names.
+        """
+        self.record_fields = record_fields
+        self._root = self._compile(ET.fromstring(text))
+
+    def _segments(self, value: Optional[str]) -> Any:
+        """Split value into literals and slots; returns value itself when there is nothing to substitute."""
+        if not value or '{' not in value and '}' not in value:
+            return value
+        items = []
+        if self.record_fields:
+            literal = []
+            for text, field, spec, conversion in _FORMATTER.parse(value):
+                literal.append(text)
+                if field is not None:
+                    items.extend(self._writer_segments(''.join(literal)))
+                    literal = []
+                    items.append(('record', self._check(field), spec, conversion))
+            items.extend(self._writer_segments(''.join(literal)))
+        else:
+            items = self._writer_segments(value)
+        if all(isinstance(item, str) for item in items):
+            return ''.join(items)
+        return tuple(items)
+
+    def _writer_segments(self, value: str) -> list:
+        items = []
+        for text, field, spec, conversion in _FORMATTER.parse(value):
+            if text:
+                items.append(text)
+            if field is not None:
+                items.append(('writer', self._check(field), spec, conversion))
+        return items
+
+    @staticmethod
+    def _check(field: str) -> str:
+        if not field or field.isdigit() or any(char in field for char in '.[]'):
+            raise ValueError(f'unsupported placeholder {{{field}}}')
+        return field
+
+    def _compile(self, element: ET.Element) -> tuple:
+        static = {}
+        dynamic = []
+        for name, value in element.attrib.items():
+            segments = self._segments(value)
+            static[name] = value if isinstance(segments, tuple) else segments
+            if isinstance(segments, tuple):
+                dynamic.append((name, segments))
+        return (element.tag, static, tuple(dynamic), self._segments(element.text), self._segments(element.tail),
+                tuple(self._compile(child) for child in element))
+
+    def bind(self, values: Any) -> 'BoundTemplate':
+        """
+        Fill record placeholders from values (mapping of XML-escaped strings).
+        :raises KeyError: when values has no entry for a placeholder, like format_map().
+        """
+        return BoundTemplate(self._bind(self._root, values))
+
+    def _bind(self, node: tuple, values: Any) -> tuple:
+        tag, static, dynamic, text, tail, children = node
+        return (tag, static,
+                tuple((name, self._bind_segments(segments, values, xml_attr_text)) for name, segments in dynamic),
+                self._bind_segments(text, values, xml_element_text),
+                self._bind_segments(tail, values, xml_element_text),
+                tuple(self._bind(child, values) for child in children))
+
+    @staticmethod
+    def _bind_segments(segments: Any, values: Any, convert) -> Any:
+        if not isinstance(segments, tuple):
+            return segments
+        return tuple(_slot_value(values, item, convert) if not isinstance(item, str) and item[0] == 'record' else item
+                     for item in segments)
+
+    def build(self, values: Dict[str, Any]) -> ET.Element:
+        """Create elements, filling writer placeholders (id, label, x_pos, ...) from values."""
+        return _build(self._root, values)
+
+
+class BoundTemplate:
+    """Pattern fragment with record placeholders already filled; see ElementTemplate.bind()."""
+
+    __slots__ = ('_root',)
+
+    def __init__(self, root: tuple):
+        self._root = root
+
+    def build(self, values: Dict[str, Any]) -> ET.Element:
+        return _build(self._root, values)
+
+
+def _fill(segments: Any, values: Dict[str, Any], convert) -> Any:
+    if not isinstance(segments, tuple):
+        return segments
+    if len(segments) == 1:
+        # Значение целиком из одного плейсхолдера (id="{id}", style="{style}") или уже подставленное bind()
+        item = segments[0]
+        return item if isinstance(item, str) else _slot_value(values, item, convert)
+    return ''.join(item if isinstance(item, str) else _slot_value(values, item, convert) for item in segments)
+
+
+def _build(node: tuple, values: Dict[str, Any], parent: Optional[ET.Element] = None) -> ET.Element:
+    tag, static, dynamic, text, tail, children = node
+    attrib = dict(static)
+    for name, segments in dynamic:
+        attrib[name] = _fill(segments, values, xml_attr_text)
+    element = ET.Element(tag, attrib) if parent is None else ET.SubElement(parent, tag, attrib)
+    element.text = _fill(text, values, xml_element_text)
+    element.tail = _fill(tail, values, xml_element_text)
+    for child in children:
+        _build(child, values, element)
+    return element
+
+
+class IdIndex(list):
+    """Ordered list of IDs with O(1) membership test (N2G keeps plain lists)."""
+
+    def __init__(self, items=()):
+        super().__init__(items)
+        self._members = set(self)
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._members
+
+    def append(self, item: Any) -> None:
+        super().append(item)
+        self._members.add(item)
+
+
+class Edge(NamedTuple):
+    """
+    Link for DrawioWriter.add_links(). ``layer`` replaces the parent of the link template (``None`` keeps the
+    template parent); ``link_id`` is passed as in N2G add_link(), the ID is calculated from the link otherwise.
+    """
+
+    source: str
+    target: str
+    style: str = ""
+    data: Optional[Dict[str, Any]] = None
+    layer: Optional[str] = None
+    label: str = ""
+    link_id: Optional[str] = None
+
+
+def group_by_layer(edges: Iterable[Any]) -> Dict[Optional[str], list]:
+    """Links grouped by layer: layers in order of first appearance, links of a layer in their original order."""
+    groups = {}
+    for edge in edges:
+        edge = Edge(*edge)
+        groups.setdefault(edge.layer, []).append(edge)
+    return groups
+
+
+class DrawioWriter:
+    """
+    DrawIO document writer compatible with the part of N2G ``drawio_diagram`` used by seaf2drawio.py:
+    from_xml, add_diagram, go_to_diagram, add_node, update_node, add_link, drawing, current_root,
+    nodes_ids/edges_ids. Duplicate nodes and links are skipped, as with N2G defaults.
+    add_links() adds many links at once (not part of N2G).
+
+    Node and link templates (``drawio_node_object_xml``, ``drawio_link_object_xml``) are compiled into
+    ElementTemplate once per distinct template string; add_node() also accepts a pattern fragment bound
+    with ElementTemplate.bind(), so nodes are built without formatting and parsing XML strings.
+    """
+
+    drawio_drawing_xml = """
+    <mxfile type="device" compressed="false">
+    </mxfile>
+    """
+
+    drawio_diagram_xml = """
+    <diagram id="{id}" name="{name}">
+      <mxGraphModel dx="{width}" dy="{height}" grid="1" gridSize="10" guides="1" tooltips="1" connect="1" arrows="1" fold="1" page="1" pageScale="1" pageWidth="827" pageHeight="1169" math="0" shadow="1">
+        <root>
+          <mxCell id="0"/>   
+          <mxCell id="1" parent="0"/>
+        </root>
+      </mxGraphModel>
+    </diagram>
+    """
+
+    drawio_node_object_xml = """
+    <object id="{id}" label="{label}">
+      <mxCell style="{style}" vertex="1" parent="1">
+          <mxGeometry x="{x_pos}" y="{y_pos}" width="{width}" height="{height}" as="geometry"/>
+      </mxCell>
+    </object>
+    """
+
+    drawio_link_object_xml = """
+    <object id="{id}" label="{label}">
+      <mxCell style="{style}" edge="1" parent="1" source="{source_id}" target="{target_id}">
+          <mxGeometry relative="1" as="geometry"/>
+      </mxCell>
+    </object>
+    """
+
+    drawio_link_label_xml = """
+    <mxCell id="{id}" value="{label}" style="{style};" vertex="1" connectable="0" parent="{parent_id}">
+      <mxGeometry x="{x}" relative="{rel}" as="geometry">
+        <mxPoint as="offset" />
+      </mxGeometry>
+    </mxCell>
+    """
+
+    drawio_object_xml = """
+    <object id="{id}">
+    </object>
+    """
+
+    # Предел числа скомпилированных шаблонов (шаблоны, собираемые на лету, не должны накапливаться)
+    TEMPLATE_CACHE_SIZE = 1024
+
+    def __init__(self):
+        self.drawing = ET.fromstring(self.drawio_drawing_xml)
+        self.nodes_ids = {}
+        self.edges_ids = {}
+        self.current_diagram = None
+        self.current_root = None
+        self.current_diagram_id = ""
+        self.default_node_style = "rounded=1;whiteSpace=wrap;html=1;"
+        self.default_link_style = "endArrow=none;"
+        self.default_link_label_style = "labelBackgroundColor=#ffffff;"
+        self._templates = {}
+        self._link_templates = {}
+
+    def _template(self, text: str) -> ElementTemplate:
+        template = self._templates.get(text)
+        if template is None:
+            if len(self._templates) >= self.TEMPLATE_CACHE_SIZE:
+                self._templates.clear()
+            template = ElementTemplate(text)
+            self._templates[text] = template
+        return template
+
+    def _link_template(self, layer: Optional[str]) -> ElementTemplate:
+        """Link template with the parent replaced by layer; compiled once per template and layer."""
+        key = (self.drawio_link_object_xml, layer)
+        template = self._link_templates.get(key)
+        if template is None:
+            if len(self._link_templates) >= self.TEMPLATE_CACHE_SIZE:
+                self._link_templates.clear()
+            text = self.drawio_link_object_xml
+            if layer is not None:
+                text = re.sub(r'parent="[^"]+"', f'parent="{layer}"', text, count=1)
+            template = self._link_templates[key] = self._template(text)
+        return template
+
+    def add_diagram(self, id, name="", width=1360, height=864):
+        """Add a diagram tab and switch to it (the template is formatted once per page)."""
+        if id in self.nodes_ids or id in self.edges_ids:
+            return
+        if not name.strip():
+            name = id
+        diagram = ET.fromstring(self.drawio_diagram_xml.format(id=id, name=name, width=width, height=height))
+        self.nodes_ids[id] = IdIndex()
+        self.edges_ids[id] = IdIndex()
+        self.drawing.append(diagram)
+        self.go_to_diagram(diagram_name=name)
+
+    def go_to_diagram(self, diagram_name=None, diagram_index=None):
+        if diagram_name is not None:
+            self.current_diagram = self.drawing.find("./diagram[@name='{name}']".format(name=diagram_name))
+        elif diagram_index is not None:
+            try:
+                self.current_diagram = self.drawing.findall("./diagram")[diagram_index]
+            except IndexError:
+                self.current_diagram = self.drawing.findall("./diagram")[-1]
+        self.current_root = self.current_diagram.find("./mxGraphModel/root")
+        self.current_diagram_id = self.current_diagram.attrib["id"]
+
+    def _add_data_or_url(self, element, data, url):
+        attribs = {k: str(v) for k, v in data.items()}
+        if url:
+            diagram_link = self.drawing.find("./diagram[@name='{}']".format(url))
+            if diagram_link is not None:
+                url = "data:page/id,{diagram_id}".format(diagram_id=diagram_link.attrib["id"])
+            attribs["link"] = url
+        element.attrib.update(attribs)
+        return element
+
+    def add_node(self, id, label="", data=None, url="", style="", width=120, height=60, x_pos=200, y_pos=150,
+                 template=None, **kwargs):
+        """
+        Add a node; arguments are those of N2G add_node().
+
+        :param template: BoundTemplate of a pattern fragment; by default drawio_node_object_xml is used.
+        """
+        node = self._node_element(id, label, data, url, style, width, height, x_pos, y_pos, template, **kwargs)
+        if node is not None:
+            self.current_root.append(node)
+
+    def _node_element(self, id, label="", data=None, url="", style="", width=120, height=60, x_pos=200, y_pos=150,
+                      template=None, **kwargs):
+        """Element of a new node for add_node(); None if the node is already on the page."""
+        data = data or {}
+        if id in self.nodes_ids[self.current_diagram_id]:
+            return None
+        self.nodes_ids[self.current_diagram_id].append(id)
+        if not label.strip():
+            label = id
+        if os.path.isfile(style[:5000]):
+            with open(style, "r") as style_file:
+                style = style_file.read()
+        if template is None:
+            template = self._template(self.drawio_node_object_xml)
+        node = template.build({
+            'id': id,
+            'label': label,
+            'width': width if str(width).strip() else 120,
+            'height': height if str(height).strip() else 60,
+            'x_pos': x_pos,
+            'y_pos': y_pos,
+            'style': style if style else self.default_node_style,
+        })
+        node_data = {}
+        node_data.update(data)
+        node_data.update(kwargs)
+        return self._add_data_or_url(node, node_data, url)
+
+    def update_node(self, id, label=None, data=None, url=None, style="", width="", height="", **kwargs):
+        data = data or {}
+        node_data = {}
+        node = self.current_root.find("./*[@id='{}']".format(id))
+        node_data.update(data)
+        node_data.update(kwargs)
+        node = self._add_data_or_url(node, node_data, url)
+        if label is not None:
+            node.attrib["label"] = label
+        mxcell_elem = node.find("./mxCell")
+        if os.path.isfile(style[:5000]):
+            with open(style, "r") as style_file:
+                mxcell_elem.attrib["style"] = style_file.read()
+        elif style:
+            mxcell_elem.attrib["style"] = style
+        geometry_elem = node.find("./mxCell/mxGeometry")
+        if width:
+            geometry_elem.attrib["width"] = str(width)
+        if height:
+            geometry_elem.attrib["height"] = str(height)
+
+    def add_link(self, source, target, style="", label="", data=None, url="", src_label="", trgt_label="",
+                 src_label_style="", trgt_label_style="", link_id=None, **kwargs):
+        """Add a link; arguments and link ID calculation are those of N2G add_link()."""
+        source_node_dict = source.copy() if isinstance(source, dict) else {"id": source}
+        source = source_node_dict.pop("id")
+        target_node_dict = target.copy() if isinstance(target, dict) else {"id": target}
+        target = target_node_dict.pop("id")
+        if os.path.isfile(style[:5000]):
+            with open(style, "r") as style_file:
+                style = style_file.read()
+        elements = []
+        self._link_elements(elements, self._template(self.drawio_link_object_xml), source, target, style, label,
+                            data, url, src_label, trgt_label, src_label_style, trgt_label_style, link_id, kwargs,
+                            source_node_dict, target_node_dict)
+        self.current_root.extend(elements)
+
+    def add_links(self, edges: Iterable[Any]) -> None:
+        """
+        Add links in bulk, grouped by layer (group_by_layer()); the result is the same as add_link() for
+        each link of the groups in turn.
+
+        The link template is looked up once per layer, style files are checked once per distinct style and
+        the elements of all links (and of default nodes for missing endpoints) are appended to the page
+        root with a single extend(), so the links of each layer are contiguous.
+
+        :param edges: Edge or tuples (source, target, style, data, layer[, label, link_id]).
+        """
+        elements = []
+        styles = {}
+        for layer, group in group_by_layer(edges).items():
+            template = self._link_template(layer)
+            for source, target, style, data, _, label, link_id in group:
+                if style not in styles:
+                    styles[style] = style
+                    if os.path.isfile(style[:5000]):
+                        with open(style, "r") as style_file:
+                            styles[style] = style_file.read()
+                self._link_elements(elements, template, source, target, styles[style], label, data, link_id=link_id)
+        self.current_root.extend(elements)
+
+    def _link_elements(self, elements, template, source, target, style, label="", data=None, url="", src_label="",
+                       trgt_label="", src_label_style="", trgt_label_style="", link_id=None, kwargs=None,
+                       source_node=None, target_node=None):
+        """Append to elements the link and its missing endpoint nodes, as add_link() adds them to the page."""
+        kwargs = dict(kwargs or {})
+        # Отсутствующие на странице узлы создаются по шаблону узла по умолчанию
+        if source not in self.nodes_ids[self.current_diagram_id]:
+            elements.append(self._node_element(id=source, **(source_node or {})))
+        if target not in self.nodes_ids[self.current_diagram_id]:
+            elements.append(self._node_element(id=target, **(target_node or {})))
+        if link_id:
+            link_id = "link_id:{}".format(link_id)
+        else:
+            edge_tup = tuple(sorted([label, source, target, src_label, trgt_label]))
+            link_id = hashlib.md5(",".join(edge_tup).encode()).hexdigest()
+        if link_id in self.edges_ids[self.current_diagram_id]:
+            return
+        self.edges_ids[self.current_diagram_id].append(link_id)
+        link = template.build({
+            'id': link_id,
+            'label': label,
+            'source_id': source,
+            'target_id': target,
+            'style': style or self.default_link_style,
+        })
+        if src_label:
+            elements.append(self._template(self.drawio_link_label_xml).build({
+                'id': "{}-src".format(link_id), 'label': src_label, 'parent_id': link_id,
+                'style': src_label_style or self.default_link_label_style, 'x': "-0.5", 'rel': "1",
+            }))
+            kwargs["src_label"] = src_label
+        if trgt_label:
+            elements.append(self._template(self.drawio_link_label_xml).build({
+                'id': "{}-trgt".format(link_id), 'label': trgt_label, 'parent_id': link_id,
+                'style': trgt_label_style or self.default_link_label_style, 'x': "0.5", 'rel': "-1",
+            }))
+            kwargs["trgt_label"] = trgt_label
+        link_data = dict(data or {})
+        link_data.update(kwargs)
+        link_data.update({"source": source, "target": target})
+        elements.append(self._add_data_or_url(link, link_data, url))
+
+    def from_xml(self, text_data):
+        """Load a .drawio document; top-level nodes and edges are wrapped into <object> tags as in N2G."""
+        self.drawing = ET.fromstring(text_data)
+        for diagram_elem in self.drawing.findall("./diagram"):
+            diagram_root = diagram_elem.find("./mxGraphModel/root")
+            diagram_id = diagram_elem.attrib["id"]
+            self.nodes_ids.setdefault(diagram_id, IdIndex())
+            self.edges_ids.setdefault(diagram_id, IdIndex())
+
+            for mxcell in diagram_root.findall("./mxCell"):
+                if mxcell.attrib.get("edge") == "1":
+                    diagram_root.remove(mxcell)
+                    object_tag = ET.fromstring(self.drawio_object_xml.format(id=mxcell.attrib.pop("id")))
+                    object_tag.append(mxcell)
+                    diagram_root.append(object_tag)
+                elif mxcell.attrib.get("vertex") == "1" and mxcell.attrib.get("parent") == "1":
+                    diagram_root.remove(mxcell)
+                    object_tag = ET.fromstring(self.drawio_object_xml.format(id=mxcell.attrib.pop("id")))
+                    object_tag.append(mxcell)
+                    if mxcell.attrib.get("value"):
+                        object_tag.attrib["label"] = mxcell.attrib.pop("value")
+                    diagram_root.append(object_tag)
+
+            for object_tag in diagram_root.findall("./object"):
+                object_id = object_tag.attrib["id"]
+                mxcell = object_tag.find("./mxCell")
+                if "source" in mxcell.attrib and "target" in mxcell.attrib:
+                    self.edges_ids[diagram_id].append(object_id)
+                else:
+                    self.nodes_ids[diagram_id].append(object_id)
+
+        self.go_to_diagram(diagram_index=0)
+
+    def dump_xml(self):
+        return ET.tostring(self.drawing, encoding="unicode")
@@ -0,0 +1,176 @@
+import re
+from collections.abc import Mapping
+
+# Поля паттерна с правилами отбора записей
+FILTER_KEYS = (
+    'id_regex', 'exclude_id_regex', 'require_fields', 'exclude_fields',
+    'field_regex', 'exclude_field_regex', 'any_field_regex', 'exclude_any_field_regex',
+    'include_tags', 'require_tags', 'exclude_tags',
+)
+# Через сколько проверенных записей проверки переупорядочиваются по доле отсеянных записей
+REORDER_INTERVAL = 1024
+
+
+def normalize_tag_values(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [str(item) for item in value if item is not None]
+    return [str(value)]
+
+
+def _field_values(obj, field):
+    value = obj.get(field)
+    if isinstance(value, list):
+        return [str(item) for item in value if item is not None]
+    if value is None:
+        return []
+    return [str(value)]
+
+
+def _compile_rules(rules):
+    return tuple((field, re.compile(regex)) for field, regex in rules.items())
+
+
+def _matches_all(obj, rules):
+    for field, regex in rules:
+        values = _field_values(obj, field)
+        if not values or not any(regex.search(value) for value in values):
+            return False
+    return True
+
+
+def _matches_any(obj, rules):
+    for field, regex in rules:
+        if any(regex.search(value) for value in _field_values(obj, field)):
+            return True
+    return False
+
+
+class FilterCheck:
+    """Одна проверка фильтра паттерна со счётчиками проверенных и отсеянных записей."""
+
+    __slots__ = ('name', 'reject', 'evaluated', 'rejected')
+
+    def __init__(self, name, reject):
+        """
+        :param name: имя правила паттерна (для отчёта).
+        :param reject: callable(object_id, object_data) -> True, если запись не проходит правило.
+        """
+        self.name = name
+        self.reject = reject
+        self.evaluated = 0
+        self.rejected = 0
+
+    @property
+    def selectivity(self):
+        return self.rejected / self.evaluated if self.evaluated else 0.0
+
+
+class PatternFilter:
+    """
+    Фильтры паттерна (id_regex, require_fields, field_regex, include_tags и т.д.), скомпилированные
+    в предикат: регулярные выражения компилируются и наборы тегов нормализуются один раз при создании.
+
+    Проверки выполняются до первой отсеявшей запись; порядок проверок периодически пересчитывается по доле
+    отсеянных записей, поэтому самые избирательные правила проверяются первыми. Результат от порядка
+    не зависит: запись проходит, только если проходит все правила. Счётчики calls/passed и по каждой
+    проверке (FilterCheck.evaluated/rejected) накапливаются для настройки паттернов.
+    """
+
+    __slots__ = ('name', 'checks', 'calls', 'passed', '_rules')
+
+    def __init__(self, pattern, name=None):
+        """
+        :param pattern: паттерн (PatternSpec или dict) с правилами отбора.
+        :param name: имя паттерна для отчёта.
+        """
+        self.name = name
+        self.calls = 0
+        self.passed = 0
+        self._rules = {key: pattern.get(key) for key in FILTER_KEYS if pattern.get(key)}
+        checks = []
+
+        id_regex = pattern.get('id_regex')
+        if id_regex:
+            regex = re.compile(id_regex)
+            checks.append(FilterCheck('id_regex', lambda oid, obj: not regex.search(oid)))
+        exclude_id_regex = pattern.get('exclude_id_regex')
+        if exclude_id_regex:
+            exclude_id = re.compile(exclude_id_regex)
+            checks.append(FilterCheck('exclude_id_regex', lambda oid, obj: bool(exclude_id.search(oid))))
+
+        require_fields = pattern.get('require_fields') or []
+        if require_fields:
+            checks.append(FilterCheck('require_fields',
+                                      lambda oid, obj: any(not obj.get(field) for field in require_fields)))
+        exclude_fields = pattern.get('exclude_fields') or []
+        if exclude_fields:
+            checks.append(FilterCheck('exclude_fields',
+                                      lambda oid, obj: any(obj.get(field) for field in exclude_fields)))
+
+        include_tags = set(normalize_tag_values(pattern.get('include_tags') or []))
+        require_tags = set(normalize_tag_values(pattern.get('require_tags') or []))
+        exclude_tags = set(normalize_tag_values(pattern.get('exclude_tags') or []))
+        if include_tags or require_tags or exclude_tags:
+            def reject_tags(oid, obj):
+                tags = set(normalize_tag_values(obj.get('tags'))) if isinstance(obj, Mapping) else set()
+                return ((include_tags and tags.isdisjoint(include_tags))
+                        or (require_tags and not require_tags.issubset(tags))
+                        or (exclude_tags and not tags.isdisjoint(exclude_tags)))
+            checks.append(FilterCheck('tags', reject_tags))
+
+        field_regex = _compile_rules(pattern.get('field_regex') or {})
+        if field_regex:
+            checks.append(FilterCheck('field_regex', lambda oid, obj: not _matches_all(obj, field_regex)))
+        exclude_field_regex = _compile_rules(pattern.get('exclude_field_regex') or {})
+        if exclude_field_regex:
+            checks.append(FilterCheck('exclude_field_regex',
+                                      lambda oid, obj: _matches_all(obj, exclude_field_regex)))
+        any_field_regex = _compile_rules(pattern.get('any_field_regex') or {})
+        if any_field_regex:
+            checks.append(FilterCheck('any_field_regex', lambda oid, obj: not _matches_any(obj, any_field_regex)))
+        exclude_any_field_regex = _compile_rules(pattern.get('exclude_any_field_regex') or {})
+        if exclude_any_field_regex:
+            checks.append(FilterCheck('exclude_any_field_regex',
+                                      lambda oid, obj: _matches_any(obj, exclude_any_field_regex)))
+        self.checks = checks
+
+    def __reduce__(self):
+        # Проверки - замыкания и не сериализуются: при загрузке (пакет паттернов, процессы страниц)
+        # фильтр компилируется заново из тех же правил
+        return type(self), (self._rules, self.name)
+
+    def __bool__(self):
+        """False, если у паттерна нет правил отбора."""
+        return bool(self.checks)
+
+    def __call__(self, object_id, object_data):
+        """:return: True, если запись проходит все правила паттерна."""
+        self.calls += 1
+        if self.calls % REORDER_INTERVAL == 0:
+            self.checks.sort(key=lambda check: check.selectivity, reverse=True)
+        for check in self.checks:
+            check.evaluated += 1
+            if check.reject(object_id, object_data):
+                check.rejected += 1
+                return False
+        self.passed += 1
+        return True
+
+    def apply(self, objects):
+        """
+        :param objects: выборка {OID: record}.
+        :return: записи, прошедшие фильтры (objects без изменений, если правил нет или это не словарь).
+        """
+        if not self.checks or not isinstance(objects, Mapping):
+            return objects
+        return {object_id: object_data for object_id, object_data in objects.items() if self(object_id, object_data)}
+
+    def stats(self):
+        """:return: dict {'calls', 'passed', 'checks': [(name, evaluated, rejected), ...]} в текущем порядке проверок."""
+        return {
+            'calls': self.calls,
+            'passed': self.passed,
+            'checks': [(check.name, check.evaluated, check.rejected) for check in self.checks],
+        }
@@ -0,0 +1,362 @@
+import hashlib
+import json
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+import xml.sax.saxutils as saxutils
+from collections.abc import Mapping
+
+# Версия формата манифеста: манифест другой версии приводит к полной сборке
+MANIFEST_VERSION = 3
+MANIFEST_SUFFIX = '.manifest.json'
+
+# Настройки, не влияющие на содержимое диаграммы (производительность, вывод в лог)
+SIGNATURE_IGNORED_KEYS = {
+    'incremental', 'output_file', 'debug', 'verify_generation',
+    'parse_workers', 'page_workers', 'parse_cache', 'parse_cache_dir', 'parse_cache_max_mb',
+    'lazy_load', 'compact_records', 'schema_file', 'watch', 'watch_interval',
+    'page_cache', 'page_cache_dir', 'page_cache_max_mb', 'pattern_bundle',
+    'missing_links_sample', 'missing_links_report',
+}
+
+
+def manifest_path(output_file):
+    return output_file + MANIFEST_SUFFIX
+
+
+def file_digest(path):
+    """SHA-256 содержимого файла или None, если файл недоступен."""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def output_matches(manifest, output_file):
+    """Файл output_file - тот самый результат, который описывает манифест (совпадает SHA-256)."""
+    expected = (manifest or {}).get('output_sha256')
+    return expected is not None and file_digest(output_file) == expected
+
+
+def build_signature(conf, pattern_files, code_files):
+    """
+    Подпись входов, при изменении которых инкрементальная сборка невозможна:
+    паттерны, шаблон drawio, код генератора и скриптов раскладки, значимые настройки.
+    """
+    parts = {
+        'template': file_digest(conf.get('drawio_pattern', '')),
+        'patterns': {path: file_digest(path) for path in sorted(pattern_files)},
+        'code': {path: file_digest(path) for path in sorted(code_files)},
+        'config': {key: value for key, value in conf.items() if key not in SIGNATURE_IGNORED_KEYS},
+    }
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _plain(value):
+    if isinstance(value, Mapping):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def record_fingerprint(record):
+    raw = json.dumps(_plain(record), sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def record_refs(record, result=None):
+    """Все строковые значения записи (рекурсивно) - кандидаты в ссылки на OID."""
+    if result is None:
+        result = set()
+    if isinstance(record, str):
+        result.add(record)
+    elif isinstance(record, Mapping):
+        for value in record.values():
+            record_refs(value, result)
+    elif isinstance(record, (list, tuple)):
+        for item in record:
+            record_refs(item, result)
+    return result
+
+
+def scan_sources(files, scan, load):
+    """
+    Описание исходных файлов данных для манифеста.
+
+    :param files: список YAML-файлов.
+    :param scan: callable(path) -> результат scan_yaml_keys() или None.
+    :param load: callable(path) -> dict разобранного файла (для файлов, которые не удалось просканировать).
+    :return: dict {path: {'sha256', 'schemas', 'oids'}}.
+    """
+    sources = {}
+    for path in files:
+        scanned = scan(path)
+        if scanned is not None:
+            schemas, oids = scanned
+            schema_oids = [oid for schema in schemas for oid in oids.get(schema, [])]
+        else:
+            data = load(path) or {}
+            schemas = [str(schema) for schema in data]
+            schema_oids = [str(oid) for value in data.values() if isinstance(value, Mapping) for oid in value]
+        sources[path] = {
+            'sha256': file_digest(path),
+            'schemas': list(schemas),
+            'oids': sorted(set(schema_oids)),
+        }
+    return sources
+
+
+def build_manifest(signature, sources, store, schemas, page_ids, page_order, pending, page_schemas, root_schemas,
+                   output_digest=None):
+    """
+    Формирует манифест сборки.
+
+    Для каждой страницы сохраняются нарисованные OID (ids) и входы (inputs): сами объекты, записи,
+    на которые они ссылаются (родители, сегменты), и записи схем страницы, ссылающиеся на них
+    (дочерние объекты, связи).
+
+    :param signature: build_signature().
+    :param sources: scan_sources().
+    :param store: объединённые данные {schema: {OID: record}}.
+    :param schemas: схемы, записи которых учитываются (прочитанные при сборке).
+    :param page_ids: dict {page: set(OID)} - diagram_ids.
+    :param page_order: список страниц в порядке сборки.
+    :param pending: итерируемое (page, source, target, schema) отложенных связей.
+    :param page_schemas: dict {page: set(schema)} - схемы всех паттернов страницы.
+    :param root_schemas: dict {page: set(schema)} - схемы, все объекты которых заранее размещаются на странице.
+    :param output_digest: SHA-256 записанного результата (file_digest()); по нему следующая сборка
+                          проверяет, что результат не заменён другим файлом.
+    """
+    records = {}
+    refs_by_oid = {}
+    schemas_by_oid = {}
+    for schema in sorted(schemas):
+        objects = store.get(schema)
+        if not isinstance(objects, Mapping):
+            continue
+        records[schema] = {oid: record_fingerprint(record) for oid, record in objects.items()}
+        for oid, record in objects.items():
+            refs_by_oid.setdefault(oid, set()).update(record_refs(record))
+            schemas_by_oid.setdefault(oid, set()).add(schema)
+
+    known = set(refs_by_oid)
+    pages_by_id = {}
+    for page, ids in page_ids.items():
+        for oid in ids:
+            pages_by_id.setdefault(oid, set()).add(page)
+
+    inputs = {page: set(ids) for page, ids in page_ids.items()}
+    for oid, refs in refs_by_oid.items():
+        refs &= known
+        for page in pages_by_id.get(oid, ()):
+            inputs[page].update(refs)
+        for ref in refs:
+            for page in pages_by_id.get(ref, ()):
+                if schemas_by_oid[oid] & page_schemas.get(page, set()):
+                    inputs[page].add(oid)
+
+    pending_by_page = {}
+    for page, source, target, schema in pending:
+        pending_by_page.setdefault(page, {}).setdefault((source, target), schema or '')
+
+    pages = {}
+    for page in page_order:
+        pages[page] = {
+            'ids': sorted(page_ids.get(page, ())),
+            'inputs': sorted(inputs.get(page, ())),
+            'pending': sorted([source, target, schema]
+                              for (source, target), schema in pending_by_page.get(page, {}).items()),
+            'schemas': sorted(page_schemas.get(page, ())),
+            'root_schemas': sorted(root_schemas.get(page, ())),
+        }
+    return {
+        'version': MANIFEST_VERSION,
+        'signature': signature,
+        'output_sha256': output_digest,
+        'sources': sources,
+        'records': records,
+        'page_order': list(page_order),
+        'pages': pages,
+    }
+
+
+def load_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def discard_manifest(path):
+    """Удаляет манифест: результат собран без него, и манифест его больше не описывает."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"WARNING: не удалось удалить манифест {path}: {e}")
+
+
+def save_manifest(path, manifest):
+    folder = os.path.dirname(path) or '.'
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"WARNING: не удалось сохранить манифест {path}: {e}")
+
+
+def plan_build(manifest, signature, sources, store, page_schemas, output_file):
+    """
+    Определяет, какие страницы нужно перестроить.
+
+    :param manifest: манифест предыдущей сборки или None.
+    :param signature: подпись текущих паттернов, шаблона, кода и настроек.
+    :param sources: scan_sources() текущих файлов данных.
+    :param store: объединённые данные.
+    :param page_schemas: схемы, записи которых порождают страницы (паттерны с ext_page).
+    :param output_file: результат предыдущей сборки.
+    :return: dict {'mode': 'full'|'noop'|'partial', 'reason': str, 'render': set, 'skip': set}.
+    """
+    def full(reason):
+        return {'mode': 'full', 'reason': reason, 'render': set(), 'skip': set()}
+
+    if manifest is None:
+        return full('манифест предыдущей сборки не найден')
+    if manifest.get('signature') != signature:
+        return full('изменились паттерны, шаблон, код или настройки')
+    if not os.path.exists(output_file):
+        return full(f'файл {output_file} не найден')
+    if not output_matches(manifest, output_file):
+        return full(f'файл {output_file} изменён после предыдущей сборки')
+
+    old_sources = manifest.get('sources', {})
+    changed_files = sorted(
+        path for path in set(old_sources) | set(sources)
+        if (old_sources.get(path) or {}).get('sha256') != (sources.get(path) or {}).get('sha256')
+    )
+    if not changed_files:
+        return {'mode': 'noop', 'reason': 'исходные данные не изменились', 'render': set(),
+                'skip': set(manifest.get('page_order', []))}
+
+    known_schemas = {schema for source in old_sources.values() for schema in source.get('schemas', [])}
+    for path in changed_files:
+        new_schemas = set((sources.get(path) or {}).get('schemas', [])) - known_schemas
+        if new_schemas:
+            return full(f'в {path} появились новые схемы: {", ".join(sorted(new_schemas))}')
+
+    candidates = set()
+    for path in changed_files:
+        candidates.update((old_sources.get(path) or {}).get('oids', []))
+        candidates.update((sources.get(path) or {}).get('oids', []))
+
+    old_records = manifest.get('records', {})
+    changed = set()
+    changed_schemas = {}
+    new_refs = {}
+    for schema, fingerprints in old_records.items():
+        objects = store.get(schema)
+        if not isinstance(objects, Mapping):
+            objects = {}
+        for oid in candidates:
+            record = objects.get(oid)
+            new = record_fingerprint(record) if oid in objects else None
+            if fingerprints.get(oid) != new:
+                changed.add(oid)
+                changed_schemas.setdefault(schema, set()).add(oid)
+                if record is not None:
+                    record_refs(record, new_refs.setdefault(schema, set()))
+
+    if not changed:
+        return {'mode': 'noop', 'reason': 'записи используемых схем не изменились', 'render': set(),
+                'skip': set(manifest.get('page_order', []))}
+
+    page_changes = sorted(schema for schema in page_schemas if changed_schemas.get(schema))
+    if page_changes:
+        return full(f'изменились объекты, порождающие страницы ({", ".join(page_changes)})')
+
+    render = set()
+    pages = manifest.get('pages', {})
+    for page, info in pages.items():
+        ids = set(info.get('ids', ()))
+        if changed.intersection(info.get('inputs', ())):
+            render.add(page)
+        elif any(changed_schemas.get(schema) for schema in info.get('root_schemas', ())):
+            render.add(page)
+        elif any(not ids.isdisjoint(new_refs.get(schema, ())) for schema in info.get('schemas', ())):
+            # Новая или изменённая запись схемы страницы ссылается на объект страницы (родитель, связь)
+            render.add(page)
+
+    existing = set(diagram_names(output_file))
+    skip = set()
+    for page in manifest.get('page_order', []):
+        if page in render:
+            continue
+        if unescape_name(page) not in existing:
+            render.add(page)
+            continue
+        skip.add(page)
+    return {'mode': 'partial', 'reason': f'изменено файлов: {len(changed_files)}, объектов: {len(changed)}',
+            'render': render, 'skip': skip}
+
+
+def unescape_name(name):
+    """Имена страниц в diagram_pages экранированы для XML; в файле хранится исходное имя."""
+    return saxutils.unescape(name, {'&quot;': '"', '&apos;': "'"})
+
+
+def diagram_names(output_file):
+    try:
+        return [item.get('name') for item in ET.parse(output_file).getroot().findall('diagram')]
+    except (OSError, ET.ParseError):
+        return []
+
+
+def load_diagrams(output_file, names):
+    """Возвращает {name: <diagram>} страниц предыдущего результата для последующей подстановки."""
+    wanted = {unescape_name(name): name for name in names}
+    result = {}
+    try:
+        root = ET.parse(output_file).getroot()
+    except (OSError, ET.ParseError):
+        return result
+    for item in root.findall('diagram'):
+        name = wanted.get(item.get('name'))
+        if name is not None and name not in result:
+            result[name] = item
+    return result
+
+
+def splice_diagrams(output_file, diagrams):
+    """
+    Заменяет страницы в output_file сохранёнными <diagram> предыдущей сборки (по имени, на том же месте).
+
+    :return: список подставленных страниц.
+    """
+    if not diagrams:
+        return []
+    tree = ET.parse(output_file)
+    root = tree.getroot()
+    by_name = {unescape_name(name): item for name, item in diagrams.items()}
+    spliced = []
+    for index, item in enumerate(list(root)):
+        if item.tag != 'diagram':
+            continue
+        old = by_name.pop(item.get('name'), None)
+        if old is None:
+            continue
+        root.remove(item)
+        root.insert(index, old)
+        spliced.append(item.get('name'))
+    tree.write(output_file, encoding='utf-8', xml_declaration=True)
+    return spliced
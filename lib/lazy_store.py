@@ -0,0 +1,334 @@
+import re
+from collections.abc import Mapping
+
+# Ключ верхнего уровня или ключ записи: "key": , 'key': или простой скаляр до первого ':' с пробелом/концом строки
+_KEY_RE = re.compile(r'''^(?:"(?P<dq>[^"\\]*)"|'(?P<sq>(?:[^']|'')*)'|(?P<plain>[^\s#'"\[\]{}!&*|>%@`?,-][^#]*?|-[^\s#][^#]*?))[ \t]*:(?:[ \t]+(?P<value>.*))?$''')
+# Простые скаляры, которые YAML превращает не в строки (числа, bool, null, merge-ключ)
+_NON_STR_PLAIN = re.compile(r'''^(?:[-+]?[0-9][0-9_.:eE+-]*|[-+]?\.(?:inf|Inf|INF)|\.(?:nan|NaN|NAN)|~|null|Null|NULL|true|True|TRUE|false|False|FALSE|yes|Yes|YES|no|No|NO|on|On|ON|off|Off|OFF|y|Y|n|N|=|<<)$''')
+
+SCAN_KIND = 'schema_keys'
+
+
+def _split_key(body):
+    """
+    Разбирает строку вида 'key: value' без отступа.
+
+    :return: tuple (key, value) или (None, None), если строку нельзя надёжно разобрать.
+    """
+    match = _KEY_RE.match(body)
+    if not match:
+        return None, None
+    if match.group('dq') is not None:
+        key = match.group('dq')
+    elif match.group('sq') is not None:
+        key = match.group('sq').replace("''", "'")
+    else:
+        key = match.group('plain').rstrip()
+        if _NON_STR_PLAIN.match(key):
+            return None, None
+    value = (match.group('value') or '').strip()
+    if value.startswith('#'):
+        value = ''
+    return key, value
+
+
+def scan_yaml_keys(path):
+    """
+    Быстро (без разбора YAML) определяет ключи схем верхнего уровня файла данных и OID записей в них.
+
+    Сканер понимает только блочный стиль, которым записываются данные SEAF. Если файл содержит
+    конструкции, которые нельзя надёжно распознать построчно (flow-стиль, якоря, теги, повторяющиеся
+    ключи, несколько документов, пустой файл или не словарь), возвращается None и файл разбирается целиком.
+
+    :param path: путь к YAML-файлу.
+    :return: tuple (schemas, oids): список схем в порядке файла и dict {schema: [OID, ...]}; или None.
+    """
+    schemas = []
+    oids = {}
+    current = None
+    child_indent = None
+    started = False
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\r\n').lstrip('\ufeff')
+                body = line.lstrip(' ')
+                if not body or body.startswith('#'):
+                    continue
+                if body.startswith('\t'):
+                    return None
+                indent = len(line) - len(body)
+                if indent == 0:
+                    if body.startswith(('---', '...', '%')):
+                        if started or body.rstrip() != '---':
+                            return None
+                        continue
+                    started = True
+                    key, value = _split_key(body)
+                    if key is None or key in oids or value[:1] in ('{', '[', '&', '!', '*'):
+                        return None
+                    schemas.append(key)
+                    oids[key] = []
+                    # Скалярное значение (в т.ч. блочный текст '|'/'>') не содержит записей
+                    current = None if value else key
+                    child_indent = None
+                    continue
+                if current is None:
+                    continue
+                if child_indent is None:
+                    child_indent = indent
+                if indent < child_indent:
+                    return None
+                if indent > child_indent:
+                    continue
+                if body == '-' or body.startswith('- '):
+                    # Значение схемы - список, а не словарь записей
+                    current = None
+                    continue
+                key, value = _split_key(body)
+                if key is None:
+                    return None
+                oids[current].append(key)
+    except (OSError, UnicodeDecodeError):
+        return None
+    if not schemas:
+        return None
+    return schemas, oids
+
+
+def scan_yaml_keys_cached(path, cache=None):
+    """
+    scan_yaml_keys() с кэшированием результата в ParseCache по хэшу содержимого файла.
+
+    :param path: путь к YAML-файлу.
+    :param cache: ParseCache или None.
+    """
+    key = cache.key_for(path, SCAN_KIND) if cache else None
+    if key:
+        hit, result = cache.get(key)
+        if hit:
+            return result
+    result = scan_yaml_keys(path)
+    if key:
+        cache.put(key, result)
+    return result
+
+
+class LazyDataStore(Mapping):
+    """
+    Хранилище данных SEAF {schema: {OID: record}}, которое разбирает YAML-файлы по требованию.
+
+    При создании файлы только сканируются (scan_yaml_keys), при обращении к схеме разбираются лишь
+    файлы, в которых она встречается. Значение схемы сливается из вкладов файлов в их отсортированном
+    порядке, поэтому результат совпадает с полным слиянием read_and_merge_yaml(). Части уже разобранного
+    файла, относящиеся к другим схемам, хранятся до первого обращения к этим схемам.
+
+    Перебор ключей, len() и items() требуют всех схем и разбирают все файлы.
+    """
+
+    def __init__(self, files, load, merge, scan=scan_yaml_keys, prepare=None):
+        """
+        :param files: отсортированный список YAML-файлов (порядок слияния).
+        :param load: callable(list of files) -> iterable (filename, data), data - dict или None (ошибка уже выведена).
+        :param merge: callable(destination, source) - глубокое слияние словарей.
+        :param scan: callable(path) -> результат scan_yaml_keys().
+        :param prepare: callable(value) -> value, применяется к значению схемы после слияния.
+        """
+        self._files = list(files)
+        self._load = load
+        self._merge = merge
+        self._scan = scan
+        self._prepare = prepare
+        self._file_keys = {}
+        self._file_oids = {}
+        self._unknown = []
+        self._oid_schemas = {}
+        self._parsed = set()
+        self._pending = {}
+        self._data = {}
+        self._order = None
+        for filename in self._files:
+            self._scan_file(filename)
+        self._index_oids()
+
+    @property
+    def parsed_files(self):
+        """Количество разобранных файлов."""
+        return len(self._parsed)
+
+    @property
+    def total_files(self):
+        return len(self._files)
+
+    @property
+    def loaded_schemas(self):
+        """Схемы, к которым уже обращались (без разбора остальных файлов)."""
+        return list(self._data)
+
+    @property
+    def files(self):
+        return list(self._files)
+
+    def _scan_file(self, filename):
+        scanned = self._scan(filename)
+        if scanned is None:
+            self._unknown.append(filename)
+            return
+        schemas, oids = scanned
+        self._file_keys[filename] = list(schemas)
+        self._file_oids[filename] = oids
+
+    def _index_oids(self):
+        self._oid_schemas = {}
+        for oids in self._file_oids.values():
+            for schema, schema_oids in oids.items():
+                for oid in schema_oids:
+                    self._oid_schemas.setdefault(oid, set()).add(schema)
+
+    def _parse(self, files):
+        files = [filename for filename in files if filename not in self._parsed]
+        if not files:
+            return
+        self._order = None
+        for filename, data in self._load(files):
+            self._parsed.add(filename)
+            if not isinstance(data, dict):
+                self._file_keys[filename] = []
+                continue
+            scanned = self._file_keys.get(filename, ())
+            oids = {}
+            for schema, value in data.items():
+                if isinstance(value, dict):
+                    oids[schema] = list(value)
+                    for oid in value:
+                        self._oid_schemas.setdefault(oid, set()).add(schema)
+                if schema in self._data:
+                    # Файл разбирается повторно ради другой схемы: уже загруженные схемы не меняются
+                    if schema not in scanned:
+                        print(f"WARNING: схема {schema} из файла {filename} не была найдена при сканировании "
+                              f"и не вошла в уже загруженные данные.")
+                    continue
+                self._pending.setdefault(schema, {})[filename] = value
+            self._file_keys[filename] = list(data.keys())
+            self._file_oids[filename] = oids
+        # Файлы, которые загрузчик не вернул, считаем пустыми
+        for filename in files:
+            if filename not in self._parsed:
+                self._parsed.add(filename)
+                self._file_keys[filename] = []
+
+    def _ensure_unknown(self):
+        """Разбирает файлы, состав которых не удалось определить сканированием."""
+        if self._unknown:
+            unknown, self._unknown = self._unknown, []
+            self._parse(unknown)
+
+    def _schema_order(self):
+        if self._order is None:
+            order = {}
+            for filename in self._files:
+                for schema in self._file_keys.get(filename, ()):
+                    order.setdefault(schema, None)
+            self._order = list(order)
+        return self._order
+
+    def _materialize(self, schema):
+        self._ensure_unknown()
+        contributors = [f for f in self._files if schema in self._file_keys.get(f, ())]
+        self._parse(contributors)
+        pending = self._pending.pop(schema, {})
+        merged = {}
+        for filename in self._files:
+            if filename in pending:
+                self._merge(merged, {schema: pending[filename]})
+        if schema in merged:
+            value = merged[schema]
+            self._data[schema] = self._prepare(value) if self._prepare else value
+            return True
+        return False
+
+    def invalidate(self, changed, files=None):
+        """
+        Сбрасывает загруженные схемы, которые встречаются в изменённых файлах (до или после изменения).
+
+        Изменённые файлы сканируются заново. Остальные файлы со сброшенными схемами будут разобраны
+        повторно при обращении к этим схемам; прочие схемы остаются в памяти.
+
+        :param changed: изменённые, добавленные или удалённые файлы.
+        :param files: новый отсортированный список файлов, если состав каталогов данных изменился.
+        :return: set сброшенных схем или None, если изменённый файл нельзя просканировать
+            (тогда хранилище нужно создать заново).
+        """
+        changed = set(changed)
+        if files is not None:
+            changed |= set(files).symmetric_difference(self._files)
+            self._files = list(files)
+        affected = set()
+        for filename in changed:
+            affected.update(self._file_keys.pop(filename, ()))
+            self._file_oids.pop(filename, None)
+            self._parsed.discard(filename)
+            if filename in self._unknown:
+                self._unknown.remove(filename)
+            for contributions in self._pending.values():
+                contributions.pop(filename, None)
+        current = set(self._files)
+        for filename in sorted(changed & current):
+            self._scan_file(filename)
+            if filename in self._unknown:
+                return None
+            affected.update(self._file_keys[filename])
+
+        for schema in affected:
+            self._data.pop(schema, None)
+            self._pending.pop(schema, None)
+        # Вклады неизменённых файлов в сброшенные схемы уже слиты и будут прочитаны заново
+        for filename in self._files:
+            if filename in self._parsed and affected.intersection(self._file_keys.get(filename, ())):
+                self._parsed.discard(filename)
+        self._index_oids()
+        self._order = None
+        return affected
+
+    def __getitem__(self, schema):
+        if schema not in self._data and not self._materialize(schema):
+            raise KeyError(schema)
+        return self._data[schema]
+
+    def __contains__(self, schema):
+        try:
+            self[schema]
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self):
+        self._ensure_unknown()
+        for schema in list(self._schema_order()):
+            if schema in self:
+                yield schema
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def find_oid(self, oid):
+        """
+        Ищет запись по OID, загружая только схемы, в которых этот OID найден сканированием.
+        При совпадении OID в нескольких схемах возвращается первая по порядку схема, как в build_oid_index().
+
+        :return: tuple (schema, record) или None.
+        """
+        self._ensure_unknown()
+        try:
+            schemas = self._oid_schemas.get(oid)
+        except TypeError:
+            return None
+        if not schemas:
+            return None
+        for schema in self._schema_order():
+            if schema not in schemas:
+                continue
+            objects = self.get(schema)
+            if isinstance(objects, dict) and oid in objects:
+                return schema, objects[oid]
+        return None
@@ -0,0 +1,330 @@
+from collections.abc import Mapping
+
+
+class NetworkLinkIndex:
+    """
+    Инвертированный индекс связей seaf.company.ta.services.network_links: узел -> связи, в connections
+    которых он указан. Строится один раз за сборку для паттерна network_links, поэтому каждая страница
+    проверяет только связи, затрагивающие её объекты, а не все связи данных.
+
+    Порядок связей совпадает с порядком записей схемы, поэтому связи страницы рисуются в том же порядке,
+    что и при полном переборе.
+    """
+
+    __slots__ = ('records', 'oids', 'connections', 'drawable', 'by_node')
+
+    def __init__(self, links, targets):
+        """
+        :param links: отфильтрованные записи связей {OID: record}.
+        :param targets: поле записи со списком соединяемых объектов (targets паттерна).
+        """
+        self.records = links if isinstance(links, Mapping) else None
+        self.oids = []
+        self.connections = []
+        self.drawable = []
+        self.by_node = {}
+        if not isinstance(links, Mapping):
+            return
+        for oid, record in links.items():
+            raw = record.get(targets)
+            if not isinstance(raw, (list, tuple)):
+                continue
+            connections = tuple(node for node in raw if node)
+            position = len(self.oids)
+            self.oids.append(oid)
+            self.connections.append(connections)
+            # add_links рисует только связи со списком из двух и более объектов
+            self.drawable.append(isinstance(raw, list) and len(connections) >= 2)
+            for node in dict.fromkeys(connections):
+                self.by_node.setdefault(node, []).append(position)
+
+    def touching(self, ids):
+        """
+        :param ids: ID объектов страницы.
+        :return: list позиций связей, хотя бы один объект которых есть среди ids, в порядке записей.
+        """
+        if len(ids) < len(self.by_node):
+            nodes = (node for node in ids if node in self.by_node)
+        else:
+            nodes = (node for node in self.by_node if node in ids)
+        positions = set()
+        for node in nodes:
+            positions.update(self.by_node[node])
+        return sorted(positions)
+
+    def untouched_pending(self, touched, nodes=None):
+        """
+        Отложенные связи (source, target) для связей, не затронувших страницу: первый объект связи
+        с каждым из остальных (как add_links для связей без объектов на странице).
+
+        :param touched: позиции связей, затронувших страницу (touching()).
+        :param nodes: если задано, только связи с этими объектами (например, отсутствующими на всех страницах).
+        :return: генератор (source, target).
+        """
+        if nodes is None:
+            positions = range(len(self.oids))
+        else:
+            positions = sorted({position for node in nodes for position in self.by_node.get(node, ())})
+        for position in positions:
+            if position in touched or not self.drawable[position]:
+                continue
+            connections = self.connections[position]
+            for target in connections[1:]:
+                yield connections[0], target
+
+
+class PendingLinks:
+    """
+    Отложенные связи (page, source, target), цель которых может оказаться на другой странице.
+
+    Явные записи хранятся словарём {(page, source, target): схема связи}. Связи network_links, ни один
+    объект которых не попал на страницу, не перечисляются для каждой страницы: страница запоминает ключ
+    индекса и позиции затронутых ею связей (defer()), а записи строятся по NetworkLinkIndex только при
+    обращении. missing() перебирает только те записи, цель которых отсутствует на всех страницах, поэтому
+    итоговая проверка не зависит от произведения числа связей на число страниц.
+    """
+
+    def __init__(self, resolve):
+        """
+        :param resolve: callable(key) -> NetworkLinkIndex.
+        """
+        self.resolve = resolve
+        self.explicit = {}
+        self.deferred = []
+
+    def __getstate__(self):
+        # Между процессами передаются только записи: индексы связей есть в каждом процессе
+        return self.explicit, self.deferred
+
+    def __setstate__(self, state):
+        self.resolve = None
+        self.explicit, self.deferred = state
+
+    def add(self, item, schema=''):
+        """
+        :param item: (page, source, target).
+        :param schema: схема связи (для отчёта о пропущенных связях).
+        """
+        self.explicit.setdefault(item, schema)
+
+    def update(self, items):
+        """:param items: PendingLinks или итерируемое (page, source, target[, schema])."""
+        if isinstance(items, PendingLinks):
+            for item, schema in items.explicit.items():
+                self.explicit.setdefault(item, schema)
+            self.deferred.extend(items.deferred)
+        else:
+            for page, source, target, *schema in items:
+                self.add((page, source, target), schema[0] if schema else '')
+
+    def defer(self, page, key, touched, schema=''):
+        """
+        :param page: имя страницы.
+        :param key: ключ индекса для resolve().
+        :param touched: позиции связей индекса, затронувших страницу.
+        :param schema: схема связей индекса.
+        """
+        self.deferred.append((page, key, frozenset(touched), schema))
+
+    def clear(self):
+        self.explicit.clear()
+        self.deferred.clear()
+
+    def for_page(self, page):
+        """:return: dict {(source, target): схема} отложенных связей страницы."""
+        result = {}
+        for page_name, key, touched, schema in self.deferred:
+            if page_name == page:
+                for pair in self.resolve(key).untouched_pending(touched):
+                    result.setdefault(pair, schema)
+        # явные записи имеют приоритет, как в missing()
+        result.update({(source, target): schema for (p, source, target), schema in self.explicit.items() if p == page})
+        return result
+
+    def __iter__(self):
+        for page, source, target, _ in self.items():
+            yield page, source, target
+
+    def items(self):
+        """:return: генератор (page, source, target, schema) всех отложенных связей (возможны повторы)."""
+        for (page, source, target), schema in self.explicit.items():
+            yield page, source, target, schema
+        for page, key, touched, schema in self.deferred:
+            for source, target in self.resolve(key).untouched_pending(touched):
+                yield page, source, target, schema
+
+    def missing(self, present_ids):
+        """
+        Отложенные связи, цель которых отсутствует на всех страницах. Записи не накапливаются:
+        повторы отложенных связей индекса отсеиваются в пределах одной страницы.
+
+        :param present_ids: ID объектов всех страниц.
+        :return: генератор (page, source, target, schema), каждая связь один раз.
+        """
+        for (page, source, target), schema in self.explicit.items():
+            if target not in present_ids:
+                yield page, source, target, schema
+        deferred_by_page = {}
+        for page, key, touched, schema in self.deferred:
+            deferred_by_page.setdefault(page, []).append((key, touched, schema))
+        absent = {}
+        for page, entries in deferred_by_page.items():
+            seen = set()
+            for key, touched, schema in entries:
+                index = self.resolve(key)
+                if key not in absent:
+                    absent[key] = [node for node in index.by_node if node not in present_ids]
+                for source, target in index.untouched_pending(touched, absent[key]):
+                    if target in present_ids or (source, target) in seen or (page, source, target) in self.explicit:
+                        continue
+                    seen.add((source, target))
+                    yield page, source, target, schema
+
+
+# Классы маршрутов logical_links по расположению конечных объектов на страницах
+LINK_SAME_PAGE = 'same_page'
+LINK_CROSS_PAGE = 'cross_page'
+LINK_MISSING_ENDPOINT = 'missing_endpoint'
+LOGICAL_TOPOLOGIES = ('star', 'chain')
+
+
+def logical_topology(raw_topology):
+    """
+    :param raw_topology: значение поля topology записи logical_links.
+    :return: tuple (топология, известна ли исходная топология): пустое значение и неизвестная топология дают star.
+    """
+    topology = str(raw_topology or 'star').lower()
+    if raw_topology and topology not in LOGICAL_TOPOLOGIES:
+        return 'star', False
+    return topology, True
+
+
+def logical_link_targets(link_data, targets_key='target'):
+    link_targets = link_data.get(targets_key) or []
+    if not isinstance(link_targets, list):
+        link_targets = [link_targets]
+    return [target_id for target_id in link_targets if target_id]
+
+
+def logical_link_steps(source_id, target_ids, topology):
+    if topology == 'chain':
+        return list(zip([source_id] + target_ids[:-1], target_ids))
+    return [(source_id, target_id) for target_id in target_ids]
+
+
+def _hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+class LogicalRoute:
+    """Маршрут одной записи logical_links: источник, цели, топология и шаги (пары source -> target)."""
+
+    __slots__ = ('oid', 'record', 'source', 'targets', 'topology', 'raw_topology', 'known_topology', 'steps',
+                 'endpoints', 'complete', 'kind')
+
+    def __init__(self, oid, record, targets_key):
+        self.oid = oid
+        self.record = record
+        self.source = record.get('source')
+        self.targets = logical_link_targets(record, targets_key)
+        self.raw_topology = record.get('topology')
+        self.topology, self.known_topology = logical_topology(self.raw_topology)
+        self.steps = logical_link_steps(self.source, self.targets, self.topology)
+        endpoints = ([self.source] if self.source else []) + self.targets
+        self.endpoints = tuple(dict.fromkeys(node for node in endpoints if _hashable(node)))
+        # Все узлы шагов известны: маршрут может целиком оказаться на одной странице
+        self.complete = bool(self.source) and all(_hashable(node) for node in endpoints)
+        self.kind = None
+
+    def on_page(self, page_ids):
+        """
+        Расположение маршрута относительно страницы.
+
+        :param page_ids: ID объектов страницы.
+        :return: LINK_SAME_PAGE - все объекты маршрута на странице, LINK_CROSS_PAGE - только часть,
+                 None - ни одного.
+        """
+        present = [node in page_ids for node in self.endpoints]
+        if not any(present):
+            return None
+        return LINK_SAME_PAGE if self.complete and all(present) else LINK_CROSS_PAGE
+
+
+class LogicalLinkPlan:
+    """
+    План маршрутов logical_links: записи разбираются один раз за сборку (цели, топология, шаги), индекс
+    объект -> маршруты позволяет странице обработать только маршруты, затрагивающие её объекты.
+
+    Маршруты, обработка которых выводит сообщения независимо от объектов страницы (нет source или
+    direction, неизвестная топология, ещё не выведено сообщение о топологии по умолчанию), посещаются
+    на каждой странице, как при полном переборе. classify() относит каждый маршрут к LINK_SAME_PAGE,
+    LINK_CROSS_PAGE или LINK_MISSING_ENDPOINT по индексу объект -> страницы.
+    """
+
+    __slots__ = ('routes', 'by_node', 'always', 'unlogged')
+
+    def __init__(self, links, targets_key='target'):
+        """
+        :param links: записи logical_links {OID: record} (после фильтров паттерна).
+        :param targets_key: поле целей маршрута (targets паттерна).
+        """
+        self.routes = None
+        self.by_node = {}
+        self.always = set()
+        self.unlogged = set()
+        if not isinstance(links, Mapping):
+            return
+        self.routes = []
+        for oid, record in links.items():
+            if not isinstance(record, Mapping):
+                continue
+            route = LogicalRoute(oid, record, targets_key)
+            position = len(self.routes)
+            self.routes.append(route)
+            if ('source' not in record or not _hashable(route.source) or not route.known_topology
+                    or (route.targets and 'direction' not in record)):
+                self.always.add(position)
+            elif not route.raw_topology:
+                self.unlogged.add(position)
+            for node in route.endpoints:
+                self.by_node.setdefault(node, []).append(position)
+
+    def visit(self, page_ids, logged):
+        """
+        :param page_ids: ID объектов текущей страницы.
+        :param logged: OID связей, для которых уже выведено сообщение о топологии по умолчанию.
+        :return: list LogicalRoute для обработки на странице в порядке записей.
+        """
+        self.unlogged = {position for position in self.unlogged if self.routes[position].oid not in logged}
+        positions = self.always | self.unlogged
+        nodes = page_ids if len(page_ids) < len(self.by_node) else [node for node in self.by_node if node in page_ids]
+        for node in nodes:
+            positions.update(self.by_node.get(node, ()))
+        return [self.routes[position] for position in sorted(positions)]
+
+    def classify(self, node_pages, ignored_pages=()):
+        """
+        Классифицирует маршруты по страницам, на которых размещены их объекты.
+
+        :param node_pages: dict {OID: set страниц}.
+        :param ignored_pages: страницы, которые не учитываются (Main Schema).
+        :return: dict {OID: класс маршрута} для маршрутов с источником и целями.
+        """
+        ignored = set(ignored_pages)
+        result = {}
+        for route in self.routes or ():
+            if not route.source or not route.targets:
+                continue
+            pages = [node_pages.get(node, set()) - ignored for node in [route.source] + route.targets]
+            if not all(pages):
+                route.kind = LINK_MISSING_ENDPOINT
+            elif set.intersection(*pages):
+                route.kind = LINK_SAME_PAGE
+            else:
+                route.kind = LINK_CROSS_PAGE
+            result[route.oid] = route.kind
+        return result
@@ -1,5 +1,11 @@
+import gzip
+import json
+import os
 import xml.etree.ElementTree as ET
 
+# Число пропущенных связей, выводимых в журнал (остальные - только счётчиками и в файле отчёта)
+DEFAULT_MISSING_LINKS_SAMPLE = 50
+
 
 def find_parent(root, target):
     """Находит родительский элемент для target в дереве root"""
@@ -35,19 +41,20 @@ def collect_data_links(object_data):
 
     return data_links
 
-def remove_obsolete_links(diagram, data_file, schema_key):
+def remove_obsolete_links(diagram, data_file, schema_key, d=None):
     """
     Удаляет связи из диаграммы, которые отсутствуют в новых данных.
     
     :param diagram: Экземпляр drawio_diagram
     :param data_file: Путь к YAML-файлу с данными
     :param schema_key: Ключ схемы для поиска связей в данных
+    :param d: Экземпляр SeafDrawio с уже загруженными данными (иначе данные читаются заново)
     """
     # Получаем связи из новых данных
-    from lib import seaf_drawio
-
-    d = seaf_drawio.SeafDrawio({})
-    object_data = d.get_object(data_file, schema_key)
+    if d is None:
+        from lib import seaf_drawio
+        d = seaf_drawio.SeafDrawio({})
+    object_data = d.get_object(data_file, schema_key, readonly=True)
 
     # Собираем связи из данных и список ID компонентов
     data_links = collect_data_links(object_data)
@@ -103,7 +110,68 @@ def remove_obsolete_links(diagram, data_file, schema_key):
             if parent is not None:
                 parent.remove(obj)
 
-def draw_verify(diagram_ids, diagram, pending_missing_links):
+class MissingLinkReport:
+    """
+    Сводка связей, пропущенных из-за отсутствия цели на всех страницах, с ограниченным расходом памяти:
+    счётчики по (страница, схема) и выборка из sample_size первых по сортировке связей. Полный список
+    при заданном path пишется построчно в сжатый JSONL-файл по мере поступления связей.
+    """
+
+    def __init__(self, sample_size=DEFAULT_MISSING_LINKS_SAMPLE, path=None):
+        """
+        :param sample_size: число связей в выборке для журнала.
+        :param path: путь к файлу отчёта (.jsonl.gz) или None.
+        """
+        self.sample_size = max(int(sample_size), 0)
+        self.path = path
+        self.total = 0
+        self.counters = {}
+        self._sample = []
+        self._file = None
+        if path:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+
+    def add(self, page, source, target, schema=''):
+        self.total += 1
+        key = (page, schema or '')
+        self.counters[key] = self.counters.get(key, 0) + 1
+        if self.sample_size:
+            self._sample.append((page, source, target))
+            # Выборка не растёт больше чем вдвое от размера: лишние связи отбрасываются после сортировки
+            if len(self._sample) >= 2 * self.sample_size:
+                self._sample = sorted(self._sample)[:self.sample_size]
+        if self._file is not None:
+            self._file.write(json.dumps({'page': page, 'schema': schema or '', 'source': source, 'target': target},
+                                        ensure_ascii=False) + '\n')
+
+    @property
+    def sample(self):
+        """Первые по сортировке (page, source, target) пропущенные связи."""
+        return sorted(self._sample)[:self.sample_size]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def print_summary(self):
+        if not self.total:
+            return
+        print(f"INFO: skipped {self.total} links due to targets missing on all pages:")
+        for p_name, source_id, target_id in self.sample:
+            print(f"  {p_name}: {source_id} -> {target_id}")
+        if self.total > self.sample_size:
+            print(f"  ... ещё {self.total - self.sample_size} (страница / схема: число связей):")
+            for (p_name, schema), count in sorted(self.counters.items()):
+                print(f"    {p_name} / {schema or '-'}: {count}")
+        if self.path:
+            print(f"  Полный список пропущенных связей: {self.path}")
+
+
+def draw_verify(diagram_ids, diagram, pending_missing_links, sample_size=DEFAULT_MISSING_LINKS_SAMPLE,
+                report_path=None):
 
 
     # After constructing all pages, log only truly missing targets (not present on any page)
@@ -111,11 +179,13 @@ def draw_verify(diagram_ids, diagram, pending_missing_links):
         present_ids = set()
         for ids in diagram_ids.values():
             present_ids.update(ids)
-        real_missing = sorted({(p, s, t) for (p, s, t) in pending_missing_links if t not in present_ids})
-        if real_missing:
-            print(f"INFO: skipped {len(real_missing)} links due to targets missing on all pages:")
-            for p_name, source_id, target_id in real_missing:
-                print(f"  {p_name}: {source_id} -> {target_id}")
+        report = MissingLinkReport(sample_size, report_path)
+        try:
+            for p_name, source_id, target_id, schema in pending_missing_links.missing(present_ids):
+                report.add(p_name, source_id, target_id, schema)
+        finally:
+            report.close()
+        report.print_summary()
     except Exception as Ex:
         print(f"\033[91mLinks Verify Exception \033[0m:\n {Ex}")
 
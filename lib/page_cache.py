@@ -0,0 +1,166 @@
+import hashlib
+import json
+from collections.abc import Mapping
+
+from lib.incremental import record_fingerprint, record_refs
+from lib.parse_cache import ParseCache
+
+# Версия формата записей кэша страниц: записи другой версии не используются
+PAGE_CACHE_VERSION = 2
+DEFAULT_PAGE_CACHE_DIR = '.cache/seaf2drawio/pages'
+DEFAULT_PAGE_CACHE_MAX_MB = 128
+
+
+class PageInputs:
+    """
+    Входы страниц по текущим данным: для набора ID объектов страницы определяет записи, от которых
+    зависит её содержимое (так же, как манифест инкрементальной сборки), и вычисляет их отпечаток.
+
+    Входы страницы - сами объекты, записи, на которые они ссылаются (родители, сегменты), записи схем
+    паттернов страницы, ссылающиеся на её объекты (дочерние объекты, связи), и все записи схем,
+    объекты которых размещаются на странице целиком (root_schemas).
+    """
+
+    def __init__(self, store, schemas):
+        """
+        :param store: объединённые данные {schema: {OID: record}}.
+        :param schemas: схемы, записи которых учитываются (схемы всех паттернов).
+        """
+        self._records = {}
+        self._refs = {}
+        self._schemas_by_oid = {}
+        self._referenced_by = {}
+        self._schema_fingerprints = {}
+        for schema in sorted(schemas):
+            objects = store.get(schema)
+            if not isinstance(objects, Mapping):
+                continue
+            for oid, record in objects.items():
+                self._records.setdefault(oid, []).append((schema, record))
+                self._refs.setdefault(oid, set()).update(record_refs(record))
+                self._schemas_by_oid.setdefault(oid, set()).add(schema)
+        known = set(self._records)
+        for oid, refs in self._refs.items():
+            refs &= known
+            for ref in refs:
+                self._referenced_by.setdefault(ref, set()).add(oid)
+        self._store = store
+        self._fingerprints = {}
+
+    def _record_fingerprint(self, oid):
+        if oid not in self._fingerprints:
+            self._fingerprints[oid] = sorted((schema, record_fingerprint(record))
+                                             for schema, record in self._records.get(oid, ()))
+        return self._fingerprints[oid]
+
+    def _schema_fingerprint(self, schema):
+        if schema not in self._schema_fingerprints:
+            objects = self._store.get(schema)
+            objects = objects if isinstance(objects, Mapping) else {}
+            raw = json.dumps(sorted((str(oid), record_fingerprint(record)) for oid, record in objects.items()))
+            self._schema_fingerprints[schema] = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+        return self._schema_fingerprints[schema]
+
+    def fingerprint(self, ids, page_schemas, root_schemas=()):
+        """
+        :param ids: ID объектов страницы.
+        :param page_schemas: схемы паттернов страницы.
+        :param root_schemas: схемы, все объекты которых размещаются на странице.
+        :return: str SHA-256 входов страницы.
+        """
+        ids = set(ids)
+        inputs = set(ids)
+        page_schemas = set(page_schemas)
+        for oid in ids:
+            inputs.update(self._refs.get(oid, ()))
+            for ref in self._referenced_by.get(oid, ()):
+                if self._schemas_by_oid[ref] & page_schemas:
+                    inputs.add(ref)
+        parts = {
+            'ids': sorted(ids),
+            'inputs': [[oid, self._record_fingerprint(oid)] for oid in sorted(inputs)],
+            'root_schemas': {schema: self._schema_fingerprint(schema) for schema in sorted(root_schemas)},
+        }
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    """
+    Дисковый кэш готовых страниц (<diagram> после раскладки) с адресацией по содержимому.
+
+    Ключ страницы - хэш подписи сборки (паттерны, шаблон drawio, код генератора, значимые настройки),
+    имени страницы и отпечатка её входов (PageInputs). Отпечаток зависит от ID объектов страницы,
+    поэтому для каждой страницы дополнительно хранится индексная запись с ID последней построенной
+    версии: по ним вычисляется отпечаток текущих данных и ищется страница. Записи хранятся в ParseCache
+    (pickle, ограничение размера каталога и вытеснение давно не использованных записей).
+    """
+
+    def __init__(self, storage, signature):
+        """
+        :param storage: ParseCache для хранения записей.
+        :param signature: подпись сборки (incremental.build_signature()).
+        """
+        self.storage = storage
+        self.signature = signature
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+
+    @classmethod
+    def from_config(cls, config, signature):
+        """
+        :param config: dict с ключами page_cache, page_cache_dir, page_cache_max_mb.
+        :return: PageCache или None, если кэш выключен.
+        """
+        if not config.get('page_cache'):
+            return None
+        try:
+            max_mb = float(config.get('page_cache_max_mb', DEFAULT_PAGE_CACHE_MAX_MB))
+        except (TypeError, ValueError):
+            max_mb = DEFAULT_PAGE_CACHE_MAX_MB
+        storage = ParseCache(config.get('page_cache_dir') or DEFAULT_PAGE_CACHE_DIR, int(max_mb * 1024 * 1024))
+        return cls(storage, signature)
+
+    def _key(self, kind, *parts):
+        raw = '|'.join([str(PAGE_CACHE_VERSION), kind, self.signature] + [str(part) for part in parts])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def lookup(self, page, fingerprint_of):
+        """
+        :param page: имя страницы.
+        :param fingerprint_of: callable(ids) -> отпечаток входов страницы по текущим данным.
+        :return: dict {'diagram', 'ids', 'pending', 'schemas'} или None.
+        """
+        hit, ids = self.storage.get(self._key('index', page))
+        if hit and isinstance(ids, list):
+            hit, entry = self.storage.get(self._key('page', page, fingerprint_of(ids)))
+            if hit and isinstance(entry, dict) and entry.get('ids') == ids:
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def store(self, page, ids, fingerprint, diagram, pending, schemas):
+        """
+        Сохраняет построенную страницу.
+
+        :param ids: ID объектов страницы.
+        :param fingerprint: отпечаток входов страницы для этих ID.
+        :param diagram: элемент <diagram> страницы после раскладки.
+        :param pending: список [source, target, schema] отложенных связей страницы.
+        :param schemas: схемы паттернов страницы.
+        """
+        ids = sorted(ids)
+        self.storage.put(self._key('page', page, fingerprint), {
+            'ids': ids,
+            'diagram': diagram,
+            'pending': sorted(pending),
+            'schemas': sorted(schemas),
+        })
+        self.storage.put(self._key('index', page), ids)
+        self.stored += 1
+
+    def summary(self):
+        return (f"> Кэш страниц: использовано {self.hits}, построено {self.misses}, сохранено {self.stored} "
+                f"({self.storage.cache_dir})")
@@ -0,0 +1,58 @@
+from collections.abc import Mapping
+
+
+class PageState:
+    """
+    Результат формирования одной страницы (render_page): ID объектов страницы, отложенные связи, схемы
+    паттернов, объекты, размещённые паттернами, ожидаемые объекты для проверки и сообщения о топологии
+    по умолчанию, выведенные на странице.
+
+    Страница пополняет только собственное состояние; общее состояние сборки дополняется им после
+    формирования страницы (merge_page_state в seaf2drawio.py) - в том же процессе или после получения
+    состояния из процесса пула, поэтому последовательная и параллельная генерация объединяют одно и то же.
+    """
+
+    __slots__ = ('name', 'collect_expected', 'ids', 'schemas', 'claims', 'pending', 'expected_counts',
+                 'expected_data', 'pattern_specs', 'layout_counters', 'created_tag_layers', 'logged_topology')
+
+    def __init__(self, name, pending, collect_expected=True):
+        """
+        :param name: имя страницы.
+        :param pending: пустой PendingLinks для отложенных связей страницы.
+        :param collect_expected: собирать ожидаемые объекты паттернов (выборка паттерна одинакова для всех
+                                 страниц файла, поэтому достаточно одной страницы файла).
+        """
+        self.name = name
+        self.collect_expected = collect_expected
+        self.ids = set()
+        self.schemas = set()
+        self.claims = {}
+        self.pending = pending
+        self.expected_counts = {}
+        self.expected_data = {}
+        self.pattern_specs = {}
+        self.layout_counters = {}
+        self.created_tag_layers = set()
+        self.logged_topology = set()
+
+    def __getstate__(self):
+        state = {slot: getattr(self, slot) for slot in self.__slots__}
+        # Записи доступны только для чтения (mappingproxy) и есть в данных основного процесса: передаём OID
+        state['expected_data'] = {schema: list(objects) for schema, objects in self.expected_data.items()}
+        return state
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+    def expected_records(self, resolve):
+        """
+        :param resolve: callable(schema) -> записи схемы {OID: record}; используется для состояния, полученного
+                        из процесса пула (в нём вместо записей переданы OID).
+        :return: генератор (schema, {OID: record}).
+        """
+        for schema, objects in self.expected_data.items():
+            if not isinstance(objects, Mapping):
+                records = resolve(schema)
+                objects = {oid: records[oid] for oid in objects}
+            yield schema, objects
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Версия формата записей кэша: увеличивается при изменении структуры сохраняемых данных
+CACHE_FORMAT_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'seaf2drawio')
+DEFAULT_CACHE_MAX_MB = 256
+# Записи индекса путь + mtime + размер -> SHA-256 содержимого
+INDEX_SUFFIX = '.sha256'
+
+
+class ParseCache:
+    """
+    Дисковый кэш разобранных YAML-структур.
+
+    Запись кэша адресуется способом разбора, версией формата и SHA-256 содержимого файла, поэтому
+    изменённый файл всегда разбирается заново, а неизменённый находится и в свежей копии репозитория
+    (в CI). Хэш содержимого запоминается в индексе по абсолютному пути, mtime и размеру файла: пока они
+    не изменились, файл не читается повторно. Данные хранятся в pickle, при превышении общего размера
+    каталога удаляются записи, к которым дольше всего не обращались (LRU по mtime).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024):
+        """
+        :param cache_dir: каталог для хранения записей кэша.
+        :param max_bytes: предельный суммарный размер записей в байтах.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Создаёт кэш по секции конфигурации или возвращает None, если кэш выключен.
+
+        :param config: dict с ключами parse_cache, parse_cache_dir, parse_cache_max_mb.
+        :return: ParseCache или None.
+        """
+        if not config.get('parse_cache'):
+            return None
+        try:
+            max_mb = float(config.get('parse_cache_max_mb', DEFAULT_CACHE_MAX_MB))
+        except (TypeError, ValueError):
+            max_mb = DEFAULT_CACHE_MAX_MB
+        return cls(config.get('parse_cache_dir') or DEFAULT_CACHE_DIR, int(max_mb * 1024 * 1024))
+
+    def key_for(self, path, kind):
+        """
+        Вычисляет ключ записи для файла.
+
+        :param path: путь к исходному файлу.
+        :param kind: способ разбора (разные загрузчики одного файла кэшируются отдельно).
+        :return: str ключ или None, если файл недоступен (ошибку сообщит сам загрузчик).
+        """
+        digest = self.digest(path)
+        if digest is None:
+            return None
+        raw = f'{CACHE_FORMAT_VERSION}|{kind}|{digest}'
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def digest(self, path):
+        """
+        SHA-256 содержимого файла. Файл читается, только если его путь, mtime или размер не совпадают
+        с записью индекса.
+
+        :return: str хэш или None, если файл недоступен.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        raw = f'{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}'
+        index = os.path.join(self.cache_dir, hashlib.sha256(raw.encode('utf-8')).hexdigest() + INDEX_SUFFIX)
+        try:
+            with open(index, 'r', encoding='ascii') as f:
+                digest = f.read()
+            if len(digest) == 64:
+                os.utime(index, None)
+                return digest
+        except (OSError, ValueError):
+            pass
+        try:
+            with open(path, 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+        self._write(index, digest.encode('ascii'))
+        return digest
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pickle')
+
+    def get(self, key):
+        """
+        :return: tuple (hit, value); hit=False, если записи нет или она повреждена.
+        """
+        if not key:
+            return False, None
+        entry = self._entry_path(key)
+        try:
+            with open(entry, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return False, None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError):
+            self.misses += 1
+            self._remove(entry)
+            return False, None
+        try:
+            os.utime(entry, None)  # отмечаем обращение для LRU-вытеснения
+        except OSError:
+            pass
+        self.hits += 1
+        return True, value
+
+    def put(self, key, value):
+        """Атомарно сохраняет значение и при необходимости вытесняет старые записи."""
+        if not key:
+            return
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except pickle.PicklingError as e:
+            print(f"WARNING: не удалось сохранить запись кэша разбора в {self.cache_dir}: {e}")
+            return
+        if self._write(self._entry_path(key), payload):
+            self.evict()
+
+    def _write(self, path, payload):
+        """Атомарно записывает файл кэша; ошибка записи только выводится."""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"WARNING: не удалось сохранить запись кэша разбора в {self.cache_dir}: {e}")
+            return False
+        return True
+
+    def evict(self):
+        """Удаляет самые давние записи, пока суммарный размер кэша превышает max_bytes."""
+        try:
+            names = [name for name in os.listdir(self.cache_dir) if name.endswith(('.pickle', INDEX_SUFFIX))]
+        except OSError:
+            return
+        entries = []
+        total = 0
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if self._remove(path):
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
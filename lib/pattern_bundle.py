@@ -0,0 +1,185 @@
+import os
+import pickle
+import re
+import tempfile
+import xml.etree.ElementTree as ET
+from collections.abc import Mapping
+
+from lib.dispatch import build_dispatch_table, parse_type_filter
+from lib.filters import PatternFilter
+from lib.incremental import file_digest
+from lib.patterns import CompiledFragment, build_pattern_specs, compile_xml_pattern, _LAYOUT_ALGOS
+
+# Версия формата пакета: пакет другой версии не используется
+PATTERN_BUNDLE_VERSION = 1
+DEFAULT_PATTERN_BUNDLE = '.cache/seaf2drawio/patterns.bundle'
+# Модули, объекты которых сохраняются в пакете: при их изменении пакет считается устаревшим
+BUNDLE_CODE_FILES = tuple(os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+                          for name in ('patterns.py', 'filters.py', 'dispatch.py', 'drawio_writer.py',
+                                       'pattern_bundle.py'))
+_LAYOUT_KEYS = ('w', 'h', 'offset', 'deep')
+
+
+def source_stamp(path):
+    """(mtime_ns, size) файла паттернов или None, если файл недоступен."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def bundle_header():
+    """Версия формата и хэши модулей, объекты которых хранятся в пакете."""
+    return {
+        'version': PATTERN_BUNDLE_VERSION,
+        'code': {os.path.basename(path): file_digest(path) for path in BUNDLE_CODE_FILES},
+    }
+
+
+def validate_xml(xml, what):
+    """
+    Проверяет XML паттерна так же, как он разбирается при отрисовке (фрагменты верхнего уровня
+    и плейсхолдеры {field}).
+
+    :return: list сообщений об ошибках.
+    """
+    if not isinstance(xml, str):
+        return [f"{what}: значение не является строкой"]
+    try:
+        root = ET.fromstring(f"<root>{xml}</root>")
+    except ET.ParseError as e:
+        return [f"{what}: ошибка парсинга XML: {e}"]
+    errors = []
+    for item in root:
+        try:
+            CompiledFragment(ET.tostring(item, encoding='unicode'), False)
+        except ValueError as e:
+            errors.append(f"{what}: некорректный плейсхолдер в <{item.tag}>: {e}")
+    return errors
+
+
+def validate_patterns(definitions, file):
+    """
+    Проверяет паттерны одного файла: XML объектов и страниц (ext_page), поле type, правила отбора,
+    параметры алгоритма размещения.
+
+    :param definitions: разобранный файл паттернов {name: dict}.
+    :param file: путь к файлу (для сообщений).
+    :return: list сообщений об ошибках.
+    """
+    if not isinstance(definitions, Mapping):
+        return [f"{file}: файл не содержит словарь паттернов"]
+    errors = []
+    for name, pattern in definitions.items():
+        where = f"{file}: {name}"
+        if not isinstance(pattern, Mapping):
+            errors.append(f"{where}: паттерн не является словарём")
+            continue
+        if not pattern.get('schema'):
+            errors.append(f"{where}: не задано поле schema")
+        if 'xml' in pattern:
+            errors += validate_xml(pattern['xml'], f"{where}.xml")
+        if pattern.get('ext_page'):
+            try:
+                ET.fromstring(pattern['ext_page'])
+            except (ET.ParseError, TypeError) as e:
+                errors.append(f"{where}.ext_page: ошибка парсинга XML: {e}")
+        if pattern.get('type'):
+            try:
+                parse_type_filter(str(pattern['type']))
+            except ValueError:
+                errors.append(f"{where}.type: ожидается 'значение' или 'поле:значение', получено {pattern['type']!r}")
+        try:
+            PatternFilter(pattern, name)
+        except (re.error, AttributeError, TypeError) as e:
+            errors.append(f"{where}: некорректное правило отбора: {e}")
+        if pattern.get('algo') in _LAYOUT_ALGOS:
+            for key in _LAYOUT_KEYS:
+                if not isinstance(pattern.get(key), (int, float)):
+                    errors.append(f"{where}.{key}: для algo {pattern['algo']} требуется число")
+    return errors
+
+
+def compile_bundle(files, read):
+    """
+    Проверяет и компилирует файлы паттернов в пакет.
+
+    :param files: пути к файлам data/patterns/*.yaml.
+    :param read: callable(path) -> разобранный YAML (SeafDrawio.read_yaml_file).
+    :return: tuple (bundle, errors); bundle None, если есть ошибки.
+    """
+    bundle = {'header': bundle_header(), 'files': {}}
+    errors = []
+    for path in files:
+        key = os.path.abspath(path)
+        stamp = source_stamp(path)
+        definitions = read(path)
+        file_errors = validate_patterns(definitions, path)
+        if file_errors:
+            errors += file_errors
+            continue
+        specs = build_pattern_specs(definitions)
+        fragments = {}
+        for name, spec in specs.items():
+            # Фильтр и шаблоны фрагментов компилируются заранее и сохраняются вместе с паттерном
+            spec.filter
+            if spec.get('xml') and spec['xml'] not in fragments:
+                # XML уже проверен validate_patterns(), ошибок разбора здесь нет
+                fragments[spec['xml']] = compiled = compile_xml_pattern(spec['xml'], name)
+                for fragment in compiled:
+                    fragment.element_template()
+        bundle['files'][key] = {
+            'stamp': stamp,
+            'definitions': definitions,
+            'specs': specs,
+            'fragments': fragments,
+            'dispatch': build_dispatch_table(specs),
+        }
+    return (None if errors else bundle), errors
+
+
+def save_bundle(path, bundle):
+    """
+    Атомарно записывает пакет в path: заголовок и содержимое - два последовательных объекта pickle,
+    чтобы совместимость проверялась до загрузки сохранённых объектов.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.patterns.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(bundle['header'], f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(bundle['files'], f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def load_bundle(path):
+    """
+    Загружает пакет паттернов и оставляет в нём только файлы, не изменившиеся после компиляции.
+
+    :return: tuple (files, stale): files - {абсолютный путь: запись пакета} для актуальных файлов,
+             stale - пути устаревших файлов. ({}, []), если пакета нет; ({}, None), если пакет
+             несовместим с текущим кодом или повреждён.
+    """
+    if not path or not os.path.exists(path):
+        return {}, []
+    try:
+        with open(path, 'rb') as f:
+            if pickle.load(f) != bundle_header():
+                return {}, None
+            content = pickle.load(f)
+    except Exception:
+        return {}, None
+    files = {}
+    stale = []
+    for key, entry in content.items():
+        if source_stamp(key) == entry['stamp']:
+            files[key] = entry
+        else:
+            stale.append(key)
+    return files, stale
@@ -0,0 +1,372 @@
+import re
+import string
+import xml.etree.ElementTree as ET
+from collections.abc import Mapping
+
+from lib.drawio_writer import ElementTemplate
+from lib.filters import PatternFilter
+
+try:
+    import numpy
+except ImportError:  # numpy не обязателен: позиции считаются на Python
+    numpy = None
+
+_FORMATTER = string.Formatter()
+_PLAIN_FIELD = re.compile(r'^[^.\[\]]+$')
+_OBJECT_TAG = re.compile(r'^<object\b[^>]*>')
+
+# Основная ось и направление шага алгоритмов размещения; при переходе на новую колонку/строку
+# вторая ось всегда сдвигается в положительную сторону
+_LAYOUT_ALGOS = {
+    'Y+': ('y', 1),
+    'Y-': ('y', -1),
+    'X+': ('x', 1),
+    'X-': ('x', -1),
+}
+# Группы позиций от этого размера считаются через numpy (если он установлен)
+NUMPY_MIN_POSITIONS = 512
+# Размер первой и максимальной порции позиций LayoutCursor
+CURSOR_BATCH = 16
+CURSOR_MAX_BATCH = 4096
+
+
+class CompiledFragment:
+    """
+    Фрагмент XML паттерна объекта (один элемент верхнего уровня), подготовленный к подстановке значений.
+
+    Текст фрагмента заранее разбит на литералы и слоты подстановки ({field}), поэтому отрисовка объекта
+    сводится к склейке строк без повторного разбора шаблона. Результат render() совпадает
+    с text.format_map(values), в том числе KeyError при отсутствии значения для слота.
+    """
+
+    __slots__ = ('text', 'is_object', 'fields', '_parts', '_element')
+
+    def __init__(self, text, is_object):
+        """
+        :param text: сериализованный элемент паттерна с плейсхолдерами.
+        :param is_object: фрагмент начинается с <object> (данные объекта записываются в его атрибуты).
+        """
+        self.text = text
+        self.is_object = is_object
+        parts = []
+        fields = []
+        for literal, field, spec, conversion in _FORMATTER.parse(text):
+            if literal:
+                parts.append((literal, None, None, None))
+            if field is None:
+                continue
+            if not field or not _PLAIN_FIELD.match(field):
+                # Позиционные и составные поля ({0}, {a.b}, {a[0]}) подставляются через format_map
+                parts = None
+                break
+            parts.append((None, field, spec, conversion))
+            fields.append(field)
+        self._parts = parts
+        self.fields = tuple(dict.fromkeys(fields))
+        self._element = None
+
+    def render(self, values):
+        """
+        :param values: mapping значений слотов (уже экранированных для XML).
+        :return: str фрагмента с подставленными значениями.
+        """
+        if self._parts is None:
+            return self.text.format_map(values)
+        result = []
+        for literal, field, spec, conversion in self._parts:
+            if field is None:
+                result.append(literal)
+                continue
+            value = values[field]
+            if conversion:
+                value = _FORMATTER.convert_field(value, conversion)
+            result.append(format(value, spec) if spec or not isinstance(value, str) else value)
+        return ''.join(result)
+
+
+    def element_template(self):
+        """
+        ElementTemplate фрагмента для DrawioWriter (компилируется при первом обращении).
+        :return: ElementTemplate или None, если плейсхолдеры фрагмента поддерживаются только render().
+        """
+        if self._element is None:
+            try:
+                self._element = ElementTemplate(self.text, record_fields=True)
+            except ValueError:
+                self._element = False
+        return self._element or None
+
+
+def compile_xml_pattern(xml, name):
+    """
+    Разбирает XML паттерна объекта на фрагменты верхнего уровня (как SeafDrawio.get_xml_pattern())
+    и компилирует их.
+
+    :param xml: значение поля xml паттерна.
+    :param name: имя паттерна или объекта для сообщения об ошибке.
+    :return: tuple CompiledFragment; пустой при ошибке разбора XML.
+    """
+    try:
+        root = ET.fromstring(f"<root>{xml}</root>")
+    except ET.ParseError as e:
+        print(f"Ошибка парсинга XML шаблона {name} : {e} ")
+        return ()
+    fragments = []
+    for item in root:
+        text = ET.tostring(item, encoding='unicode')
+        # То же условие, что SeafDrawio.contains_object_tag(text, 'object')
+        fragments.append(CompiledFragment(text, bool(_OBJECT_TAG.search(text))))
+    return tuple(fragments)
+
+
+class PatternSpec(Mapping):
+    """
+    Неизменяемый паттерн из data/patterns/*.yaml (схема, XML, фильтры, начальная позиция, алгоритм размещения).
+
+    Загружается один раз на процесс и используется всеми страницами без копирования; изменяемое
+    состояние размещения страницы хранится в LayoutCursor. Вложенные значения (списки фильтров,
+    словари стилей) общие и не должны изменяться.
+    """
+
+    __slots__ = ('name', '_data', '_filter')
+
+    def __init__(self, name, data):
+        self.name = name
+        self._data = data
+        self._filter = None
+
+    @property
+    def filter(self):
+        """PatternFilter правил отбора паттерна (компилируется при первом обращении)."""
+        if self._filter is None:
+            self._filter = PatternFilter(self._data, self.name)
+        return self._filter
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.name!r})'
+
+
+def build_pattern_specs(definitions):
+    """
+    :param definitions: разобранный файл паттернов {name: dict}.
+    :return: dict {name: PatternSpec}; значения, не являющиеся словарями, сохраняются как есть.
+    """
+    return {name: PatternSpec(name, value) if isinstance(value, dict) else value
+            for name, value in (definitions or {}).items()}
+
+
+def _step_position(algo, x, y, count, w, h, offset, deep):
+    """
+    Один шаг алгоритма размещения (используется, когда значения не целые и закрытая формула
+    может разойтись с последовательным сложением в младших разрядах float).
+    """
+    def wrapped():
+        new_count = count + 1
+        if new_count == deep:
+            new_count = 0
+        return new_count, not bool(new_count)
+
+    match algo:
+        # По оси Y cверху вниз относительно родительского объекта
+        case 'Y+':
+            count, wrap = wrapped()
+            if wrap:
+                x = x + w + offset
+                y = y - (h + offset) * deep
+            y = y + h + offset
+        case 'Y-':
+            count, wrap = wrapped()
+            if wrap:
+                x = x + w + offset
+                y = y + (h + offset) * deep
+            y = y - h - offset
+        case 'X-':
+            count, wrap = wrapped()
+            if wrap:
+                y = y + h + offset
+                x = x + (w + offset) * deep
+            x = x - w - offset
+        # По оси X слева направо
+        case 'X+':
+            count, wrap = wrapped()
+            if wrap:
+                y = y + h + offset
+                x = x - (w + offset) * deep
+            x = x + w + offset
+    return x, y, count
+
+
+def _is_int(*values):
+    return all(type(value) is int for value in values)
+
+
+def layout_positions(spec, x, y, count, n):
+    """
+    Позиции n следующих объектов паттерна в одном контейнере.
+
+    Результат совпадает с n последовательными шагами алгоритма spec['algo'] (Y+, Y-, X+, X-; остальные
+    значения не сдвигают позицию): по оси алгоритма объекты идут с шагом w/h + offset, после deep
+    объектов начинается новая колонка или строка. Для целых координат и размеров позиции вычисляются
+    по закрытой формуле (для больших групп через numpy, если он установлен), иначе шаг за шагом.
+
+    :param spec: паттерн (algo, w, h, offset, deep).
+    :param x, y, count: текущая позиция и счётчик объектов в колонке/строке.
+    :param n: количество шагов.
+    :return: list из n кортежей (x, y, count) - состояние после каждого шага.
+    """
+    algo = spec.get('algo')
+    if algo not in _LAYOUT_ALGOS:
+        return [(x, y, count)] * n
+    w, h, offset, deep = spec['w'], spec['h'], spec['offset'], spec['deep']
+    if not (_is_int(x, y, count, w, h, offset, deep) and 0 <= count and (deep <= 0 or count < deep)):
+        positions = []
+        for _ in range(n):
+            x, y, count = _step_position(algo, x, y, count, w, h, offset, deep)
+            positions.append((x, y, count))
+        return positions
+
+    axis, sign = _LAYOUT_ALGOS[algo]
+    step, cross = (h + offset, w + offset) if axis == 'y' else (w + offset, h + offset)
+    # При deep <= 0 счётчик никогда не равен deep и перехода на новую колонку/строку нет
+    period = deep if deep > 0 else None
+
+    if numpy is not None and n >= NUMPY_MIN_POSITIONS:
+        total = numpy.arange(count + 1, count + n + 1, dtype=numpy.int64)
+        if period:
+            wraps, counts = numpy.divmod(total, period)
+            along = sign * step * (total - count - wraps * period)
+        else:
+            wraps, counts = numpy.zeros_like(total), total
+            along = sign * step * (total - count)
+        moved = cross * wraps
+        xs, ys = (x + moved, y + along) if axis == 'y' else (x + along, y + moved)
+        return list(zip(xs.tolist(), ys.tolist(), counts.tolist()))
+
+    positions = []
+    for i in range(1, n + 1):
+        total = count + i
+        if period:
+            wraps, current = divmod(total, period)
+        else:
+            wraps, current = 0, total
+        along = sign * step * (i - wraps * period if period else i)
+        moved = cross * wraps
+        positions.append((x + moved, y + along, current) if axis == 'y' else (x + along, y + moved, current))
+    return positions
+
+
+class LayoutCursor:
+    """
+    Состояние размещения объектов одного паттерна на странице: текущие координаты, счётчик объектов
+    в ряду/колонке, последний родитель и сохранённые позиции по контейнерам (parent_key).
+
+    Начальные значения берутся из PatternSpec. reset() возвращает курсор к ним при смене родителя;
+    после первого сброса словарь сохранённых позиций общий с исходным состоянием курсора, поэтому
+    позиции, сохранённые после сброса, доступны при следующих сменах родителя.
+
+    plan() задаёт число объектов паттерна в каждом контейнере: при входе в контейнер (reset(),
+    restore_position()) позиции всех его оставшихся объектов вычисляются одним вызовом layout_positions(),
+    advance() только берёт очередную. Если объектов больше запланированного, следующие позиции
+    вычисляются порциями. Позиция контейнера сохраняется один раз, при выходе из него.
+    """
+
+    __slots__ = ('spec', 'x', 'y', 'count', 'last_parent', 'last_parent_type', 'parent', 'positions',
+                 '_initial_positions', '_batch', '_step', '_batch_size', '_planned', '_run', '_moved')
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.x = spec.get('x')
+        self.y = spec.get('y')
+        self.count = 0
+        self.last_parent = ''
+        self.last_parent_type = ''
+        self.parent = ''
+        self.positions = {}
+        self._initial_positions = {}
+        self._planned = {}
+        self._moved = False
+        self._new_batch('')
+
+    def plan(self, counts):
+        """
+        :param counts: dict {ключ run (см. reset()): число объектов}; '' - объекты, размещаемые
+                       без смены контейнера (паттерны без parent_id, global_positioning, network_connection).
+        """
+        self._planned = dict(counts)
+
+    def reset(self, parent, run=None):
+        """
+        Возвращает координаты и счётчик к начальным значениям паттерна для нового контейнера parent.
+        run - ключ plan() для объектов, размещаемых до следующей смены контейнера (по умолчанию parent).
+        """
+        self.store_position()
+        self.x = self.spec.get('x')
+        self.y = self.spec.get('y')
+        self.count = 0
+        self.last_parent = ''
+        self.last_parent_type = ''
+        self.parent = parent
+        self.positions = self._initial_positions
+        self._new_batch(parent if run is None else run)
+
+    def set_parent(self, parent):
+        """Делает parent текущим контейнером, сохраняя позицию предыдущего."""
+        if parent != self.parent:
+            self.store_position()
+            self.parent = parent
+
+    def advance(self):
+        """Переходит к позиции следующего объекта по алгоритму паттерна (algo, deep, offset, w, h)."""
+        if self._step >= len(self._batch):
+            size = self._planned.get(self._run, 0)
+            if size <= 0:
+                size = self._batch_size
+                self._batch_size = min(self._batch_size * 2, CURSOR_MAX_BATCH)
+            self._batch = layout_positions(self.spec, self.x, self.y, self.count, size)
+            self._step = 0
+        self.x, self.y, self.count = self._batch[self._step]
+        self._step += 1
+        if self._run in self._planned:
+            self._planned[self._run] -= 1
+
+    def _new_batch(self, run):
+        self._batch = ()
+        self._step = 0
+        self._batch_size = CURSOR_BATCH
+        self._run = run
+
+    def save_position(self):
+        """Отмечает, что в текущем контейнере размещён объект: позиция сохранится при выходе из контейнера."""
+        if self.parent:
+            self._moved = True
+
+    def store_position(self):
+        """Сохраняет позицию текущего контейнера parent, если в нём размещались объекты."""
+        if self._moved:
+            self.positions[self.parent] = (self.x, self.y, self.count)
+            self._moved = False
+
+    def restore_position(self, parent, run=None):
+        """Восстанавливает позицию, сохранённую для контейнера parent; False, если её нет. run - как в reset()."""
+        self.store_position()
+        saved = self.positions.get(parent)
+        if saved is None:
+            return False
+        self.x, self.y, self.count = saved
+        self._new_batch(parent if run is None else run)
+        return True
@@ -6,10 +6,48 @@ import re
 import os
 import argparse
 from copy import deepcopy
+from types import MappingProxyType
+from collections.abc import Mapping, Hashable
 from N2G import drawio_diagram
 import xml.etree.ElementTree as ET
 import xml.sax.saxutils as saxutils
 from deepmerge import Merger
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from lib.parse_cache import ParseCache
+from lib.lazy_store import LazyDataStore, scan_yaml_keys_cached
+from lib.patterns import compile_xml_pattern, build_pattern_specs
+from lib.dispatch import build_dispatch_table
+from lib.pattern_bundle import load_bundle
+from lib.compact_records import RecordCompactor, thaw_objects
+
+
+def _parse_yaml_file(filename, cache=None):
+    """
+    Разбирает один YAML-файл данных. Выполняется как в основном процессе,
+    так и в пуле процессов, поэтому не печатает и не завершает программу сам.
+
+    :param filename: путь к YAML-файлу.
+    :param cache: ParseCache для повторного использования результата разбора неизменённого файла.
+    :return: tuple (filename, data, error), где error - None, ('yaml', текст) или ('io', OSError).
+    """
+    key = cache.key_for(filename, 'safe_load') if cache else None
+    if key:
+        hit, data = cache.get(key)
+        if hit:
+            return filename, data, None
+    try:
+        with open(filename, 'r', encoding='utf-8') as f:
+            try:
+                data = yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                return filename, None, ('yaml', str(e))
+    except IOError as e:
+        return filename, None, ('io', e)
+    if key:
+        cache.put(key, data)
+    return filename, data, None
+
 
 class SeafDrawio:
 
@@ -20,8 +58,20 @@ class SeafDrawio:
         """
         self.default_config = default_config
         self._yaml_cache = {}
+        self._source_files = {}
         self._pattern_cache = {}
+        self._pattern_specs = {}
+        self._compiled_patterns = {}
+        self._dispatch_tables = {}
         self._object_cache = {}
+        self._oid_index = {}
+        self._view_cache = {}
+        self._attribute_index = {}
+        self._parent_candidates = {}
+        self.parse_workers = 1
+        self.parse_cache = None
+        self.lazy_load = False
+        self.record_compactor = None
 
     def load_config(self, config_file):
         """
@@ -63,6 +113,29 @@ class SeafDrawio:
                 default[key] = value
         return default
 
+    def configure_parse_cache(self, config):
+        """
+        Включает дисковый кэш разобранных YAML-файлов по настройкам секции конфигурации
+        (parse_cache, parse_cache_dir, parse_cache_max_mb).
+        :param config: Секция конфигурации скрипта.
+        """
+        self.parse_cache = ParseCache.from_config(config)
+
+    def configure_compact_records(self, enabled, schema_file=None):
+        """
+        Включает компактное хранение записей (CompactRecord) для загружаемых данных.
+        Раскладки полей заранее заполняются из файла схем SEAF, если он доступен.
+        :param enabled: включить компактные записи.
+        :param schema_file: путь к data/seaf_schema.yaml.
+        """
+        if not enabled:
+            self.record_compactor = None
+            return
+        schema_fields = None
+        if schema_file and os.path.isfile(schema_file):
+            schema_fields = {schema: list(fields) for schema, fields in self.get_json_schemas(schema_file).items()}
+        self.record_compactor = RecordCompactor(schema_fields)
+
     def _normalize_files(self, files):
         """Normalize single path or iterable of paths into a tuple key for caching."""
         if isinstance(files, str):
@@ -70,12 +143,113 @@ class SeafDrawio:
         return tuple(files)
 
     def get_merged_yaml(self, files):
-        """Return merged YAML content from cache (loads once per path set)."""
+        """
+        Return merged YAML content from cache (loads once per path set).
+        With lazy_load the result is a LazyDataStore that parses files on first access to their schemas.
+        """
         key = self._normalize_files(files)
         if key not in self._yaml_cache:
-            self._yaml_cache[key] = self.read_and_merge_yaml(list(key))
+            self._source_files[key] = self.expand_yaml_paths(list(key))
+            if self.lazy_load:
+                self._yaml_cache[key] = self.open_lazy_store(list(key))
+            else:
+                self._yaml_cache[key] = self.read_and_merge_yaml(list(key), workers=self.parse_workers,
+                                                                 cache=self.parse_cache)
+                if self.record_compactor:
+                    self.record_compactor.compact_store(self._yaml_cache[key])
+                self._oid_index[key] = self.build_oid_index(self._yaml_cache[key])
         return self._yaml_cache[key]
 
+    def invalidate_files(self, changed):
+        """
+        Сбрасывает кэши, зависящие от изменённых файлов (режим наблюдения seaf2drawio.py --watch).
+
+        Для файлов паттернов сбрасывается их разобранный вид. Для данных при lazy_load (seaf2drawio.py --watch
+        включает его всегда) сбрасываются только схемы, встречающиеся в изменённых файлах, и построенные
+        по ним выборки и индексы; без lazy_load объединённые данные загружаются заново (неизменённые
+        файлы - из parse_cache, если он включён).
+
+        :param changed: пути изменённых, добавленных или удалённых файлов.
+        :return: dict {набор путей данных: set сброшенных схем или None, если данные сброшены целиком}.
+        """
+        changed = {os.path.abspath(path) for path in changed}
+        for key in [key for key in self._pattern_cache if key in changed]:
+            del self._pattern_cache[key]
+            self._pattern_specs.pop(key, None)
+            self._dispatch_tables.pop(key, None)
+
+        result = {}
+        for key, store in list(self._yaml_cache.items()):
+            files = self.expand_yaml_paths(list(key))
+            relevant = [path for path in sorted(set(files) | set(self._source_files.get(key, ())))
+                        if os.path.abspath(path) in changed]
+            if not relevant:
+                continue
+            schemas = store.invalidate(relevant, files) if isinstance(store, LazyDataStore) else None
+            if schemas is None:
+                del self._yaml_cache[key]
+            else:
+                self._source_files[key] = files
+            self._oid_index.pop(key, None)
+            for cache in (self._object_cache, self._view_cache, self._attribute_index, self._parent_candidates):
+                for cache_key in [k for k in cache if k[0] == key and (schemas is None or k[1] in schemas)]:
+                    del cache[cache_key]
+            result[key] = schemas
+        return result
+
+    @staticmethod
+    def build_oid_index(data):
+        """
+        Строит индекс OID -> (schema, record) по объединённому хранилищу данных.
+        При совпадении OID в нескольких схемах остаётся первая по порядку схема,
+        как и при рекурсивном поиске find_value_by_key.
+
+        :param data: dict - объединённый YAML-документ {schema: {OID: record}}
+        :return: dict - {OID: (schema, record)}
+        """
+        index = {}
+        if not isinstance(data, Mapping):
+            return index
+        for schema, objects in data.items():
+            if not isinstance(objects, dict):
+                continue
+            for oid, record in objects.items():
+                if oid not in index:
+                    index[oid] = (schema, record)
+        return index
+
+    def get_oid_index(self, files):
+        """Return OID -> (schema, record) index for the merged data of given path set."""
+        key = self._normalize_files(files)
+        merged = self.get_merged_yaml(files)
+        if key not in self._oid_index:
+            self._oid_index[key] = self.build_oid_index(merged)
+        return self._oid_index[key]
+
+    def find_object_by_oid(self, files, oid, schema=None):
+        """
+        Возвращает запись объекта по OID за O(1) без рекурсивного обхода данных.
+        Запись не копируется: вызывающий код не должен её изменять.
+
+        :param files: путь или список путей к данным SEAF.
+        :param oid: идентификатор объекта.
+        :param schema: если указан, объект ищется только в этой схеме.
+        :return: dict записи объекта или None.
+        """
+        if not oid:
+            return None
+        if schema:
+            objects = self.get_merged_yaml(files).get(schema)
+            record = objects.get(oid) if isinstance(objects, dict) else None
+        else:
+            merged = self.get_merged_yaml(files)
+            if isinstance(merged, LazyDataStore):
+                entry = merged.find_oid(oid)
+            else:
+                entry = self.get_oid_index(files).get(oid)
+            record = entry[1] if entry else None
+        return record if isinstance(record, Mapping) else None
+
     def escape_xml_recursive(self, data):
         """
         Рекурсивно экранирует специальные символы XML в строках.
@@ -101,9 +275,28 @@ class SeafDrawio:
         Если передан путь к директории, загружает все .yaml/.yml файлы из неё (рекурсивно).
 
         :param files: Путь к одному файлу/директории (str) или список путей (list)
+        :param kwargs['workers']: число процессов для разбора файлов (1 - последовательно, 0 - по числу CPU).
+            Результаты сливаются в отсортированном порядке файлов независимо от числа процессов.
+        :param kwargs['cache']: ParseCache для повторного использования разобранных неизменённых файлов.
         :return: dict - объединённый YAML-документ
         """
 
+        merger = SeafDrawio.data_merger()
+        merged_data = {}
+        for _, data in SeafDrawio.iter_yaml_data(SeafDrawio.expand_yaml_paths(files), **kwargs):
+            # Выполняем глубокое слияние
+            merger.merge(merged_data, data)
+
+        return merged_data
+
+    @staticmethod
+    def expand_yaml_paths(files):
+        """
+        Разворачивает пути к файлам и директориям в отсортированный список YAML-файлов (порядок слияния).
+
+        :param files: Путь к одному файлу/директории (str) или список путей (list)
+        :return: list - пути к файлам
+        """
         # Поддержка одного файла как строки
         if isinstance(files, str):
             files = [files]
@@ -123,47 +316,111 @@ class SeafDrawio:
                 expanded_files.append(path)
         
         # Сортируем файлы для гарантированного порядка слияния
-        files = sorted(expanded_files)
+        return sorted(expanded_files)
 
-        # Настройка слияния: работает с dict и списками
-        merger = Merger(
+    @staticmethod
+    def data_merger():
+        """Настройка слияния данных SEAF: работает с dict и списками."""
+        return Merger(
             [(dict, ["merge"]), (list, ["prepend"])],  # Например, можно использовать extend, prepend, append
             ["override"],
             []
         )
 
-        merged_data = {}
+    @staticmethod
+    def iter_yaml_data(files, **kwargs):
+        """
+        Разбирает YAML-файлы данных и выдаёт (filename, data) в порядке files.
+        Пустые файлы, файлы с ошибками YAML и файлы, содержащие не словарь, пропускаются с сообщением.
 
-        for filename in files:
-            try:
-                with open(filename, 'r', encoding='utf-8') as f:
-                    try:
-                        data = yaml.safe_load(f)
-                        if data is None:
-                            print(f"Файл {filename} пустой.")
-                            continue
-                        if not isinstance(data, dict):
-                            print(f"Файл {filename} содержит не словарь. Пропускаем.")
-                            continue
-
-                        # Выполняем глубокое слияние
-                        merger.merge(merged_data, data)
-
-                    except yaml.YAMLError as e:
-                        print(f"Ошибка YAML в файле {filename}: {e}")
-            except IOError as e:
-                print(f"I/O ошибка({e.errno}): {e.strerror} : {filename}")
-                sys.exit(1)
+        :param files: список путей к файлам.
+        :param kwargs['workers']: число процессов для разбора файлов.
+        :param kwargs['cache']: ParseCache или None.
+        """
+        workers = SeafDrawio.resolve_workers(kwargs.get('workers'), len(files))
+        parse = partial(_parse_yaml_file, cache=kwargs.get('cache'))
+        for filename, data, error in SeafDrawio._parse_yaml_files(files, workers, parse):
+            if error is not None:
+                kind, detail = error
+                if kind == 'io':
+                    print(f"I/O ошибка({detail.errno}): {detail.strerror} : {filename}")
+                    sys.exit(1)
+                print(f"Ошибка YAML в файле {filename}: {detail}")
+                continue
+            if data is None:
+                print(f"Файл {filename} пустой.")
+                continue
+            if not isinstance(data, dict):
+                print(f"Файл {filename} содержит не словарь. Пропускаем.")
+                continue
+            yield filename, data
 
-        return merged_data
+    def open_lazy_store(self, files):
+        """
+        Создаёт LazyDataStore: файлы сканируются сразу, а разбираются только при обращении к их схемам.
+
+        :param files: Путь к одному файлу/директории (str) или список путей (list)
+        :return: LazyDataStore
+        """
+        return LazyDataStore(
+            self.expand_yaml_paths(files),
+            partial(self.iter_yaml_data, workers=self.parse_workers, cache=self.parse_cache),
+            self.data_merger().merge,
+            partial(scan_yaml_keys_cached, cache=self.parse_cache),
+            self.record_compactor.compact_objects if self.record_compactor else None,
+        )
+
+    @staticmethod
+    def resolve_workers(workers, jobs):
+        """
+        Приводит настройку числа процессов к фактическому значению.
+
+        :param workers: значение из конфигурации (None/1 - последовательно, 0 или меньше - по числу CPU).
+        :param jobs: количество заданий; процессов не запускается больше, чем заданий.
+        :return: int - число процессов (1 означает разбор в текущем процессе).
+        """
+        try:
+            workers = int(workers if workers is not None else 1)
+        except (TypeError, ValueError):
+            workers = 1
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        return max(1, min(workers, jobs))
+
+    @staticmethod
+    def _parse_yaml_files(files, workers, parse=_parse_yaml_file):
+        """Yield (filename, data, error) for files in the given order, in a process pool when workers > 1."""
+        if workers > 1:
+            pool = None
+            try:
+                pool = ProcessPoolExecutor(max_workers=workers)
+                results = pool.map(parse, files)
+            except (OSError, NotImplementedError) as e:
+                if pool is not None:
+                    pool.shutdown(cancel_futures=True)
+                print(f"WARNING: параллельный разбор YAML недоступен ({e}), файлы читаются последовательно.")
+            else:
+                with pool:
+                    yield from results
+                return
+        for filename in files:
+            yield parse(filename)
 
     @staticmethod
     def read_yaml_file(file, **kwargs):
+        cache = kwargs.get('cache')
+        key = cache.key_for(file, 'safe_load_all:first') if cache else None
+        if key:
+            hit, doc = cache.get(key)
+            if hit:
+                return doc
         try:
             with open(file, 'r', encoding='utf-8') as file:
                 try:
                     docs = yaml.safe_load_all(file)
                     for doc in docs:
+                        if key:
+                            cache.put(key, doc)
                         return doc
 
                 except yaml.YAMLError as e:
@@ -177,9 +434,45 @@ class SeafDrawio:
         """Load pattern YAML once and return a deepcopy for safe reuse."""
         key = os.path.abspath(file)
         if key not in self._pattern_cache:
-            self._pattern_cache[key] = self.read_yaml_file(file)
+            self._pattern_cache[key] = self.read_yaml_file(file, cache=self.parse_cache)
         return deepcopy(self._pattern_cache[key])
 
+    def get_pattern_specs(self, file):
+        """
+        Возвращает паттерны файла как неизменяемые PatternSpec {name: PatternSpec}.
+        Словарь строится один раз и используется всеми страницами без копирования.
+        """
+        key = os.path.abspath(file)
+        if key not in self._pattern_specs:
+            if key not in self._pattern_cache:
+                self._pattern_cache[key] = self.read_yaml_file(file, cache=self.parse_cache)
+            self._pattern_specs[key] = build_pattern_specs(self._pattern_cache[key])
+        return self._pattern_specs[key]
+
+    def get_dispatch_table(self, file):
+        """Таблица распределения паттернов файла по схемам и type (lib.dispatch.build_dispatch_table)."""
+        key = os.path.abspath(file)
+        if key not in self._dispatch_tables:
+            self._dispatch_tables[key] = build_dispatch_table(self.get_pattern_specs(file))
+        return self._dispatch_tables[key]
+
+    def load_pattern_bundle(self, path):
+        """
+        Подключает пакет паттернов (compile_patterns.py): разобранные файлы паттернов, PatternSpec
+        с фильтрами, скомпилированные фрагменты XML и таблицы распределения берутся из пакета.
+        Файлы, изменённые после компиляции пакета, читаются из YAML как обычно.
+
+        :param path: путь к пакету.
+        :return: tuple (число файлов из пакета, устаревшие файлы или None, если пакет несовместим).
+        """
+        files, stale = load_bundle(path)
+        for key, entry in files.items():
+            self._pattern_cache[key] = entry['definitions']
+            self._pattern_specs[key] = entry['specs']
+            self._dispatch_tables[key] = entry['dispatch']
+            self._compiled_patterns.update(entry['fragments'])
+        return len(files), stale
+
 
     @staticmethod
     def append_to_dict(d, key, value):
@@ -202,15 +495,15 @@ class SeafDrawio:
         :return: A list of values associated with the target key.
         """
         results = []
-        # If the current data is a dictionary
-        if isinstance(data, dict):
+        # If the current data is a dictionary (or read-only mapping view)
+        if isinstance(data, Mapping):
             for key, value in data.items():
                 if key == target_key:
                     if isinstance(value, list) and len(value) > 0:  # Если в качестве parent_id указан список выбираем 1 элемент
                         return value
                     else:
                         results.append(value)  # Add the value if the key matches
-                if isinstance(value, dict):
+                if isinstance(value, Mapping):
                     results.extend(self.find_key_value(value, target_key))  # Recurse into nested structures
 
         # If the current data is a list
@@ -228,7 +521,7 @@ class SeafDrawio:
         :param target_key: The key to search for
         :return: The value associated with the target_key, or None if not found
         """
-        if isinstance(data, dict):  # If the current item is a dictionary
+        if isinstance(data, Mapping):  # If the current item is a dictionary
             if target_key in data:  # Check if the target_key exists in this dictionary
                 if isinstance(data[target_key], list) and len(data[target_key])>0:
                     return data[target_key][0]
@@ -288,6 +581,21 @@ class SeafDrawio:
 
             return result
 
+    def get_compiled_pattern(self, xml, name):
+        """
+        Возвращает скомпилированные фрагменты XML паттерна объекта (lib.patterns.CompiledFragment).
+        Шаблон разбирается один раз на каждое значение xml; фрагменты те же, что у get_xml_pattern().
+
+        :param xml: objects pattern.
+        :param name: name of current pattern (for error message).
+        :return: tuple of CompiledFragment.
+        """
+        fragments = self._compiled_patterns.get(xml)
+        if fragments is None:
+            fragments = compile_xml_pattern(xml, name)
+            self._compiled_patterns[xml] = fragments
+        return fragments
+
     @staticmethod
     def list_contain(l, s):
         """
@@ -314,7 +622,8 @@ class SeafDrawio:
         Args:
             l1 (list or str): The input to check elements from.
                               If string, treated as a sequence of characters.
-            l2 (list): The list in which to look for elements from l1.
+            l2 (list or set): The collection in which to look for elements from l1.
+                              A set makes each check O(1); l1 must then contain only hashable items.
 
         Returns:
             any: The first element from l1 found in l2.
@@ -343,6 +652,72 @@ class SeafDrawio:
         return False
 
 
+    def get_parent_candidates(self, file, key, oid, record, field):
+        """
+        Возвращает кандидатов в родители объекта: значения поля field записи (как find_key_value()).
+        Список вычисляется один раз на объект и кэшируется по (данные, схема, поле); нехэшируемые
+        значения отбрасываются, поэтому результат можно проверять по множеству ID страницы
+        через find_common_element(). Возвращаемый список не должен изменяться.
+
+        :param file: путь или список путей к данным SEAF.
+        :param key: имя схемы объекта.
+        :param oid: OID объекта.
+        :param record: запись объекта.
+        :param field: поле ссылки на родителя (parent_id паттерна).
+        :return: list кандидатов в порядке find_key_value().
+        """
+        cache = self._parent_candidates.setdefault((self._normalize_files(file), key, field), {})
+        candidates = cache.get(oid)
+        if candidates is None:
+            candidates = [value for value in self.find_key_value(record, field) if isinstance(value, Hashable)]
+            cache[oid] = candidates
+        return candidates
+
+    def get_attribute_index(self, file, key, field):
+        """
+        Возвращает вторичный индекс схемы по полю: {первое значение поля: [OID, ...]}.
+        Индекс строится один раз при первом обращении; OID перечислены в порядке записей схемы.
+        Первое значение определяется так же, как в фильтре type: первым элементом find_key_value().
+
+        :param file: путь или список путей к данным SEAF.
+        :param key: имя схемы.
+        :param field: имя поля (например, 'type' или 'zone').
+        :return: dict {value: [OID, ...]}.
+        """
+        index_key = (self._normalize_files(file), key, field)
+        index = self._attribute_index.get(index_key)
+        if index is not None:
+            return index
+
+        index = {}
+        source = self.get_merged_yaml(file).get(key)
+        if isinstance(source, Mapping):
+            for oid, record in source.items():
+                values = self.find_key_value(record, field)
+                if not values:
+                    continue
+                try:
+                    index.setdefault(values[0], []).append(oid)
+                except TypeError:
+                    # Нехэшируемое значение (список/словарь) не может совпасть со строкой фильтра
+                    continue
+        self._attribute_index[index_key] = index
+        return index
+
+    @staticmethod
+    def _readonly_view(objects):
+        """
+        Оборачивает {OID: record} в неизменяемые представления без копирования записей.
+        Вложенные списки и словари внутри записей не копируются и не должны изменяться.
+        CompactRecord уже неизменяемы и возвращаются как есть.
+        """
+        if not isinstance(objects, dict):
+            return objects
+        return MappingProxyType({
+            oid: MappingProxyType(record) if isinstance(record, dict) else record
+            for oid, record in objects.items()
+        })
+
     def get_object(self, file, key, **kwargs):
         """
             Get JSON leave from file by key
@@ -350,12 +725,15 @@ class SeafDrawio:
             :param file: input file name.
             :param key: key for finding sub JSON.
             :param kwargs['type'] find json which contain value in key, kwargs['sort'] sorting by key
+            :param kwargs['readonly'] return shared read-only mapping views instead of a deep copy.
+                Callers that need to modify a record must copy it explicitly (e.g. dict(record)).
             :return: json object.
         """
         cache_key = (self._normalize_files(file), key, kwargs.get('type'), kwargs.get('sort'))
+        readonly = kwargs.get('readonly', False)
         try:
             if cache_key in self._object_cache:
-                return deepcopy(self._object_cache[cache_key])
+                return self._object_result(cache_key, readonly)
 
             merged = self.get_merged_yaml(file)
             if key not in merged:
@@ -371,28 +749,45 @@ class SeafDrawio:
                 else:
                     k1, v1 = 'type', kwargs['type']
 
-                r = {k2: v2 for k2, v2 in source.items() if self.list_contain(self.find_key_value(v2, k1), v1)}
+                index = self.get_attribute_index(file, key, k1)
+                r = {oid: source[oid] for oid in index.get(v1, ())}
 
-                if kwargs.get('sort'):
-                    try:
-                        sorted_r = dict(sorted(r.items(), key=lambda item: self.find_value_by_key(item[1], kwargs["sort"])))
-                        result = sorted_r
-                    except TypeError:
-                        print(
-                            f" INFO: ??? ?????????? ????????: '{key}' ??????? ?? ?????????? ????????: '{kwargs.get('sort')}'")
-                        result = r
-                else:
-                    result = r
+                result = self.sort_objects(r, key, kwargs['sort']) if kwargs.get('sort') else r
             else:
                 result = source
 
-            # Cache deep copy to keep pristine data for reuse
-            self._object_cache[cache_key] = deepcopy(result)
-            return deepcopy(result)
+            # Cached result shares records with the merged data: it is never handed out
+            # directly, only as a deep copy or as a read-only view.
+            self._object_cache[cache_key] = result
+            return self._object_result(cache_key, readonly)
         except KeyError as e:
             self._object_cache[cache_key] = {}
             return {}
 
+    def sort_objects(self, objects, key, sort):
+        """
+        Сортирует выборку {OID: record} по значению поля sort (find_value_by_key), как get_object(sort=...).
+
+        :param objects: dict {OID: record}.
+        :param key: имя схемы (для сообщения).
+        :param sort: имя поля сортировки.
+        :return: dict в порядке сортировки или исходный objects, если значения несравнимы.
+        """
+        try:
+            return dict(sorted(objects.items(), key=lambda item: self.find_value_by_key(item[1], sort)))
+        except TypeError:
+            print(
+                f" INFO: ??? ?????????? ????????: '{key}' ??????? ?? ?????????? ????????: '{sort}'")
+            return objects
+
+    def _object_result(self, cache_key, readonly):
+        """Return cached get_object() result as a read-only view or as a private deep copy."""
+        if not readonly:
+            return deepcopy(thaw_objects(self._object_cache[cache_key]))
+        if cache_key not in self._view_cache:
+            self._view_cache[cache_key] = self._readonly_view(self._object_cache[cache_key])
+        return self._view_cache[cache_key]
+
 
     @staticmethod
     def create_validator(pattern):
@@ -692,7 +1087,7 @@ class SeafDrawio:
             """
 
         # Извлекаем схемы объектов SEAF
-        schemas = self.read_yaml_file(schema_file)
+        schemas = self.read_yaml_file(schema_file, cache=self.parse_cache)
         # Выделить базовые компоненты для services/components
         entity = schemas.pop('seaf.ta.services.entity')['schema']['$defs'] | \
                  schemas.pop('seaf.ta.components.entity')['schema']['$defs']
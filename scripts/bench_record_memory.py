@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Compare memory used by SEAF records stored as plain dicts and as CompactRecord."""
+import argparse
+import os
+import sys
+import time
+
+# Adjust path to import lib
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from lib.seaf_drawio import SeafDrawio
+from lib.compact_records import RecordCompactor
+
+DEFAULT_SCHEMAS = (
+    'seaf.company.ta.components.servers',
+    'seaf.company.ta.components.networks',
+    'seaf.company.ta.components.k8s_nodes',
+)
+
+
+def deep_size(value, seen):
+    """Size of value and everything it references, counting each object once."""
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += deep_size(key, seen) + deep_size(item, seen)
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            size += deep_size(item, seen)
+    elif hasattr(value, '__slots__'):
+        for slot in type(value).__slots__:
+            if hasattr(value, slot):
+                size += deep_size(getattr(value, slot), seen)
+    return size
+
+
+def clone(value):
+    """Copy parsed data with fresh string objects, as a separate YAML document would have."""
+    if isinstance(value, str):
+        return value.encode('utf-8').decode('utf-8')
+    if isinstance(value, dict):
+        return {clone(key): clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [clone(item) for item in value]
+    return value
+
+
+def scale_objects(objects, factor):
+    if factor <= 1 or not isinstance(objects, dict):
+        return objects
+    scaled = {}
+    for copy_no in range(factor):
+        for oid, record in objects.items():
+            scaled[f'{oid}.{copy_no}' if copy_no else oid] = clone(record)
+    return scaled
+
+
+def measure(objects):
+    seen = set()
+    # The container itself is the same in both layouts and is not part of the per-record cost
+    seen.add(id(objects))
+    return sum(deep_size(record, seen) + deep_size(oid, seen) for oid, record in objects.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report bytes per object for dict and compact record storage")
+    parser.add_argument("-s", "--src", nargs='+', default=None,
+                        help="YAML data files or directories (default: data_yaml_file from config.yaml)")
+    parser.add_argument("--schema", action='append', default=None,
+                        help="schema to measure (repeatable, default: servers, networks, k8s nodes)")
+    parser.add_argument("--schema-file", default='data/seaf_schema.yaml', help="SEAF schema file used to seed layouts")
+    parser.add_argument("--scale", type=int, default=1, help="replicate records N times to emulate a large inventory")
+    args = parser.parse_args()
+
+    d = SeafDrawio({'seaf2drawio': {'data_yaml_file': ['data/example/']}})
+    src = args.src or d.load_config('config.yaml')['seaf2drawio']['data_yaml_file']
+    data = SeafDrawio.read_and_merge_yaml(src)
+    schema_fields = None
+    if os.path.isfile(args.schema_file):
+        schema_fields = {schema: list(fields) for schema, fields in d.get_json_schemas(args.schema_file).items()}
+    compactor = RecordCompactor(schema_fields)
+
+    print(f"{'schema':<45} {'objects':>8} {'dict B/obj':>11} {'compact B/obj':>14} {'saved':>7} {'compact s':>10}")
+    total_plain = total_compact = total_count = 0
+    for schema in args.schema or DEFAULT_SCHEMAS:
+        objects = scale_objects(data.get(schema), args.scale)
+        if not isinstance(objects, dict) or not objects:
+            print(f"{schema:<45} {'-':>8}")
+            continue
+        plain = measure(objects)
+        compact_objects = dict(objects)
+        started = time.perf_counter()
+        compactor.compact_objects(compact_objects)
+        elapsed = time.perf_counter() - started
+        compact = measure(compact_objects)
+        count = len(objects)
+        total_plain += plain
+        total_compact += compact
+        total_count += count
+        print(f"{schema:<45} {count:>8} {plain / count:>11.0f} {compact / count:>14.0f} "
+              f"{100 * (plain - compact) / plain:>6.1f}% {elapsed:>10.4f}")
+    if total_count:
+        print(f"{'total':<45} {total_count:>8} {total_plain / total_count:>11.0f} {total_compact / total_count:>14.0f} "
+              f"{100 * (total_plain - total_compact) / total_plain:>6.1f}%")
+
+
+if __name__ == "__main__":
+    main()
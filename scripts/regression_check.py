@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Check that every build mode of seaf2drawio.py writes the same file as a plain full build."""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_EDIT = 'data/example/compute_service.yaml'
+# Modes that must match the plain build byte for byte, log included
+PLAIN_MODES = (
+    ('default', []),
+    ('page-workers 4', ['--page-workers', '4']),
+    ('parse-workers 4', ['--parse-workers', '4']),
+    ('drawio-writer native', ['--drawio-writer', 'native']),
+)
+
+
+class Checker:
+    def __init__(self, tree):
+        self.tree = tree
+        self.failed = []
+
+    def build(self, dst, *flags):
+        """Run seaf2drawio.py in the copied tree, return (output bytes, log)."""
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        # Fixed hash seed: set iteration order must not differ between the compared runs
+        env = dict(os.environ, PYTHONHASHSEED='0')
+        proc = subprocess.run([sys.executable, '-X', 'utf8', 'seaf2drawio.py', '-d', dst, *flags], cwd=self.tree,
+                              env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8')
+        if proc.returncode != 0:
+            raise SystemExit(f"seaf2drawio.py {' '.join(flags)} failed with code {proc.returncode}:\n{proc.stdout}")
+        with open(dst, 'rb') as file:
+            return file.read(), proc.stdout
+
+    def check(self, name, result, reference, compare_log=False):
+        output, log = result
+        problems = []
+        if output != reference[0]:
+            problems.append('output differs')
+        if compare_log and log != reference[1]:
+            problems.append('log differs')
+        print(f"{'FAIL' if problems else 'OK':<5} {name}{': ' + ', '.join(problems) if problems else ''}")
+        if problems:
+            self.failed.append(name)
+
+
+def edit_source(path):
+    """Change the first title in a data file so the page showing the object has to be rebuilt."""
+    with open(path, encoding='utf-8') as file:
+        text = file.read()
+    if 'title: ' not in text:
+        raise SystemExit(f"{path}: no 'title:' field to edit")
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text.replace('title: ', 'title: Regression ', 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare parallel, cached and incremental builds with a full build")
+    parser.add_argument("--edit", default=DEFAULT_EDIT,
+                        help=f"data file edited before the incremental rebuild (default: {DEFAULT_EDIT})")
+    parser.add_argument("--keep", action='store_true', help="keep the temporary copy of the repository")
+    args = parser.parse_args()
+
+    # Builds run in a copy: the edit, caches and manifests must not touch the working tree
+    work = tempfile.mkdtemp(prefix='seaf2drawio-regression-')
+    tree = os.path.join(work, 'tree')
+    out = os.path.join(work, 'out')
+    shutil.copytree(ROOT, tree, ignore=shutil.ignore_patterns('.git', '.cache', '__pycache__', 'result'))
+    checker = Checker(tree)
+    try:
+        reference = checker.build(os.path.join(out, 'reference.drawio'))
+        for name, flags in PLAIN_MODES:
+            dst = os.path.join(out, name.replace(' ', '_') + '.drawio')
+            checker.check(name, checker.build(dst, *flags), reference, compare_log=True)
+
+        page_cache = os.path.join(out, 'page_cache.drawio')
+        checker.check('page-cache cold', checker.build(page_cache, '--page-cache'), reference)
+        checker.check('page-cache warm', checker.build(page_cache, '--page-cache'), reference)
+
+        incremental = os.path.join(out, 'incremental.drawio')
+        checker.check('incremental first build', checker.build(incremental, '--incremental'), reference)
+        edit_source(os.path.join(tree, args.edit))
+        edited = checker.build(os.path.join(out, 'reference_edited.drawio'))
+        if edited[0] == reference[0]:
+            raise SystemExit(f"editing {args.edit} did not change the output, pick another --edit file")
+        checker.check('incremental after source edit', checker.build(incremental, '--incremental'), edited)
+        # The output is replaced by an older build: sources are unchanged, but the manifest must not be trusted
+        shutil.copyfile(os.path.join(out, 'reference.drawio'), incremental)
+        checker.check('incremental after output replaced', checker.build(incremental, '--incremental'), edited)
+    finally:
+        if args.keep:
+            print(f"Builds kept in {work}")
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    if checker.failed:
+        print(f"{len(checker.failed)} check(s) failed: {', '.join(checker.failed)}")
+        sys.exit(1)
+    print("All builds match the full build")
+
+
+if __name__ == "__main__":
+    main()
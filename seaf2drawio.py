@@ -5,14 +5,29 @@ import os
 import argparse
 import subprocess
 import hashlib
+import tempfile
+import time
+import io
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
-from typing import Optional, Dict, List, Set, Any
-from lib import seaf_drawio
+from functools import partial, lru_cache
+from typing import Optional, Dict, List, Set, Any, Mapping
+from lib import seaf_drawio, incremental
+from lib.lazy_store import LazyDataStore, scan_yaml_keys_cached
+from lib.patterns import PatternSpec, LayoutCursor, CompiledFragment
+from lib.dispatch import PatternDispatch
+from lib.filters import PatternFilter, normalize_tag_values
+from lib.page_cache import PageCache, PageInputs
+from lib.page_state import PageState
+from lib.link_index import NetworkLinkIndex, PendingLinks, LogicalLinkPlan, LINK_CROSS_PAGE, LINK_MISSING_ENDPOINT, \
+    logical_topology
+from lib.drawio_writer import DrawioWriter, Edge, group_by_layer
 from lib.link_manager import remove_obsolete_links, draw_verify, advanced_analysis
 from lib.schemas import SeafSchema
-from lib.drawio_utils import format_number, float_attr
+from lib.drawio_utils import format_number, float_attr, escape_attr, EscapedRecord, LayerRegistry
 import xml.etree.ElementTree as ET
-import xml.sax.saxutils as saxutils
 
 patterns_dir = 'data/patterns/'
 diagram = drawio_diagram()
@@ -21,16 +36,25 @@ root_object = SeafSchema.DC_REGION
 diagram_pages = {'main': ['Main Schema'], 'office': [], 'dc': []}
 diagram_ids = {'Main Schema': set()}
 conf = {}
-pending_missing_links = set()
+# Отложенные связи: связи network_links без объектов на странице хранятся по индексу (см. add_network_links)
+pending_missing_links = PendingLinks(lambda key: network_link_index(*key))
+network_link_indexes = {}
+# Страницы, на которых размещён объект (OID -> set страниц); пополняется вместе с diagram_ids (add_page_ids)
+node_pages = {}
+logical_link_plans = {}
+page_schemas = {}
+page_root_schemas = {}
 logged_default_topology_links = set()
-layout_counters = {}
 expected_counts = {}
 expected_data = {}
 pattern_specs = {}
+pattern_dispatch = {}
+pattern_claims = {}
 data_store = None
 link_style_override = ''
 EXTERNAL_INTERNET_NETWORK = '0.0.0.0/0'
-created_tag_layers = set()
+# Слои страниц по id (ensure_tag_layer, _ensure_common_tag_layer)
+tag_layers = LayerRegistry()
 VISIBLE_LOGICAL_LAYER_ID = 'layer.logical.visible'
 VISIBLE_LOGICAL_LAYER_LABEL = 'Logical Links'
 LOGICAL_LINK_STYLES = {
@@ -50,7 +74,25 @@ DEFAULT_CONFIG = {
         "common_location_page": False,
         "common_location_page_name": "Общая схема",
         "common_location_page_gap": 120,
-        "common_location_provider_zones": ["INTERNET", "INET-EDGE"]
+        "common_location_provider_zones": ["INTERNET", "INET-EDGE"],
+        "parse_workers": 1,
+        "page_workers": 1,
+        "lazy_load": False,
+        "compact_records": False,
+        "incremental": False,
+        "drawio_writer": "n2g",
+        "watch": False,
+        "watch_interval": 1.0,
+        "schema_file": "data/seaf_schema.yaml",
+        "parse_cache": True,
+        "parse_cache_dir": ".cache/seaf2drawio",
+        "parse_cache_max_mb": 256,
+        "page_cache": False,
+        "page_cache_dir": ".cache/seaf2drawio/pages",
+        "page_cache_max_mb": 128,
+        "pattern_bundle": ".cache/seaf2drawio/patterns.bundle",
+        "missing_links_sample": 50,
+        "missing_links_report": ""
     }
 }
 
@@ -72,6 +114,26 @@ def cli_vars(config):
         parser.add_argument("--common-location-page", action="store_true", help="сгенерировать общую схему локаций")
         parser.add_argument("--common-location-page-name", type=str, help="имя общей схемы локаций")
         parser.add_argument("--debug", action="store_true", help="включить подробную диагностику")
+        parser.add_argument("--parse-workers", type=int, metavar="N",
+                            help="число процессов для разбора YAML-файлов данных (0 - по числу CPU)")
+        parser.add_argument("--page-workers", type=int, metavar="N",
+                            help="число процессов для генерации страниц офисов и ЦОД (0 - по числу CPU)")
+        parser.add_argument("--lazy-load", action=argparse.BooleanOptionalAction, default=None,
+                            help="разбирать только YAML-файлы со схемами, которые запрашиваются при генерации")
+        parser.add_argument("--compact-records", action=argparse.BooleanOptionalAction, default=None,
+                            help="хранить записи объектов в компактном неизменяемом виде")
+        parser.add_argument("--incremental", action="store_true",
+                            help="перестроить только страницы, затронутые изменёнными YAML-файлами")
+        parser.add_argument("--page-cache", action="store_true",
+                            help="использовать кэш готовых страниц, входы которых не изменились")
+        parser.add_argument("--drawio-writer", choices=["n2g", "native"],
+                            help="реализация записи DrawIO: n2g или встроенная native")
+        parser.add_argument("--watch", action="store_true",
+                            help="следить за файлами данных, паттернов и шаблона и пересобирать диаграмму при изменениях")
+        parser.add_argument("--watch-interval", type=float, metavar="SEC",
+                            help="период опроса файлов в режиме --watch, секунд")
+        parser.add_argument("--missing-links-report", type=str, metavar="PATH",
+                            help="записать полный список пропущенных связей в сжатый JSONL-файл (.jsonl.gz)")
         args = parser.parse_args()
         if args.src:
             config['data_yaml_file'] = args.src
@@ -85,6 +147,26 @@ def cli_vars(config):
             config['common_location_page_name'] = args.common_location_page_name
         if args.debug:
             config['debug'] = True
+        if args.parse_workers is not None:
+            config['parse_workers'] = args.parse_workers
+        if args.page_workers is not None:
+            config['page_workers'] = args.page_workers
+        if args.lazy_load is not None:
+            config['lazy_load'] = args.lazy_load
+        if args.compact_records is not None:
+            config['compact_records'] = args.compact_records
+        if args.incremental:
+            config['incremental'] = True
+        if args.page_cache:
+            config['page_cache'] = True
+        if args.drawio_writer:
+            config['drawio_writer'] = args.drawio_writer
+        if args.watch:
+            config['watch'] = True
+        if args.watch_interval is not None:
+            config['watch_interval'] = args.watch_interval
+        if args.missing_links_report:
+            config['missing_links_report'] = args.missing_links_report
         return config
 
     except argparse.ArgumentTypeError as e:
@@ -118,47 +200,11 @@ def adjust_link_style(style):
     tokens.append('rounded=0')
     return ';'.join(tokens) + ';'
 
-def position_offset(pattern):
-
-    match pattern['algo']:
-        # По оси Y cверху вниз относительно родительского объекта
-        case 'Y+':
-            if return_ready(pattern):
-                pattern['x'] = pattern['x'] + pattern['w'] + pattern['offset']
-                pattern['y'] = pattern['y'] - (pattern['h'] + pattern['offset']) * pattern['deep']
-            pattern['y'] = pattern['y'] + pattern['h'] + pattern['offset']
-
-        case 'Y-':
-            if return_ready(pattern):
-                pattern['x'] = pattern['x'] + pattern['w'] + pattern['offset']
-                pattern['y'] = pattern['y'] + (pattern['h'] + pattern['offset']) * pattern['deep']
-            pattern['y'] = pattern['y'] - pattern['h'] - pattern['offset']
-
-        case 'X-':
-
-            if return_ready(pattern):
-                pattern['y'] = pattern['y'] +  pattern['h'] + pattern['offset']
-                pattern['x'] = pattern['x'] + (pattern['w'] + pattern['offset']) * pattern['deep']
-            pattern['x'] = pattern['x'] - pattern['w'] - pattern['offset']
-        # По оси X слева направо
-        case 'X+':
-            if return_ready(pattern):
-                pattern['y'] = pattern['y'] +  pattern['h'] + pattern['offset']
-                pattern['x'] = pattern['x'] - (pattern['w'] + pattern['offset']) * pattern['deep']
-            pattern['x'] = pattern['x'] + pattern['w'] + pattern['offset']
-
-def return_ready(pattern):
-    pattern['count']+=1
-    if pattern['count'] == pattern['deep']:
-        pattern['count'] = 0
-
-    return not bool(pattern['count'])
-
 def get_parent_value(pattern, current_parent):
     if not (pattern.get('parent_key') and current_parent):
         return ''
 
-    parent_data = d.find_value_by_key(data_store, current_parent) if data_store else None
+    parent_data = d.find_object_by_oid(conf['data_yaml_file'], current_parent) if data_store is not None else None
     if parent_data is None:
         return ''
     parent_value = d.find_value_by_key(parent_data, pattern['parent_key'])
@@ -166,13 +212,7 @@ def get_parent_value(pattern, current_parent):
 
 
 def get_schema_object(schema_name: str, object_id: str) -> Dict[str, Any]:
-    if not object_id:
-        return {}
-    objects = d.get_object(conf['data_yaml_file'], schema_name)
-    if not isinstance(objects, dict):
-        return {}
-    obj = objects.get(object_id)
-    return obj if isinstance(obj, dict) else {}
+    return d.find_object_by_oid(conf['data_yaml_file'], object_id, schema=schema_name) or {}
 
 
 def resolve_external_internet_segment(parent_id: str) -> str:
@@ -209,55 +249,41 @@ def is_external_internet_network(data: Dict[str, Any], segment_id: str) -> bool:
     return str(segment_data.get('zone') or '').upper() == 'INTERNET'
 
 
-def get_external_internet_geometry(segment_id: str, pattern: Dict[str, Any]) -> tuple[float, float]:
+def get_external_internet_geometry(segment_id: str, pattern: Dict[str, Any], state: PageState) -> tuple[float, float]:
     anchor_x = -10
     anchor_y = 60 if '.dc_office.' in segment_id else 140
     step_y = max(pattern['h'] + 20, 70)
-    counter_key = (page_name, segment_id, 'internet-external')
-    index = layout_counters.get(counter_key, 0)
-    layout_counters[counter_key] = index + 1
+    counter_key = (state.name, segment_id, 'internet-external')
+    index = state.layout_counters.get(counter_key, 0)
+    state.layout_counters[counter_key] = index + 1
     x_pos = anchor_x - pattern['w'] - 30
     y_pos = anchor_y + index * step_y
     return x_pos, y_pos
 
 
-def normalize_tag_values(value: Any) -> list[str]:
-    if value is None:
-        return []
-    if isinstance(value, (list, tuple, set)):
-        return [str(item) for item in value if item is not None]
-    return [str(value)]
+def default_topology_message(link_oid: str, page: str) -> str:
+    return f"\nINFO: logical_link {link_oid} on page '{page}': topology is not set, using star."
 
 
-def normalize_logical_topology(link_oid: str, link_data: Dict[str, Any]) -> str:
+def normalize_logical_topology(link_oid: str, link_data: Dict[str, Any], state: Optional[PageState] = None,
+                               page: Optional[str] = None) -> str:
+    # Общая страница строится вне render_page, поэтому её имя передаётся явно
+    page = state.name if state is not None else page
     raw_topology = link_data.get('topology')
-    topology = str(raw_topology or 'star').lower()
-    if not raw_topology and link_oid not in logged_default_topology_links:
-        print(f"\nINFO: logical_link {link_oid} on page '{page_name}': topology is not set, using star.")
-        logged_default_topology_links.add(link_oid)
-    elif topology not in {'star', 'chain'}:
+    topology, known = logical_topology(raw_topology)
+    logged = state.logged_topology if state is not None else logged_default_topology_links
+    if not raw_topology and link_oid not in logged_default_topology_links and link_oid not in logged:
+        print(default_topology_message(link_oid, page))
+        logged.add(link_oid)
+    elif not known:
         print(
-            f"\nWARNING: logical_link {link_oid} on page '{page_name}': "
+            f"\nWARNING: logical_link {link_oid} on page '{page}': "
             f"unknown topology '{raw_topology}', using star."
         )
-        topology = 'star'
     link_data['topology'] = topology
     return topology
 
 
-def logical_link_targets(link_data: Dict[str, Any], targets_key: str = 'target') -> list[str]:
-    link_targets = link_data.get(targets_key) or []
-    if not isinstance(link_targets, list):
-        link_targets = [link_targets]
-    return [target_id for target_id in link_targets if target_id]
-
-
-def logical_link_steps(source_id: str, target_ids: list[str], topology: str) -> list[tuple[str, str]]:
-    if topology == 'chain':
-        return list(zip([source_id] + target_ids[:-1], target_ids))
-    return [(source_id, target_id) for target_id in target_ids]
-
-
 def logical_link_style(direction: str, pattern: Optional[Dict[str, Any]] = None) -> str:
     style_key = 'style' + str(direction)
     style = pattern.get(style_key, '') if pattern else ''
@@ -266,17 +292,7 @@ def logical_link_style(direction: str, pattern: Optional[Dict[str, Any]] = None)
     return adjust_link_style(style)
 
 
-def is_cross_page_logical_link(steps: list[tuple[str, str]], current_page_ids: Set[str]) -> bool:
-    present_steps = [
-        (source_id in current_page_ids, target_id in current_page_ids)
-        for source_id, target_id in steps
-    ]
-    return any(source_present or target_present for source_present, target_present in present_steps) and not all(
-        source_present and target_present
-        for source_present, target_present in present_steps
-    )
-
-
+@lru_cache(maxsize=None)
 def tag_layer_id(tag: str, prefix: str = 'logical') -> str:
     normalized = re.sub(r'[^A-Za-z0-9_.-]+', '_', str(tag).strip()).strip('_').lower()
     if not normalized:
@@ -284,149 +300,122 @@ def tag_layer_id(tag: str, prefix: str = 'logical') -> str:
     return f'layer.{prefix}.{normalized}'
 
 
-def ensure_tag_layer(tag: str, prefix: str = 'logical') -> str:
+def ensure_tag_layer(tag: str, state: PageState, prefix: str = 'logical') -> str:
     layer_id = tag_layer_id(tag, prefix=prefix)
-    if diagram.current_root.find(f"./mxCell[@id='{layer_id}']") is None:
-        safe_label = saxutils.escape(str(tag), entities={'"': "&quot;", "'": "&apos;"})
-        diagram.current_root.append(ET.fromstring(
-            f'<mxCell id="{layer_id}" value="{safe_label}" parent="0" visible="0" />'
-        ))
-        log_key = (page_name, layer_id)
-        if log_key not in created_tag_layers:
-            print(f'\n INFO : Создан слой тегов "{tag}" ({layer_id}) на странице "{page_name}"')
-            created_tag_layers.add(log_key)
+    # Подпись слоя - как после разбора XML-атрибута: переводы строк и табуляции заменяются пробелами
+    label = re.sub(r'\r\n|[\r\n\t]', ' ', str(tag))
+    if tag_layers.ensure(diagram.current_root, layer_id, label):
+        log_key = (state.name, layer_id)
+        if log_key not in state.created_tag_layers:
+            print(f'\n INFO : Создан слой тегов "{tag}" ({layer_id}) на странице "{state.name}"')
+            state.created_tag_layers.add(log_key)
     return layer_id
 
 
-def add_link_to_layer(
+def layer_edge(
     source_id: str,
     target_id: str,
     style: str,
     data: Dict[str, Any],
     layer_id: str,
     link_id: str = '',
-) -> None:
+) -> Edge:
+    """Связь в слое layer_id для add_edges(): ID связи включает слой, поэтому связь с несколькими тегами есть в каждом слое."""
+    semantic_id = link_id or data.get('OID') or data.get('id') or f'{source_id}->{target_id}'
+    layer_link_id = hashlib.md5(f'{semantic_id}|{source_id}|{target_id}|{layer_id}'.encode('utf-8')).hexdigest()
+    return Edge(source_id, target_id, style, data, layer_id, link_id=layer_link_id)
+
+
+def add_edges(edges: List[Edge]) -> None:
+    """
+    Добавляет связи на текущую страницу одной операцией (DrawioWriter.add_links), сгруппировав их по слоям:
+    связи одного слоя тегов идут подряд. Для N2G шаблон связи со слоем подставляется один раз на слой,
+    а связи добавляются по одной через add_link.
+    """
+    if isinstance(diagram, DrawioWriter):
+        diagram.add_links(edges)
+        return
     previous_xml = diagram.drawio_link_object_xml
     try:
-        diagram.drawio_link_object_xml = re.sub(r'parent="[^"]+"', f'parent="{layer_id}"', previous_xml, count=1)
-        semantic_id = link_id or data.get('OID') or data.get('id') or f'{source_id}->{target_id}'
-        layer_link_id = hashlib.md5(f'{semantic_id}|{source_id}|{target_id}|{layer_id}'.encode('utf-8')).hexdigest()
-        diagram.add_link(source=source_id, target=target_id, style=style, data=data, link_id=layer_link_id)
+        for layer_id, group in group_by_layer(edges).items():
+            diagram.drawio_link_object_xml = previous_xml if layer_id is None else re.sub(
+                r'parent="[^"]+"', f'parent="{layer_id}"', previous_xml, count=1)
+            for source_id, target_id, style, data, _, label, link_id in group:
+                diagram.add_link(source=source_id, target=target_id, style=style, label=label, data=data,
+                                 link_id=link_id)
     finally:
         diagram.drawio_link_object_xml = previous_xml
 
 
 def apply_pattern_filters(pattern: Dict[str, Any], objects: Any) -> Any:
-    if not isinstance(objects, dict):
-        return objects
-
-    id_regex = pattern.get('id_regex')
-    exclude_id_regex = pattern.get('exclude_id_regex')
-    require_fields = pattern.get('require_fields') or []
-    exclude_fields = pattern.get('exclude_fields') or []
-    field_regex = pattern.get('field_regex') or {}
-    exclude_field_regex = pattern.get('exclude_field_regex') or {}
-    any_field_regex = pattern.get('any_field_regex') or {}
-    exclude_any_field_regex = pattern.get('exclude_any_field_regex') or {}
-    include_tags = pattern.get('include_tags') or []
-    require_tags = pattern.get('require_tags') or []
-    exclude_tags = pattern.get('exclude_tags') or []
+    return pattern_filter(pattern).apply(objects)
 
-    if (
-        not id_regex and not exclude_id_regex and not require_fields and not exclude_fields
-        and not field_regex and not exclude_field_regex
-        and not any_field_regex and not exclude_any_field_regex
-        and not include_tags and not require_tags and not exclude_tags
-    ):
-        return objects
-
-    def normalize_filter_values(value: Any) -> set[str]:
-        return set(normalize_tag_values(value))
-
-    include_tag_set = normalize_filter_values(include_tags)
-    require_tag_set = normalize_filter_values(require_tags)
-    exclude_tag_set = normalize_filter_values(exclude_tags)
-
-    def iter_field_values(obj: Dict[str, Any], field: str) -> list[str]:
-        value = obj.get(field)
-        if isinstance(value, list):
-            return [str(item) for item in value if item is not None]
-        if value is None:
-            return []
-        return [str(value)]
-
-    def object_tags(obj: Any) -> set[str]:
-        if not isinstance(obj, dict):
-            return set()
-        return normalize_filter_values(obj.get('tags'))
-
-    def matches_all(obj: Dict[str, Any], rules: Dict[str, str]) -> bool:
-        for field, regex in rules.items():
-            values = iter_field_values(obj, field)
-            if not values or not any(re.search(regex, value) for value in values):
-                return False
-        return True
 
-    def matches_any(obj: Dict[str, Any], rules: Dict[str, str]) -> bool:
-        if not rules:
-            return False
-        for field, regex in rules.items():
-            values = iter_field_values(obj, field)
-            if any(re.search(regex, value) for value in values):
-                return True
-        return False
+def pattern_filter(pattern: Dict[str, Any]) -> PatternFilter:
+    """Скомпилированные фильтры паттерна: у PatternSpec они общие для всех страниц и add_links."""
+    if isinstance(pattern, PatternSpec):
+        return pattern.filter
+    return PatternFilter(pattern)
 
-    filtered = {}
-    for object_id, object_data in objects.items():
-        if id_regex and not re.search(id_regex, object_id):
-            continue
-        if exclude_id_regex and re.search(exclude_id_regex, object_id):
-            continue
-        if require_fields and any(not object_data.get(field) for field in require_fields):
-            continue
-        if exclude_fields and any(object_data.get(field) for field in exclude_fields):
-            continue
-        if field_regex and not matches_all(object_data, field_regex):
-            continue
-        if exclude_field_regex and matches_all(object_data, exclude_field_regex):
-            continue
-        if any_field_regex and not matches_any(object_data, any_field_regex):
-            continue
-        if exclude_any_field_regex and matches_any(object_data, exclude_any_field_regex):
-            continue
-        tags = object_tags(object_data)
-        if include_tag_set and tags.isdisjoint(include_tag_set):
-            continue
-        if require_tag_set and not require_tag_set.issubset(tags):
-            continue
-        if exclude_tag_set and not tags.isdisjoint(exclude_tag_set):
-            continue
-        filtered[object_id] = object_data
-    return filtered
 
-def add_pages(pattern):
+def print_filter_stats() -> None:
+    """Отладочный отчёт: сколько записей проверили и отсеяли фильтры паттернов (для настройки правил)."""
+    print('\n> Фильтры паттернов (проверено / прошло; правило: проверено / отсеяно):')
+    for file_name in diagram_pages:
+        for name, pattern in d.get_pattern_specs(patterns_dir + file_name + '.yaml').items():
+            if not isinstance(pattern, PatternSpec) or not pattern.filter or not pattern.filter.calls:
+                continue
+            stats = pattern.filter.stats()
+            checks = ', '.join(f"{check}: {evaluated} / {rejected}" for check, evaluated, rejected in stats['checks'])
+            print(f"  {file_name}.{name}: {stats['calls']} / {stats['passed']}; {checks}")
+
+def add_page_ids(page: str, ids: Any) -> None:
+    """Добавляет ID объектов страницы в diagram_ids и индекс объект -> страницы node_pages."""
+    page_ids = diagram_ids.setdefault(page, set())
+    for oid in ids:
+        page_ids.add(oid)
+        node_pages.setdefault(oid, set()).add(page)
+
+
+def add_pages(pattern, name: str, page: str):
 
     if pattern.get('ext_page'):
-        page_data = d.get_object(conf['data_yaml_file'], pattern['schema'])
+        page_data = d.get_object(conf['data_yaml_file'], pattern['schema'], readonly=True)
         diagram_xml_default = diagram.drawio_diagram_xml
 
         for key_id in list( page_data.keys() ):
 
             diagram.drawio_diagram_xml = pattern['ext_page']
-            safe_title = saxutils.escape(page_data[key_id]['title'], entities={'"': "&quot;", "'": "&apos;"})
+            safe_title = escape_attr(page_data[key_id]['title'])
             try:
                 diagram.add_diagram(key_id + '_page', safe_title)
-                diagram_pages[k].append(safe_title)
-                diagram_ids.setdefault(safe_title, set()).add(key_id)
+                diagram_pages[name].append(safe_title)
+                add_page_ids(safe_title, [key_id])
             except ET.ParseError:
                 print(f'WARNING ! Не используйте XML зарезервированные символы <>&\'\" в поле title для объектов dc/office')
                 pass
 
 
         diagram.drawio_diagram_xml = diagram_xml_default
-        diagram.go_to_diagram(page_name)
-
-def add_object(pattern: Dict[str, Any], data: Dict[str, Any], key_id: str) -> None:
+        diagram.go_to_diagram(page)
+
+def prepare_node_template(fragment: CompiledFragment, values: Mapping[str, str]) -> Dict[str, Any]:
+    """
+    Подставляет значения объекта во фрагмент паттерна.
+    Для DrawioWriter возвращает аргумент template для add_node (узел строится без разбора XML-строки),
+    для N2G записывает готовую строку в drawio_node_object_xml.
+    """
+    if isinstance(diagram, DrawioWriter):
+        template = fragment.element_template()
+        if template is not None:
+            return {'template': template.bind(values)}
+    diagram.drawio_node_object_xml = fragment.render(values)
+    return {}
+
+
+def add_object(pattern: PatternSpec, name: str, cursor: LayoutCursor, data: Dict[str, Any], key_id: str,
+               state: PageState) -> None:
+    page_ids = diagram_ids[state.name]
 
     pattern_count, current_parent = 0, ''
     render_parent = ''
@@ -434,18 +423,21 @@ def add_object(pattern: Dict[str, Any], data: Dict[str, Any], key_id: str) -> No
     render_y = None
     internet_external = False
     internet_external_network = False
+    parent_candidates = d.get_parent_candidates(conf['data_yaml_file'], pattern['schema'], key_id, data,
+                                                pattern['parent_id']) if pattern.get('parent_id') else []
+    # Одно представление записи на все фрагменты: поля экранируются, только если их читает фрагмент
+    overrides = {'Group_ID': f'{key_id}_0', 'parent_id': '', 'parent_type': cursor.parent}
+    escaped = EscapedRecord(data, overrides, optional=('description',))
     try:
-        for xml_pattern in d.get_xml_pattern(pattern['xml'], key_id):
-
-            diagram.drawio_node_object_xml = xml_pattern
+        for fragment in d.get_compiled_pattern(pattern['xml'], name):
 
             # Если у элемента есть родитель, получаем ID родителя и проверяем связан ли родитель с текущей диаграммой (страницей)
             # добавляем в справочник ID элемента
-            if pattern.get('parent_id') and d.find_common_element(d.find_key_value(data, pattern['parent_id']),
-                                                         list(diagram_ids[page_name])) and pattern_count == 0:
+            if pattern.get('parent_id') and pattern_count == 0 and d.find_common_element(parent_candidates,
+                                                                                          page_ids):
 
-                diagram_ids.setdefault(page_name, set()).add(key_id)
-                current_parent = d.find_common_element(d.find_key_value(data, pattern['parent_id']),list(diagram_ids[page_name]))
+                add_page_ids(state.name, [key_id])
+                current_parent = d.find_common_element(parent_candidates, page_ids)
 
                 # If parent_id field is a list (e.g., WAN.segment), normalize it to the selected current_parent
                 try:
@@ -460,47 +452,38 @@ def add_object(pattern: Dict[str, Any], data: Dict[str, Any], key_id: str) -> No
                     external_segment_id = resolve_external_internet_segment(current_parent)
                     if external_segment_id:
                         render_parent = external_segment_id
-                        render_x, render_y = get_external_internet_geometry(external_segment_id, pattern)
+                        render_x, render_y = get_external_internet_geometry(external_segment_id, pattern, state)
                         internet_external = True
                 elif pattern.get('parent_id') == 'segment' and is_external_internet_network(data, current_parent):
-                    render_x = default_pattern['x']
-                    render_y = default_pattern['y']
+                    render_x = pattern['x']
+                    render_y = pattern['y']
                     internet_external_network = True
 
                 parent_value = get_parent_value(pattern, render_parent)
 
-                if current_parent != pattern['last_parent'] and pattern['parent_id'] != 'network_connection':
+                if current_parent != cursor.last_parent and pattern['parent_id'] != 'network_connection':
                     # Для паттернов с parent_key (например, ISP->zone) один и тот же контейнер
                     # может использоваться при разных parent_id. Сохраняем/восстанавливаем позицию
                     # отдельно для каждого фактического контейнера.
                     if not pattern.get('global_positioning'):
-                        pos_map = pattern.setdefault('_position_by_parent_type', {})
-                        if parent_value in pos_map:
-                            saved = pos_map[parent_value]
-                            pattern['x'] = saved.get('x', pattern['x'])
-                            pattern['y'] = saved.get('y', pattern['y'])
-                            pattern['count'] = saved.get('count', pattern.get('count', 0))
-                        else:
-                            default_pattern['parent'] = parent_value
-                            pattern.update(default_pattern)
+                        if not cursor.restore_position(parent_value, run=current_parent):
+                            cursor.reset(parent_value, run=current_parent)
 
-                    pattern['last_parent'] = current_parent
+                    cursor.last_parent = current_parent
 
-                pattern['parent'] = parent_value
-                pattern['last_parent_type'] = parent_value
+                cursor.set_parent(parent_value)
+                cursor.last_parent_type = parent_value
+                overrides['parent_id'] = render_parent or current_parent
+                overrides['parent_type'] = cursor.parent
 
 
             try:
-                # Escape data for XML, including quotes for attributes
-                safe_data = {k: saxutils.escape(str(v), entities={'"': "&quot;", "'": "&apos;"}) if v is not None else '' for k, v in data.items()}
-                
-                diagram.drawio_node_object_xml = diagram.drawio_node_object_xml.format_map(
-                    safe_data | {'Group_ID': f'{key_id}_0', 'parent_id' : render_parent or current_parent, 'parent_type' : pattern.get('parent', ''),
-                            'description' : saxutils.escape(str(data.get('description','') or ''), entities={'"': "&quot;", "'": "&apos;"}) })
+                # Escape data for XML, including quotes for attributes: only fields used by the fragment
+                node_template = prepare_node_template(fragment, escaped)
                 data['OID'] = key_id
                 
                 # Pre-escape title for N2G add_node which inserts it into XML
-                safe_title = saxutils.escape(str(data.get('title', '')), entities={'"': "&quot;", "'": "&apos;"})
+                safe_title = escape_attr(str(data.get('title', '')))
 
             except KeyError as e:
 
@@ -509,7 +492,7 @@ def add_object(pattern: Dict[str, Any], data: Dict[str, Any], key_id: str) -> No
                 return
 
 
-            if key_id in diagram_ids[page_name]:
+            if key_id in page_ids:
 
                 #if pattern.get('parent_id') == 'dc':
                 #    print(f'==={i} == {current_parent} === {key_id}_{pattern_count}')
@@ -527,7 +510,7 @@ def add_object(pattern: Dict[str, Any], data: Dict[str, Any], key_id: str) -> No
 
                 # Если не содержит конструкции <object></object>, то изменять ID добавляя порядковый номер
 
-                node_data = data if d.contains_object_tag(xml_pattern, 'object') else {}
+                node_data = data if fragment.is_object else {}
                 if node_data:
                     node_data = dict(node_data)
                     # Do not let source YAML "label" override the rendered DrawIO label.
@@ -536,45 +519,60 @@ def add_object(pattern: Dict[str, Any], data: Dict[str, Any], key_id: str) -> No
                         node_data['internet_external'] = 'true'
 
                 diagram.add_node(
-                    id=f"{key_id}_{pattern_count}" if not d.contains_object_tag(xml_pattern, 'object') else key_id,
+                    id=f"{key_id}_{pattern_count}" if not fragment.is_object else key_id,
                     label=safe_title,
-                    x_pos=render_x if render_x is not None else pattern['x'],
-                    y_pos=render_y if render_y is not None else pattern['y'],
+                    x_pos=render_x if render_x is not None else cursor.x,
+                    y_pos=render_y if render_y is not None else cursor.y,
                     width=pattern['w'],
                     height=pattern['h'],
                     data=node_data,
-                    url=pattern.get('ext_page') and data['title']
+                    url=pattern.get('ext_page') and data['title'],
+                    **node_template
                 )
-                diagram_ids.setdefault(page_name, set()).add(key_id)  # Добавляет ID root элементов
+                add_page_ids(state.name, [key_id])  # Добавляет ID root элементов
 
                 if pattern_count == 0 and not internet_external and not internet_external_network:  # Change position of element
-                    position_offset(object_pattern)
-                if pattern.get('parent'):
-                    pos_map = pattern.setdefault('_position_by_parent_type', {})
-                    pos_map[pattern['parent']] = {
-                        'x': pattern['x'],
-                        'y': pattern['y'],
-                        'count': pattern.get('count', 0),
-                    }
+                    cursor.advance()
                 pattern_count += 1
     finally:
+        if pattern_count:
+            cursor.save_position()
         diagram.drawio_node_object_xml = node_xml_default
 
-def add_links(pattern: Dict[str, Any], **kwargs: bool) -> None:
+
+def layout_plan(pattern: PatternSpec, objects: Mapping[str, Any], page: str) -> Dict[str, int]:
+    """
+    Число объектов паттерна, которые будут размещены у каждого родителя на странице (LayoutCursor.plan()).
+    Родитель определяется так же, как в add_object(): первый кандидат из parent_id, присутствующий
+    на странице. Объекты, уже присутствующие на диаграмме, не размещаются.
+    """
+    parent_id = pattern.get('parent_id')
+    nodes = diagram.nodes_ids[diagram.current_diagram_id]
+    oids = [oid for oid in objects if oid not in nodes]
+    if not parent_id or parent_id == 'network_connection' or pattern.get('global_positioning'):
+        # Контейнер курсора не меняется: все объекты размещаются одной последовательностью
+        return {'': len(oids)}
+    page_ids = diagram_ids[page]
+    counts = {}
+    for oid in oids:
+        candidates = d.get_parent_candidates(conf['data_yaml_file'], pattern['schema'], oid, objects[oid], parent_id)
+        parent = d.find_common_element(candidates, page_ids)
+        if parent:
+            counts[parent] = counts.get(parent, 0) + 1
+    return counts
+
+def add_links(pattern: Dict[str, Any], state: PageState, **kwargs: bool) -> None:
 
     diagram.drawio_link_object_xml = pattern['xml']
     schema_name = pattern['schema']
-    type_filter = object_pattern.get('type')
-
-    if kwargs.get('network_link'):
-        schema_name = SeafSchema.NETWORK_LINK.value
-        type_filter = None
+    type_filter = pattern.get('type')
+    page_name = state.name
 
     source_id = 'Unknown'
-    source_objects = d.get_object(conf['data_yaml_file'], schema_name, type=type_filter)
+    source_objects = d.get_object(conf['data_yaml_file'], schema_name, type=type_filter, readonly=True)
     source_objects = apply_pattern_filters(pattern, source_objects)
 
-    if not isinstance(source_objects, dict):
+    if not isinstance(source_objects, Mapping):
         return
 
     if (
@@ -584,116 +582,9 @@ def add_links(pattern: Dict[str, Any], **kwargs: bool) -> None:
     ):
         return
 
-    eligible_links = None
-    if kwargs.get('network_link'):
-        eligible_links = {}
-        for link_id, link_value in source_objects.items():
-            connections = link_value.get(pattern['targets']) or []
-            present_count = sum(1 for node_id in connections if node_id in diagram_ids[page_name])
-            if present_count >= 2:
-                eligible_links[link_id] = link_value
-        if eligible_links:
-            expected_counts.setdefault(schema_name, set()).update(list(eligible_links.keys()))
-            expected_data.setdefault(schema_name, {}).update(eligible_links)
-
-    drawn_pairs = set()
-
+    edges = []
     for source_id, targets in source_objects.items():  # source_id - ID объекта
 
-        if kwargs.get('logical_link'):
-            link_oid = source_id
-            targets['OID'] = source_id
-            source_id = targets['source']
-            targets['schema'] = pattern['schema']
-
-            topology = normalize_logical_topology(link_oid, targets)
-            link_targets = logical_link_targets(targets, pattern['targets'])
-            if not link_targets:
-                continue
-
-            link_steps = logical_link_steps(source_id, link_targets, topology)
-            if is_cross_page_logical_link(link_steps, diagram_ids[page_name]):
-                for step_source_id, target_id in link_steps:
-                    if step_source_id in diagram_ids[page_name] or target_id in diagram_ids[page_name]:
-                        pending_missing_links.add((page_name, step_source_id, target_id))
-                if conf.get('debug'):
-                    print(
-                        f"\nINFO: logical_link {link_oid} on page '{page_name}': "
-                        "skipped because the route has endpoints outside this page."
-                    )
-                continue
-
-            for step_index, (step_source_id, target_id) in enumerate(link_steps):
-                try:
-                    style_value = logical_link_style(targets['direction'], pattern)
-                    link_id = f"{link_oid}:{topology}:{step_index}:{step_source_id}:{target_id}"
-                    if step_source_id in diagram_ids[page_name] and target_id in diagram_ids[page_name]:
-                        tags = normalize_tag_values(targets.get('tags'))
-                        if tags:
-                            for tag in tags:
-                                layer_id = ensure_tag_layer(tag, prefix='logical')
-                                add_link_to_layer(step_source_id, target_id, style_value, targets, layer_id, link_id=link_id)
-                        else:
-                            add_link_to_layer(
-                                source_id=step_source_id,
-                                target_id=target_id,
-                                style=style_value,
-                                data=targets,
-                                layer_id='1',
-                                link_id=link_id
-                            )
-                    elif step_source_id in diagram_ids[page_name] or target_id in diagram_ids[page_name]:
-                        pending_missing_links.add((page_name, step_source_id, target_id))
-                        print(
-                            f"\nWARNING: logical_link {link_oid} on page '{page_name}': "
-                            f"can't draw {topology} edge {step_source_id} -> {target_id}; endpoint missing."
-                        )
-                except KeyError as e:
-                    print(
-                        f"\nINFO : Не найден параметр {e} для объекта "
-                        f"'{pattern['schema']}/{link_oid}' при добавлении связей на диаграмму '{page_name}'."
-                    )
-            continue
-
-        if kwargs.get('network_link'):
-            link_data = targets
-            link_data.setdefault('OID', source_id)
-            link_data.setdefault('schema', schema_name)
-            connections = link_data.get(pattern['targets']) or []
-            if not isinstance(connections, list):
-                continue
-            normalized_connections = [conn for conn in connections if conn]
-            if len(normalized_connections) < 2:
-                continue
-            anchor = next((conn for conn in normalized_connections if conn in diagram_ids[page_name]), None)
-            if not anchor:
-                # все объекты отсутствуют на текущей странице, откладываем проверку
-                for target_id in normalized_connections[1:]:
-                    pending_missing_links.add((page_name, normalized_connections[0], target_id))
-                continue
-
-            style = pattern.get('style', '')
-            technology = link_data.get('technology')
-            if technology:
-                tech_key = f"style.{technology}"
-                style = pattern.get(tech_key, style)
-            style = adjust_link_style(style)
-
-            label = link_data.get('title', '')
-
-            for target_id in normalized_connections:
-                if target_id == anchor:
-                    continue
-                pair_key = tuple(sorted((anchor, target_id)))
-                if pair_key in drawn_pairs:
-                    continue
-                if target_id in diagram_ids[page_name]:
-                    diagram.add_link(source=anchor, target=target_id, style=style, label=label, data=link_data)
-                else:
-                    pending_missing_links.add((page_name, anchor, target_id))
-                drawn_pairs.add(pair_key)
-            continue
-
         try:
             if source_id in diagram_ids[page_name]:  # Объект присутствует на текущей диаграмме
                 if pattern.get('parent_id'):
@@ -718,16 +609,16 @@ def add_links(pattern: Dict[str, Any], **kwargs: bool) -> None:
                             tags = normalize_tag_values(targets.get('tags'))
                             if tags:
                                 for tag in tags:
-                                    layer_id = ensure_tag_layer(tag, prefix='logical')
-                                    add_link_to_layer(source_id, target_id, style_value, targets, layer_id)
+                                    layer_id = ensure_tag_layer(tag, state, prefix='logical')
+                                    edges.append(layer_edge(source_id, target_id, style_value, targets, layer_id))
                             else:
-                                add_link_to_layer(source_id, target_id, style_value, targets, '1')
+                                edges.append(layer_edge(source_id, target_id, style_value, targets, '1'))
                         else:
                             base_style = adjust_link_style(pattern['style'])
-                            diagram.add_link(source=source_id, target=target_id, style=base_style)
+                            edges.append(Edge(source_id, target_id, base_style))
                     else:
                         # Defer logging: cross-page targets are expected; warn later only if missing everywhere
-                        pending_missing_links.add((page_name, source_id, target_id))
+                        state.pending.add((page_name, source_id, target_id), schema_name)
         except KeyError as e:
             pass
             print(f" INFO : Не найден параметр {e} для объекта '{pattern['schema']}/{source_id}' при добавлении связей на диаграмму '{page_name}'.")
@@ -735,23 +626,184 @@ def add_links(pattern: Dict[str, Any], **kwargs: bool) -> None:
             pass
             print(
                 f"Error: у объекта '{source_id}' отсутствует данные для создания линка в параметре {pattern['targets']} ")
+    add_edges(edges)
+
+
+def logical_link_plan(file_name: Optional[str] = None, name: Optional[str] = None) -> LogicalLinkPlan:
+    """
+    План маршрутов logical_links (строится один раз за сборку): для паттерна name файла file_name -
+    записи паттерна с его фильтрами и полем целей, без аргументов - все записи с полем target (общая страница).
+    """
+    key = (file_name, name)
+    if key not in logical_link_plans:
+        if file_name is None:
+            links = d.get_object(conf['data_yaml_file'], SeafSchema.LOGICAL_LINK.value, readonly=True)
+            logical_link_plans[key] = LogicalLinkPlan(links)
+        else:
+            pattern = d.get_pattern_specs(patterns_dir + file_name + '.yaml')[name]
+            links = d.get_object(conf['data_yaml_file'], pattern['schema'], type=pattern.get('type'), readonly=True)
+            logical_link_plans[key] = LogicalLinkPlan(apply_pattern_filters(pattern, links), pattern['targets'])
+    return logical_link_plans[key]
+
+
+def add_logical_links(pattern: Mapping[str, Any], file_name: str, name: str, state: PageState) -> None:
+    """
+    Связи logical_links между объектами текущей страницы. Обрабатываются маршруты плана, затрагивающие
+    объекты страницы (LogicalLinkPlan.visit); маршруты с конечными объектами на других страницах
+    откладываются и рисуются на общей странице.
+    """
+    diagram.drawio_link_object_xml = pattern['xml']
+    plan = logical_link_plan(file_name, name)
+    if plan.routes is None:
+        return
+    page_name = state.name
+    page_ids = diagram_ids[page_name]
+
+    edges = []
+    for route in plan.visit(page_ids, logged_default_topology_links | state.logged_topology):
+        link_oid = route.oid
+        targets = dict(route.record)  # записи read-only: меняем только собственную копию
+        targets['OID'] = link_oid
+        targets['schema'] = pattern['schema']
+
+        topology = normalize_logical_topology(link_oid, targets, state)
+        link_targets = route.targets
+        if not link_targets:
+            continue
 
+        link_steps = route.steps
+        if route.on_page(page_ids) == LINK_CROSS_PAGE:
+            for step_source_id, target_id in link_steps:
+                if step_source_id in page_ids or target_id in page_ids:
+                    state.pending.add((page_name, step_source_id, target_id), pattern['schema'])
+            if conf.get('debug'):
+                print(
+                    f"\nINFO: logical_link {link_oid} on page '{page_name}': "
+                    "skipped because the route has endpoints outside this page."
+                )
+            continue
 
-def collect_ids():
+        for step_index, (step_source_id, target_id) in enumerate(link_steps):
+            try:
+                style_value = logical_link_style(targets['direction'], pattern)
+                link_id = f"{link_oid}:{topology}:{step_index}:{step_source_id}:{target_id}"
+                if step_source_id in page_ids and target_id in page_ids:
+                    tags = normalize_tag_values(targets.get('tags'))
+                    if tags:
+                        for tag in tags:
+                            layer_id = ensure_tag_layer(tag, state, prefix='logical')
+                            edges.append(layer_edge(step_source_id, target_id, style_value, targets, layer_id,
+                                                    link_id=link_id))
+                    else:
+                        edges.append(layer_edge(
+                            source_id=step_source_id,
+                            target_id=target_id,
+                            style=style_value,
+                            data=targets,
+                            layer_id='1',
+                            link_id=link_id
+                        ))
+                elif step_source_id in page_ids or target_id in page_ids:
+                    state.pending.add((page_name, step_source_id, target_id), pattern['schema'])
+                    print(
+                        f"\nWARNING: logical_link {link_oid} on page '{page_name}': "
+                        f"can't draw {topology} edge {step_source_id} -> {target_id}; endpoint missing."
+                    )
+            except KeyError as e:
+                print(
+                    f"\nINFO : Не найден параметр {e} для объекта "
+                    f"'{pattern['schema']}/{link_oid}' при добавлении связей на диаграмму '{page_name}'."
+                )
+    add_edges(edges)
+
+
+def network_link_index(file_name: str, name: str) -> NetworkLinkIndex:
+    """Индекс узел -> связи network_links для паттерна name файла file_name (строится один раз за сборку)."""
+    key = (file_name, name)
+    if key not in network_link_indexes:
+        pattern = d.get_pattern_specs(patterns_dir + file_name + '.yaml')[name]
+        links = d.get_object(conf['data_yaml_file'], SeafSchema.NETWORK_LINK.value, readonly=True)
+        network_link_indexes[key] = NetworkLinkIndex(apply_pattern_filters(pattern, links), pattern['targets'])
+    return network_link_indexes[key]
+
+
+def add_network_links(pattern: Mapping[str, Any], file_name: str, name: str, state: PageState) -> None:
+    """
+    Дополнительные связи из seaf.company.ta.services.network_links между объектами текущей страницы.
+    Проверяются только связи, затрагивающие объекты страницы (NetworkLinkIndex); связи без объектов
+    на странице откладываются одной записью индекса (PendingLinks.defer).
+    """
+    diagram.drawio_link_object_xml = pattern['xml']
+    schema_name = SeafSchema.NETWORK_LINK.value
+    index = network_link_index(file_name, name)
+    if index.records is None:
+        return
+    page_name = state.name
+    page_ids = diagram_ids.get(page_name, set())
+    touched = index.touching(page_ids)
+
+    eligible_links = {}
+    for position in touched:
+        if sum(1 for node_id in index.connections[position] if node_id in page_ids) >= 2:
+            eligible_links[index.oids[position]] = index.records[index.oids[position]]
+    if eligible_links:
+        state.expected_counts.setdefault(schema_name, set()).update(list(eligible_links.keys()))
+        state.expected_data.setdefault(schema_name, {}).update(eligible_links)
+
+    # все объекты остальных связей отсутствуют на текущей странице, откладываем проверку
+    state.pending.defer(page_name, (file_name, name), touched, schema_name)
+
+    drawn_pairs = set()
+    edges = []
+    for position in touched:
+        if not index.drawable[position]:
+            continue
+        link_oid = index.oids[position]
+        link_data = dict(index.records[link_oid])
+        link_data.setdefault('OID', link_oid)
+        link_data.setdefault('schema', schema_name)
+        connections = index.connections[position]
+        anchor = next(conn for conn in connections if conn in page_ids)
+
+        style = pattern.get('style', '')
+        technology = link_data.get('technology')
+        if technology:
+            tech_key = f"style.{technology}"
+            style = pattern.get(tech_key, style)
+        style = adjust_link_style(style)
+
+        label = link_data.get('title', '')
+
+        for target_id in connections:
+            if target_id == anchor:
+                continue
+            pair_key = tuple(sorted((anchor, target_id)))
+            if pair_key in drawn_pairs:
+                continue
+            if target_id in page_ids:
+                edges.append(Edge(anchor, target_id, style, link_data, label=label))
+            else:
+                state.pending.add((page_name, anchor, target_id), schema_name)
+            drawn_pairs.add(pair_key)
+    add_edges(edges)
+
+
+def collect_ids(pattern: PatternSpec, name: str, objects: Mapping[str, Any], state: PageState):
     try:
-        schema_key = object_pattern['schema']
-        expected_counts.setdefault(schema_key, set()).update(list(object_data.keys()))
-        expected_data.setdefault(schema_key, {}).update(object_data)
+        schema_key = pattern['schema']
+        if state.collect_expected:
+            state.expected_counts.setdefault(schema_key, set()).update(list(objects.keys()))
+            state.expected_data.setdefault(schema_key, {}).update(objects)
         # Record pattern spec for diagnostics
         type_key, type_val = None, None
-        if object_pattern.get('type'):
-            if ':' in object_pattern['type']:
-                type_key, type_val = object_pattern['type'].split(':', 1)
+        if pattern.get('type'):
+            if ':' in pattern['type']:
+                type_key, type_val = pattern['type'].split(':', 1)
             else:
-                type_key, type_val = 'type', object_pattern['type']
-        pattern_specs.setdefault(schema_key, []).append({
-            'pattern_name': k,
-            'parent_id': object_pattern.get('parent_id'),
+                type_key, type_val = 'type', pattern['type']
+        state.pattern_specs.setdefault(schema_key, []).append({
+            'pattern_name': name,
+            'parent_id': pattern.get('parent_id'),
             'type_key': type_key,
             'type_val': type_val,
         })
@@ -760,40 +812,12 @@ def collect_ids():
 
 
 def common_only_logical_link_ids() -> Set[str]:
-    logical_links = d.get_object(conf['data_yaml_file'], SeafSchema.LOGICAL_LINK.value)
-    if not isinstance(logical_links, dict):
-        return set()
-
-    result = set()
-    page_id_sets = {
-        name: ids
-        for name, ids in diagram_ids.items()
-        if name != 'Main Schema'
-    }
-    for link_oid, link_data in logical_links.items():
-        if not isinstance(link_data, dict):
-            continue
-        source_id = link_data.get('source')
-        target_ids = logical_link_targets(link_data)
-        if not source_id or not target_ids:
-            continue
-        route_ids = [source_id] + target_ids
-        pages_with_any = [
-            name
-            for name, ids in page_id_sets.items()
-            if any(route_id in ids for route_id in route_ids)
-        ]
-        all_endpoints_present = all(
-            any(route_id in ids for ids in page_id_sets.values())
-            for route_id in route_ids
-        )
-        fully_drawable_on_page = any(
-            all(route_id in ids for route_id in route_ids)
-            for ids in page_id_sets.values()
-        )
-        if len(pages_with_any) > 1 and all_endpoints_present and not fully_drawable_on_page:
-            result.add(link_oid)
-    return result
+    """
+    Межстраничные logical_links: все конечные объекты размещены на страницах локаций, но ни на одной
+    странице вместе. Такие связи проверяются только на общей странице.
+    """
+    routes = logical_link_plan().classify(node_pages, ignored_pages=('Main Schema',))
+    return {link_oid for link_oid, kind in routes.items() if kind == LINK_CROSS_PAGE}
 
 
 def exclude_common_only_logical_links_from_verification() -> None:
@@ -811,20 +835,50 @@ def exclude_common_only_logical_links_from_verification() -> None:
     )
 
 
-def run_auto_layout_if_enabled(conf: Dict[str, Any]) -> None:
+def auto_layout_targets(conf: Dict[str, Any], pages: List[str]) -> List[str]:
+    """
+    Страницы для раскладки при инкрементальной сборке: перестроенные страницы,
+    ограниченные настройками auto_layout_diagram / auto_layout_filter.
+    """
+    names = [incremental.unescape_name(name) for name in pages]
+    configured = str(conf.get('auto_layout_diagram') or '').strip()
+    if configured and configured.lower() != 'all':
+        allowed = {part.strip() for part in configured.split(',') if part.strip()}
+        return [name for name in names if name in allowed]
+    keywords = [part.strip().lower() for part in str(conf.get('auto_layout_filter') or '').split(',') if part.strip()]
+    if keywords:
+        names = [name for name in names if any(keyword in name.lower() for keyword in keywords)]
+    return names
+
+
+def run_auto_layout_if_enabled(conf: Dict[str, Any], pages: Optional[List[str]] = None) -> None:
+    """
+    :param pages: при инкрементальной сборке - перестроенные страницы; раскладка запускается только для них.
+    """
     if not conf.get('auto_layout_grid'):
         return
 
     segment_script_path = conf.get('auto_layout_segment_script', os.path.join('scripts', 'layout_segments.py'))
     script_path = conf.get('auto_layout_script', os.path.join('scripts', 'layout_tech_services.py'))
 
+    diagram_arg = conf.get('auto_layout_diagram')
+    diagram_filter = conf.get('auto_layout_filter')
+    if pages is not None:
+        targets = auto_layout_targets(conf, pages)
+        if not targets:
+            print("\n> Автоматическая раскладка не требуется: перестроенные страницы не входят в её область.")
+            return
+        # Имена в --diagram разделяются запятыми; страницы с запятой в имени раскладываются по настройкам
+        if not any(',' in name for name in targets):
+            diagram_arg, diagram_filter = ','.join(targets), None
+
     print("\n> Запускаю автоматическую раскладку по сетке ...")
     def run_postprocess(script_to_run: str, label: str) -> None:
         cmd = [sys.executable, '-X', 'utf8', script_to_run, '-i', conf['output_file']]
-        if conf.get('auto_layout_diagram'):
-            cmd.extend(['--diagram', conf['auto_layout_diagram']])
-        if conf.get('auto_layout_filter'):
-            cmd.extend(['--diagram-filter', conf['auto_layout_filter']])
+        if diagram_arg:
+            cmd.extend(['--diagram', diagram_arg])
+        if diagram_filter:
+            cmd.extend(['--diagram-filter', diagram_filter])
         try:
             completed = subprocess.run(cmd, check=False, capture_output=True, text=True)
             if completed.stdout:
@@ -1132,8 +1186,8 @@ def _reset_edge_geometry(element: ET.Element) -> None:
 
 
 def _create_common_provider_node(provider_id: str, label: str, x: float, y: float) -> ET.Element:
-    safe_id = saxutils.escape(provider_id, entities={'"': "&quot;", "'": "&apos;"})
-    safe_label = saxutils.escape(label, entities={'"': "&quot;", "'": "&apos;"})
+    safe_id = escape_attr(provider_id)
+    safe_label = escape_attr(label)
     return ET.fromstring(f"""
     <object id="{safe_id}" label="{safe_label}" common_provider="true">
       <mxCell style="shape=cloud;whiteSpace=wrap;html=1;fillColor=#f5f5f5;strokeColor=#666666;align=center;verticalAlign=middle;fontStyle=1;" vertex="1" parent="1">
@@ -1149,13 +1203,7 @@ def _common_tag_layer_id(tag: str) -> str:
 
 def _ensure_common_tag_layer(common_root: ET.Element, tag: str) -> str:
     layer_id = _common_tag_layer_id(tag)
-    if common_root.find(f"./mxCell[@id='{layer_id}']") is None:
-        common_root.append(ET.Element('mxCell', {
-            'id': layer_id,
-            'value': str(tag),
-            'parent': '0',
-            'visible': '0',
-        }))
+    tag_layers.ensure(common_root, layer_id, str(tag))
     return layer_id
 
 
@@ -1266,27 +1314,37 @@ def _draw_common_logical_links(
     common_root: ET.Element,
     common_refs_by_original: Dict[str, List[Dict[str, Any]]],
 ) -> None:
-    logical_links = d.get_object(conf['data_yaml_file'], SeafSchema.LOGICAL_LINK.value)
-    if not isinstance(logical_links, dict):
+    plan = logical_link_plan()
+    if plan.routes is None:
         return
 
+    common_page_name = conf.get('common_location_page_name', 'Общая схема')
+    # Маршруты с объектами, не размещёнными ни на одной странице локаций, на общей странице не рисуются
+    kinds = plan.classify(node_pages, ignored_pages=('Main Schema',))
     drawn_edges = 0
     skipped_edges = 0
-    for link_oid, link_data in logical_links.items():
-        if not isinstance(link_data, dict):
-            continue
-        source_id = link_data.get('source')
+    for route in plan.routes:
+        link_oid = route.oid
+        link_data = dict(route.record)  # normalize_logical_topology изменяет запись
+        source_id = route.source
         if not source_id:
             continue
-        topology = normalize_logical_topology(link_oid, link_data)
-        target_ids = logical_link_targets(link_data)
-        if not target_ids:
+        topology = normalize_logical_topology(link_oid, link_data, page=common_page_name)
+        if not route.targets:
+            continue
+        if kinds.get(link_oid) == LINK_MISSING_ENDPOINT:
+            missing = [node for node in route.endpoints if not node_pages.get(node, set()) - {'Main Schema'}]
+            skipped_edges += len(route.steps)
+            print(
+                f"\nWARNING: logical_link {link_oid} on common page: "
+                f"skipped; endpoints not placed on location pages: {', '.join(map(str, missing))}."
+            )
             continue
         style = logical_link_style(str(link_data.get('direction') or '==>'))
         tags = normalize_tag_values(link_data.get('tags'))
         parent_ids = [_ensure_common_tag_layer(common_root, tag) for tag in tags] if tags else ['1']
 
-        for step_index, (step_source_id, target_id) in enumerate(logical_link_steps(source_id, target_ids, topology)):
+        for step_index, (step_source_id, target_id) in enumerate(route.steps):
             source_refs = common_refs_by_original.get(step_source_id, [])
             target_refs = common_refs_by_original.get(target_id, [])
             if not source_refs or not target_refs:
@@ -1484,85 +1542,559 @@ def build_common_location_page(conf: Dict[str, Any], source_pages: List[str]) ->
     tree.write(output_file, encoding='utf-8', xml_declaration=True)
 
 
-if __name__ == '__main__':
+def render_page(file_name: str, name: str, state: PageState, skip: bool = False) -> PageState:
+    """
+    Формирует страницу по паттернам файла file_name.
+    При skip=True объекты и связи не рисуются (страница будет взята из предыдущего результата),
+    но создаются дочерние страницы и собираются ожидаемые объекты для проверки.
 
-    if sys.version_info < (3, 9):
-        print("Этот скрипт требует Python версии 3.9 или выше.")
-        sys.exit(1)
+    :param state: состояние страницы, которое пополняется при формировании (см. PageState).
+    :return: state; общее состояние сборки дополняется им в merge_page_state().
+    """
+    page_name = name
+    diagram.go_to_diagram(page_name)
+    if skip:
+        print(f"\n> Страница \033[32m{page_name}\033[0m не изменилась, используется предыдущий результат ", end='')
+    else:
+        print(f"\n> Формирую диаграмму страницы \033[32m{page_name}\033[0m ", end='')
+    pattern_definitions = d.get_pattern_specs(patterns_dir + file_name + '.yaml')
+    dispatch = get_pattern_dispatch(file_name)
+    claims = state.claims
+    for k, object_pattern in pattern_definitions.items():
+        print('.', end='')
+        if object_pattern.get('schema'):
+            state.schemas.add(object_pattern['schema'])
+        try:
+            # Записи паттерна отобраны заранее для всех страниц файла паттернов
+            object_data = dispatch.objects[k]
 
-    conf = cli_vars(d.load_config("config.yaml")['seaf2drawio'])
-    link_style_override = (conf.get('link_style') or '').lower()
+            add_pages(object_pattern, k, page_name)
+            # Координаты, счётчик объектов и последний родитель паттерна на текущей странице
+            cursor = LayoutCursor(object_pattern)
 
-    data_store = d.get_merged_yaml(conf['data_yaml_file'])
+            # Collect expected IDs and data per schema (for verification); выборка паттерна одинакова
+            # для всех страниц файла, поэтому ожидаемые объекты добавляются при первой странице (collect_expected)
+            collect_ids(object_pattern, k, object_data, state)
 
-    diagram.from_xml(d.read_file_with_utf8(conf['drawio_pattern']))
-    
-    # Удаляем устаревшие связи перед добавлением новых
-    remove_obsolete_links(diagram, conf['data_yaml_file'], 'seaf.company.ta.components.networks')
-    
-    diagram_ids['Main Schema'] = set(d.get_object(conf['data_yaml_file'], root_object).keys())
+            if skip:
+                continue
+
+            cursor.plan(layout_plan(object_pattern, object_data, page_name))
+            for i in list(object_data.keys()):
+                if i in diagram.nodes_ids[diagram.current_diagram_id]:
+                    diagram.update_node(id=i, data=object_data[i])
+                    add_page_ids(page_name, [i])
+                else:
+                    # add_object дописывает в запись служебные поля, поэтому передаём копию
+                    add_object(object_pattern, k, cursor, dict(object_data[i]), i, state)
+                    if i not in claims and i in diagram_ids[page_name]:
+                        claims[i] = k
+
+        except KeyError as e:
+            pass
+            print(f' INFO : В файле данных отсутствуют объекты {object_pattern["schema"]} для добавления на диаграмму {page_name}')
+
+        if skip:
+            continue
+
+        if bool(re.match(r'^network_links(_\d+)*',k)):
+            add_links(object_pattern, state, pattern_name=k)  # Связывание объектов на текущей диаграмме
+            if k == 'network_links':
+                add_network_links(object_pattern, file_name, k, state)  # Дополнительные связи из seaf.ta.services.network_links
+
+        if bool(re.match(r'^logical_links(_\d+)*', k)):
+            add_logical_links(object_pattern, file_name, k, state)  # Связывание объектов на текущей диаграмме
+
+    state.ids = diagram_ids.get(page_name, set())
+    return state
+
+
+def get_pattern_dispatch(file_name: str) -> PatternDispatch:
+    """Распределение записей по паттернам файла file_name (строится один раз за сборку)."""
+    if file_name not in pattern_dispatch:
+        path = patterns_dir + file_name + '.yaml'
+        pattern_dispatch[file_name] = PatternDispatch(d.get_pattern_specs(path), d, conf['data_yaml_file'],
+                                                      apply_pattern_filters, table=d.get_dispatch_table(path))
+    return pattern_dispatch[file_name]
+
+
+def print_pattern_claims() -> None:
+    """Отладочный отчёт: сколько объектов нарисовал каждый паттерн страницы и кому достались спорные OID."""
+    print('\n> Объекты, размещённые паттернами:')
     for file_name, pages in diagram_pages.items():
+        dispatch = pattern_dispatch.get(file_name)
+        for page in pages:
+            claims = pattern_claims.get(page)
+            if not claims or dispatch is None:
+                continue
+            print(f"  Page: {page}")
+            counts = {}
+            for pattern_name in claims.values():
+                counts[pattern_name] = counts.get(pattern_name, 0) + 1
+            for pattern_name, count in counts.items():
+                print(f"    {pattern_name}: {count}")
+            for oid, pattern_name in claims.items():
+                others = [name for name in dispatch.claims.get(oid, ()) if name != pattern_name]
+                if others:
+                    print(f"    - {oid}: {pattern_name} (отобран также: {', '.join(others)})")
+
+
+def restore_page_state(name: str, info: Mapping[str, Any]) -> None:
+    """Восстанавливает ID объектов, отложенные связи и схемы страницы, взятой из предыдущего результата."""
+    add_page_ids(name, info.get('ids', []))
+    pending_missing_links.update((name, *link) for link in info.get('pending', []))
+    page_schemas.setdefault(name, set()).update(info.get('schemas', []))
+
+
+def build_pages(skip_pages: Set[str], restored: Dict[str, Any], cache: Optional[PageCache] = None,
+                inputs: Optional[PageInputs] = None) -> Dict[str, Any]:
+    """
+    Формирует все страницы. Для страниц из skip_pages восстанавливаются ID объектов и отложенные связи
+    из манифеста предыдущей сборки. Страницы, найденные в кэше страниц, не строятся.
+
+    :return: dict {page: <diagram>} страниц из кэша страниц (подставляются после раскладки).
+    """
+    add_page_ids('Main Schema', d.get_object(conf['data_yaml_file'], root_object, readonly=True).keys())
+    # Все объекты корневой схемы размещаются на Main Schema без ссылок на другие объекты страницы
+    page_root_schemas.setdefault('Main Schema', set()).add(root_object.value)
+    for name in skip_pages:
+        restore_page_state(name, restored.get(name, {}))
+
+    cached = {}
+
+    def skip_page(file_name: str, name: str) -> bool:
+        if name in skip_pages:
+            return True
+        if cache is None:
+            return False
+        entry = cache.lookup(name, partial(page_fingerprint, inputs, file_name, name))
+        if entry is None:
+            return False
+        restore_page_state(name, entry)
+        cached[name] = entry['diagram']
+        return True
 
-        for page_name in pages:
+    # Ожидаемые объекты паттернов собираются по первой странице каждого файла паттернов
+    collected_files = set()
 
-            diagram.go_to_diagram(page_name)
-            print(f"\n> Формирую диаграмму страницы \033[32m{page_name}\033[0m ", end='')
-            pattern_definitions = d.get_pattern(patterns_dir + file_name + '.yaml')
-            for k, object_pattern in pattern_definitions.items():
-                print('.', end='')
-                try:
-                    object_data = d.get_object(conf['data_yaml_file'], object_pattern['schema'], type=object_pattern.get('type'),
-                        sort=object_pattern['parent_id'] if object_pattern.get('parent_id') else None)
-
-                    object_data = apply_pattern_filters(object_pattern, object_data)
-
-                    add_pages(object_pattern)
-                    object_pattern.update({
-                                'count': 0,               # Счетчик объектов
-                                'last_parent': '',        # Триггер для отслеживания изменения родительского объекта
-                                'last_parent_type': '',   # Последний фактический контейнер (parent_key)
-                                '_position_by_parent_type': {},
-                                'parent': ''              # Родительский объект
-                    })
-                    default_pattern = deepcopy(object_pattern)
-
-                    # Collect expected IDs and data per schema (for verification)
-                    collect_ids()
-
-                    for i in list(object_data.keys()):
-                        if i in diagram.nodes_ids[diagram.current_diagram_id]:
-                            diagram.update_node(id=i, data=object_data[i])
-                            diagram_ids.setdefault(page_name, set()).add(i)
-                        else:
-                            add_object(object_pattern, object_data[i], i)
+    def new_page_state(file_name: str, name: str) -> PageState:
+        state = PageState(name, PendingLinks(pending_missing_links.resolve), file_name not in collected_files)
+        collected_files.add(file_name)
+        return state
+
+    # Main Schema строится первой: паттерны с ext_page создают на ней страницы локаций
+    for name in diagram_pages.get('main', []):
+        merge_page_state(render_page('main', name, new_page_state('main', name), skip=skip_page('main', name)))
+    tasks = [(file_name, name, skip_page(file_name, name))
+             for file_name, pages in diagram_pages.items() if file_name != 'main' for name in pages]
+
+    workers = d.resolve_workers(conf.get('page_workers', 1), len(tasks))
+    if workers > 1 and not parallel_pages_supported():
+        workers = 1
+    if workers > 1:
+        try:
+            render_pages_parallel(tasks, workers)
+            return cached
+        except (OSError, ValueError) as e:
+            print(f"WARNING: параллельная генерация страниц недоступна ({e}), страницы формируются последовательно.")
+    for file_name, name, skip in tasks:
+        merge_page_state(render_page(file_name, name, new_page_state(file_name, name), skip=skip))
+    return cached
+
+
+def pattern_schemas(file_name: str) -> Set[str]:
+    """Схемы паттернов файла file_name."""
+    return {pattern['schema'] for pattern in d.get_pattern_specs(patterns_dir + file_name + '.yaml').values()
+            if isinstance(pattern, Mapping) and pattern.get('schema')}
+
+
+def page_fingerprint(inputs: PageInputs, file_name: str, name: str, ids: Any) -> str:
+    """Отпечаток входов страницы name (паттерны file_name) для набора ID её объектов."""
+    return inputs.fingerprint(ids, pattern_schemas(file_name), page_root_schemas.get(name, ()))
+
+
+def store_cached_pages(cache: PageCache, inputs: PageInputs, output_file: str, pages: List[str]) -> None:
+    """Сохраняет в кэш страниц построенные страницы output_file (после раскладки)."""
+    page_files = {name: file_name for file_name, names in diagram_pages.items() for name in names}
+    for name, element in incremental.load_diagrams(output_file, pages).items():
+        ids = diagram_ids.get(name, set())
+        cache.store(name, ids, page_fingerprint(inputs, page_files[name], name, ids), element,
+                    [[source, target, schema]
+                     for (source, target), schema in pending_missing_links.for_page(name).items()],
+                    page_schemas.get(name, ()))
 
-                except KeyError as e:
-                    pass
-                    print(f' INFO : В файле данных отсутствуют объекты {object_pattern["schema"]} для добавления на диаграмму {page_name}')
 
-                if bool(re.match(r'^network_links(_\d+)*',k)):
-                    add_links(object_pattern, pattern_name=k)  # Связывание объектов на текущей диаграмме
-                    if k == 'network_links':
-                        add_links(object_pattern, network_link=True)  # Дополнительные связи из seaf.ta.services.network_links
+def parallel_pages_supported() -> bool:
+    """Страницы локаций можно строить независимо, если их паттерны не создают новых страниц (ext_page)."""
+    for file_name in diagram_pages:
+        if file_name == 'main':
+            continue
+        for pattern in d.get_pattern_specs(patterns_dir + file_name + '.yaml').values():
+            if isinstance(pattern, Mapping) and pattern.get('ext_page'):
+                print(f"WARNING: паттерны {file_name} создают страницы (ext_page), страницы формируются последовательно.")
+                return False
+    return True
+
+
+def render_pages_parallel(tasks: List[tuple], workers: int) -> None:
+    """
+    Формирует страницы локаций в пуле процессов (fork): каждый процесс получает копию загруженных данных,
+    паттернов и распределения записей, строит свою страницу и возвращает её <diagram>, ID объектов,
+    отложенные связи и собранные для проверки данные. Результаты объединяются в порядке страниц,
+    поэтому файл и лог совпадают с последовательной генерацией.
+    """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        raise OSError('метод запуска процессов fork не поддерживается')
+    # Распределение записей, индексы network_links и планы logical_links строятся до запуска пула
+    # и наследуются процессами
+    for file_name in {file_name for file_name, _, _ in tasks}:
+        get_pattern_dispatch(file_name)
+        for name in d.get_pattern_specs(patterns_dir + file_name + '.yaml'):
+            if name == 'network_links':
+                network_link_index(file_name, name)
+            if re.match(r'^logical_links(_\d+)*', name):
+                logical_link_plan(file_name, name)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        for result in pool.map(render_page_task, tasks):
+            merge_page_result(result)
+
+
+def render_page_task(task: tuple) -> Dict[str, Any]:
+    """
+    Строит одну страницу в процессе пула и возвращает её результат для merge_page_result(): <diagram>,
+    ID узлов и связей страницы и PageState. Каждая задача собирает ожидаемые объекты файла паттернов заново,
+    merge_page_state() объединяет их.
+    """
+    file_name, name, skip = task
+    d.parse_workers = 1
+    state = PageState(name, PendingLinks(pending_missing_links.resolve))
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        render_page(file_name, name, state, skip=skip)
+    page_id = diagram.current_diagram_id
+    return {
+        'output': output.getvalue(),
+        'page_id': page_id,
+        'diagram': diagram.current_diagram,
+        'nodes': list(diagram.nodes_ids.get(page_id, ())),
+        'edges': list(diagram.edges_ids.get(page_id, ())),
+        'state': state,
+        'loaded_schemas': loaded_schemas(),
+    }
+
+
+def merge_page_result(result: Dict[str, Any]) -> None:
+    """Подставляет страницу, построенную в пуле, в диаграмму и объединяет её состояние с общим."""
+    state = result['state']
+    output = result['output']
+    # Сообщение о топологии по умолчанию выводится один раз: страница не знает о связях других процессов
+    for link_oid in sorted(state.logged_topology):
+        if link_oid in logged_default_topology_links:
+            output = output.replace(default_topology_message(link_oid, state.name) + '\n', '', 1)
+    sys.stdout.write(output)
+
+    page_id = result['page_id']
+    for index, item in enumerate(diagram.drawing):
+        if item.tag == 'diagram' and item.attrib.get('id') == page_id:
+            diagram.drawing[index] = result['diagram']
+            break
+    diagram.nodes_ids[page_id] = type(diagram.nodes_ids.get(page_id, []))(result['nodes'])
+    diagram.edges_ids[page_id] = type(diagram.edges_ids.get(page_id, []))(result['edges'])
+
+    merge_page_state(state)
+    if isinstance(data_store, LazyDataStore) and conf.get('incremental'):
+        # Манифест учитывает схемы, прочитанные при сборке, в том числе в процессах пула
+        for schema in result['loaded_schemas']:
+            data_store.get(schema)
+
+
+def merge_page_state(state: PageState) -> None:
+    """Дополняет общее состояние сборки состоянием построенной страницы."""
+    name = state.name
+    add_page_ids(name, state.ids)
+    pending_missing_links.update(state.pending)
+    page_schemas.setdefault(name, set()).update(state.schemas)
+    pattern_claims[name] = state.claims
+    for schema, ids in state.expected_counts.items():
+        expected_counts.setdefault(schema, set()).update(ids)
+    for schema, records in state.expected_records(
+            lambda schema: d.get_object(conf['data_yaml_file'], schema, readonly=True)):
+        expected_data.setdefault(schema, {}).update(records)
+    for schema, specs in state.pattern_specs.items():
+        pattern_specs.setdefault(schema, []).extend(specs)
+    logged_default_topology_links.update(state.logged_topology)
+
+
+def page_source_schemas() -> Set[str]:
+    """Схемы объектов, для которых паттерны создают отдельные страницы (ext_page)."""
+    result = set()
+    for file_name in diagram_pages:
+        pattern_definitions = d.get_pattern_specs(patterns_dir + file_name + '.yaml')
+        for pattern in pattern_definitions.values():
+            if isinstance(pattern, dict) and pattern.get('ext_page') and pattern.get('schema'):
+                result.add(pattern['schema'])
+    return result
+
+
+def incremental_inputs(conf: Dict[str, Any]) -> tuple:
+    """Подпись неизменяемых входов и описание файлов данных для инкрементальной сборки."""
+    signature = generation_signature(conf)
+    sources = incremental.scan_sources(
+        d.expand_yaml_paths(conf['data_yaml_file']),
+        partial(scan_yaml_keys_cached, cache=d.parse_cache),
+        lambda path: d.read_and_merge_yaml([path], cache=d.parse_cache),
+    )
+    return signature, sources
+
+
+def generation_signature(conf: Dict[str, Any]) -> str:
+    """Подпись паттернов, шаблона drawio, кода генератора и значимых настроек."""
+    pattern_files = [os.path.join(patterns_dir, name) for name in os.listdir(patterns_dir)
+                     if name.endswith(('.yaml', '.yml'))]
+    lib_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+    code_files = [os.path.abspath(__file__)] + [os.path.join(lib_dir, name) for name in os.listdir(lib_dir)
+                                                if name.endswith('.py')]
+    if conf.get('auto_layout_grid'):
+        code_files += [conf.get('auto_layout_segment_script', os.path.join('scripts', 'layout_segments.py')),
+                       conf.get('auto_layout_script', os.path.join('scripts', 'layout_tech_services.py'))]
+    return incremental.build_signature(conf, pattern_files, code_files)
+
+
+def loaded_schemas() -> List[str]:
+    if isinstance(data_store, LazyDataStore):
+        return data_store.loaded_schemas
+    return list(data_store.keys()) if isinstance(data_store, Mapping) else []
+
+
+def create_diagram(conf: Dict[str, Any]) -> Any:
+    """Создаёт документ DrawIO выбранной реализации (drawio_writer: n2g | native)."""
+    writer = str(conf.get('drawio_writer') or 'n2g').lower()
+    if writer == 'native':
+        return DrawioWriter()
+    if writer != 'n2g':
+        print(f"WARNING: неизвестное значение drawio_writer '{writer}', используется n2g")
+    return drawio_diagram()
+
+
+def reset_generation_state() -> None:
+    """Очищает состояние предыдущей генерации (диаграмма, страницы, счётчики) перед повторной сборкой."""
+    global diagram
+
+    diagram = create_diagram(conf)
+    diagram_pages.clear()
+    diagram_pages.update({'main': ['Main Schema'], 'office': [], 'dc': []})
+    diagram_ids.clear()
+    diagram_ids['Main Schema'] = set()
+    for state in (pending_missing_links, page_schemas, page_root_schemas, logged_default_topology_links,
+                  expected_counts, expected_data, pattern_specs, pattern_dispatch, pattern_claims, network_link_indexes, node_pages, logical_link_plans,
+                  tag_layers):
+        state.clear()
+
+
+def temporary_output(output_file: str) -> str:
+    """Временный файл рядом с output_file: результат заменяет его атомарно после всех постобработок."""
+    folder = os.path.dirname(output_file) or '.'
+    os.makedirs(folder, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=folder, prefix=f'.{os.path.basename(output_file)}.', suffix='.tmp')
+    os.close(fd)
+    return path
+
+
+def generate(conf: Dict[str, Any]) -> None:
+    """Формирует output_file по данным, паттернам и шаблону; файл заменяется атомарно."""
+    global data_store
+
+    output_file = conf['output_file']
+    data_store = d.get_merged_yaml(conf['data_yaml_file'])
+
+    plan = None
+    old_diagrams = {}
+    if conf.get('incremental'):
+        signature, sources = incremental_inputs(conf)
+        manifest = incremental.load_manifest(incremental.manifest_path(output_file))
+        plan = incremental.plan_build(manifest, signature, sources, data_store, page_source_schemas(), output_file)
+        if plan['mode'] == 'noop':
+            if incremental.output_matches(manifest, output_file):
+                print(f"> Инкрементальная сборка: {plan['reason']}, {output_file} не изменён.")
+                return
+            plan = {'mode': 'full', 'reason': f'файл {output_file} изменён после предыдущей сборки',
+                    'render': set(), 'skip': set()}
+        print(f"> Инкрементальная сборка: {plan['reason']}"
+              + (f"; перестраиваются страницы: {', '.join(sorted(plan['render']))}" if plan['mode'] == 'partial'
+                 else '; выполняется полная сборка'))
+        if plan['mode'] == 'partial':
+            old_diagrams = incremental.load_diagrams(output_file, plan['skip'])
+            # Страница, которую не удалось прочитать из предыдущего результата, перестраивается
+            plan['skip'] = set(old_diagrams)
 
-                if bool(re.match(r'^logical_links(_\d+)*', k)):
-                    add_links(object_pattern, logical_link=True)  # Связывание объектов на текущей диаграмме
+    diagram.from_xml(d.read_file_with_utf8(conf['drawio_pattern']))
+    
+    # Удаляем устаревшие связи перед добавлением новых
+    remove_obsolete_links(diagram, conf['data_yaml_file'], 'seaf.company.ta.components.networks', d)
+    
+    skip_pages = plan['skip'] if plan and plan['mode'] == 'partial' else set()
+    cache = PageCache.from_config(conf, generation_signature(conf))
+    inputs = None
+    if cache is not None:
+        inputs = PageInputs(data_store, set().union(*(pattern_schemas(file_name) for file_name in diagram_pages),
+                                                     {root_object.value}))
+    cached_pages = build_pages(skip_pages, manifest.get('pages', {}) if skip_pages else {}, cache, inputs)
+    if cached_pages:
+        skip_pages = set(skip_pages) | set(cached_pages)
+        old_diagrams = dict(old_diagrams, **cached_pages)
+    if conf.get('debug'):
+        print_pattern_claims()
+        print_filter_stats()
 
     print('\n')
     exclude_common_only_logical_links_from_verification()
     # Verifying drawn links & objects ...
     try:
-        draw_verify(diagram_ids, diagram, pending_missing_links)
+        draw_verify(diagram_ids, diagram, pending_missing_links, sample_size=conf['missing_links_sample'],
+                    report_path=conf.get('missing_links_report') or None)
     except Exception as e:
         print(f"WARNING: Verification failed (skipping): {e}")
 
-    d.dump_file(filename=os.path.basename(conf['output_file']), folder=os.path.dirname(conf['output_file']),
-                content=diagram.drawing if os.path.dirname(conf['output_file']) else './')
+    # Постобработка выполняется над временным файлом, чтобы output_file не оставался записанным частично
+    work_file = temporary_output(output_file)
+    work_conf = dict(conf, output_file=work_file)
+    try:
+        d.dump_file(filename=os.path.basename(work_file), folder=os.path.dirname(work_file),
+                    content=diagram.drawing)
+
+        page_order = [name for pages in diagram_pages.values() for name in pages]
+        run_auto_layout_if_enabled(work_conf,
+                                   [name for name in page_order if name not in skip_pages] if skip_pages else None)
 
-    run_auto_layout_if_enabled(conf)
+        if old_diagrams:
+            spliced = incremental.splice_diagrams(work_file, old_diagrams)
+            print(f"\n> Подставлены страницы предыдущей сборки: {', '.join(spliced)}")
+        if cache is not None:
+            store_cached_pages(cache, inputs, work_file, [name for name in page_order if name not in skip_pages])
+            print(f"\n{cache.summary()}")
 
-    # Check additional result info ...
-    advanced_analysis(conf, expected_counts, expected_data, pattern_specs, d)
+        # Check additional result info ...
+        advanced_analysis(work_conf, expected_counts, expected_data, pattern_specs, d)
+
+        build_common_location_page(work_conf, diagram_pages.get('office', []) + diagram_pages.get('dc', []))
+        bring_logical_links_to_front(work_file)
+
+        os.chmod(work_file, 0o644)
+        os.replace(work_file, output_file)
+    finally:
+        if os.path.exists(work_file):
+            os.remove(work_file)
+
+    if conf.get('incremental'):
+        incremental.save_manifest(
+            incremental.manifest_path(output_file),
+            incremental.build_manifest(signature, sources, data_store,
+                                       set(loaded_schemas()) | (set(manifest.get('records', {}))
+                                                                if plan['mode'] == 'partial' else set()),
+                                       diagram_ids, page_order, pending_missing_links.items(), page_schemas,
+                                       page_root_schemas, incremental.file_digest(output_file)),
+        )
+    else:
+        # Результат собран без манифеста: манифест предыдущей инкрементальной сборки его не описывает
+        incremental.discard_manifest(incremental.manifest_path(output_file))
+
+
+def watched_files(conf: Dict[str, Any]) -> Dict[str, tuple]:
+    """Снимок (mtime, размер) файлов данных, паттернов и шаблона drawio для режима наблюдения."""
+    paths = d.expand_yaml_paths(conf['data_yaml_file'])
+    paths += [os.path.join(patterns_dir, name) for name in os.listdir(patterns_dir)
+              if name.endswith(('.yaml', '.yml'))]
+    paths.append(conf['drawio_pattern'])
+    snapshot = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def watch(conf: Dict[str, Any]) -> None:
+    """
+    Режим наблюдения: опрашивает файлы данных, паттернов и шаблона и пересобирает output_file при изменениях.
+    Кэши SeafDrawio (разобранные паттерны, схемы неизменённых файлов, индексы) сохраняются между сборками;
+    данные хранятся в LazyDataStore (lazy_load включается в main()), поэтому сбрасываются только схемы изменённых файлов.
+    """
+    try:
+        interval = max(float(conf.get('watch_interval', 1.0)), 0.1)
+    except (TypeError, ValueError):
+        interval = 1.0
+    snapshot = watched_files(conf)
+    print(f"\n> Наблюдение за изменениями ({len(snapshot)} файлов, опрос каждые {interval:g} с). "
+          f"Для выхода нажмите Ctrl+C.")
+    try:
+        while True:
+            time.sleep(interval)
+            current = watched_files(conf)
+            changed = sorted(path for path in set(snapshot) | set(current) if snapshot.get(path) != current.get(path))
+            if not changed:
+                continue
+            snapshot = current
+            started = time.perf_counter()
+            print(f"\n> Изменены файлы: {', '.join(changed)}")
+            for schemas in d.invalidate_files(changed).values():
+                print("> Сброшены схемы: " + (', '.join(sorted(str(schema) for schema in schemas)) or '-')
+                      if schemas is not None else "> Данные будут загружены заново")
+            reset_generation_state()
+            try:
+                generate(conf)
+            except (Exception, SystemExit) as e:
+                # Ошибка в редактируемом файле не должна останавливать наблюдение
+                print(f"\nERROR: пересборка не выполнена: {e!r}")
+                continue
+            print(f"\n> Пересборка {conf['output_file']} выполнена за {time.perf_counter() - started:.2f} с")
+    except KeyboardInterrupt:
+        print("\n> Наблюдение остановлено.")
+
+
+def load_pattern_bundle(conf: Dict[str, Any]) -> None:
+    """Подключает пакет паттернов (python compile_patterns.py), если он есть и собран текущей версией."""
+    path = conf.get('pattern_bundle')
+    loaded, stale = d.load_pattern_bundle(path)
+    if stale is None:
+        print(f"WARNING: пакет паттернов {path} собран другой версией генератора и не используется. "
+              f"Пересоберите его: python compile_patterns.py\n")
+    elif stale:
+        names = ', '.join(os.path.relpath(file) for file in stale)
+        print(f" INFO : пакет паттернов {path} устарел для {names}, эти паттерны читаются из YAML\n")
+    if loaded and conf.get('debug'):
+        print(f"> Паттерны из пакета {path}: файлов {loaded}")
+
+
+def main() -> None:
+    global conf, link_style_override, diagram
+
+    conf = cli_vars(d.load_config("config.yaml")['seaf2drawio'])
+    diagram = create_diagram(conf)
+    link_style_override = (conf.get('link_style') or '').lower()
+    d.parse_workers = conf.get('parse_workers', 1)
+    # В режиме наблюдения данные загружаются лениво всегда: изменение файла сбрасывает только его схемы
+    d.lazy_load = bool(conf.get('lazy_load') or conf.get('watch'))
+    d.configure_compact_records(conf.get('compact_records'), conf.get('schema_file'))
+    d.configure_parse_cache(conf)
+    load_pattern_bundle(conf)
+
+    if not conf.get('watch'):
+        generate(conf)
+        return
+
+    started = time.perf_counter()
+    generate(conf)
+    print(f"\n> Сборка {conf['output_file']} выполнена за {time.perf_counter() - started:.2f} с")
+    watch(conf)
+
+
+if __name__ == '__main__':
+
+    if sys.version_info < (3, 9):
+        print("Этот скрипт требует Python версии 3.9 или выше.")
+        sys.exit(1)
 
-    build_common_location_page(conf, diagram_pages.get('office', []) + diagram_pages.get('dc', []))
-    bring_logical_links_to_front(conf.get('output_file'))
+    main()